@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+str_description = """
+    End-to-end benchmark of `pfbridge` against a local stand-in `pflink`.
+
+    Both `pfbridge` and the fake `pflink` (see fakepflink.py) run in this
+    process and talk through `httpx.ASGITransport`s, so no network (and no
+    running `pflink`) is needed. The harness drives POST /api/v1/analyze/
+    at each requested concurrency level and reports throughput and
+    p50/p95/p99 latency.
+
+    Typical use, from the repository root:
+
+        python bench/bench.py --concurrency 1 8 32 --requests 2000
+
+        # expire tokens every 2s and fail 5% of pflink calls
+        python bench/bench.py --tokenLifetime 2 --errorRate 0.05
+
+        # measure the relay path itself, not the status cache or tracker
+        python bench/bench.py --noCache
+
+    `pfbridge` settings are read from the environment as usual, so any
+    setting (e.g. BATCHCONCURRENCY) can also be varied per run.
+"""
+
+import  argparse
+import  asyncio
+import  importlib
+import  json
+import  os
+import  sys
+import  time
+from    argparse            import Namespace
+
+import  httpx
+
+benchDir:str        = os.path.dirname(os.path.abspath(__file__))
+pfbridgeDir:str     = os.path.join(os.path.dirname(benchDir), 'pfbridge')
+
+def parser_setup() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description     = str_description,
+        formatter_class = argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--concurrency', type = int, nargs = '+', default = [1, 8, 32, 64],
+                        help = 'concurrency levels to run (default: 1 8 32 64)')
+    parser.add_argument('--requests', type = int, default = 1000,
+                        help = 'requests per concurrency level (default: 1000)')
+    parser.add_argument('--workflows', type = int, default = 100,
+                        help = 'number of distinct workflows polled (default: 100)')
+    parser.add_argument('--analyzeFunction', default = 'default',
+                        help = 'analyzeFunction of the payloads (default: default)')
+    parser.add_argument('--test', action = 'store_true',
+                        help = 'relay to the pflink testing endpoint')
+    parser.add_argument('--latency', type = float, default = 0.010,
+                        help = 'mean fake pflink latency in seconds (default: 0.010)')
+    parser.add_argument('--jitter', type = float, default = 0.005,
+                        help = 'uniform +/- jitter on the latency (default: 0.005)')
+    parser.add_argument('--tokenLifetime', type = float, default = 3600.0,
+                        help = 'seconds before fake pflink rejects a token with 403 (default: 3600)')
+    parser.add_argument('--errorRate', type = float, default = 0.0,
+                        help = 'fraction of pflink POSTs answered with a 503 (default: 0)')
+    parser.add_argument('--dropRate', type = float, default = 0.0,
+                        help = 'fraction of pflink POSTs failing at transport level (default: 0)')
+    parser.add_argument('--noCache', action = 'store_true',
+                        help = 'disable the pfbridge status cache and workflow tracker')
+    parser.add_argument('--log', action = 'store_true',
+                        help = 'keep pfbridge relay event logging on (default: off)')
+    parser.add_argument('--warmup', type = int, default = 20,
+                        help = 'untimed requests before the first level (default: 20)')
+    parser.add_argument('--json', default = '',
+                        help = 'also write the results as JSON to this file')
+    return parser
+
+def env_setup(options:Namespace) -> None:
+    """
+    pfbridge reads its settings from the environment at import time, so
+    this must run before pfbridge is imported.
+    """
+    if options.noCache:
+        os.environ['STATUSCACHETTL']    = '0'
+        os.environ['STATUSCACHETTLS']   = '{}'
+        os.environ['TRACKENABLED']      = 'false'
+    if not options.log:
+        os.environ['LOGSTAGES']         = json.dumps(
+            {'Incoming': 0, 'Transmitting': 0, 'Reply': 0, 'Return': 0})
+
+def percentile(l_sorted:list[float], p:float) -> float:
+    if not l_sorted:
+        return 0.0
+    index:int = min(len(l_sorted) - 1, max(0, int(round(p / 100.0 * len(l_sorted) + 0.5)) - 1))
+    return l_sorted[index]
+
+def payloads_make(options:Namespace) -> list[dict]:
+    return [
+        {
+            'imageMeta': {
+                'StudyInstanceUID':     '1.2.840.%d' % i,
+                'SeriesInstanceUID':    '1.2.840.%d.1' % i,
+                'AccessionNumber':      'ACC%06d' % i
+            },
+            'analyzeFunction':  options.analyzeFunction
+        }
+        for i in range(max(1, options.workflows))
+    ]
+
+async def level_run(
+        client:httpx.AsyncClient,
+        concurrency:int,
+        requests:int,
+        l_payloads:list[dict],
+        test:bool
+) -> dict:
+    """
+    Issue <requests> POSTs to /api/v1/analyze/ from <concurrency> workers.
+    """
+    l_latency:list[float]   = []
+    d_outcome:dict[str, int] = {'ok': 0, 'httpErrors': 0, 'commsFailures': 0, 'modelViolations': 0}
+    counter                 = iter(range(requests))
+    params:dict             = {'test': 'true'} if test else {}
+
+    async def worker() -> None:
+        for i in counter:
+            start:float     = time.perf_counter()
+            response        = await client.post('/api/v1/analyze/',
+                                                json    = l_payloads[i % len(l_payloads)],
+                                                params  = params)
+            l_latency.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                d_outcome['httpErrors'] += 1
+                continue
+            d_reply:dict    = response.json()
+            if d_reply.get('ErrorComms', {}).get('error'):
+                d_outcome['commsFailures'] += 1
+            elif d_reply.get('ModelViolation') is not None:
+                d_outcome['modelViolations'] += 1
+            else:
+                d_outcome['ok'] += 1
+
+    start:float = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed:float = time.perf_counter() - start
+    l_latency.sort()
+    return {
+        'concurrency':  concurrency,
+        'requests':     requests,
+        'seconds':      elapsed,
+        'throughput':   requests / elapsed if elapsed else 0.0,
+        'p50_ms':       1000 * percentile(l_latency, 50),
+        'p95_ms':       1000 * percentile(l_latency, 95),
+        'p99_ms':       1000 * percentile(l_latency, 99),
+        **d_outcome
+    }
+
+async def bench_run(options:Namespace) -> list[dict]:
+    sys.path.insert(0, pfbridgeDir)
+    sys.path.insert(0, benchDir)
+    fakepflink                  = importlib.import_module('fakepflink')
+    fake                        = fakepflink.fakePflink_create(fakepflink.FakeConfig(
+        latency         = options.latency,
+        jitter          = options.jitter,
+        tokenLifetime   = options.tokenLifetime,
+        errorRate       = options.errorRate,
+        dropRate        = options.dropRate
+    ))
+    pfbridge                    = importlib.import_module('main')
+    pflinkclient                = importlib.import_module('lib.pflinkclient')
+    settings                    = importlib.import_module('config.settings')
+    # Route all pflink traffic to the in-process fake
+    pflinkclient.pool_open(
+        maxConnections  = settings.httpPool.poolMaxConnections,
+        maxKeepalive    = settings.httpPool.poolMaxKeepalive,
+        keepaliveExpiry = settings.httpPool.poolKeepaliveExpiry,
+        transport       = httpx.ASGITransport(app = fake)
+    )
+    l_results:list[dict]        = []
+    l_payloads:list[dict]       = payloads_make(options)
+    async with pfbridge.app.router.lifespan_context(pfbridge.app):
+        async with httpx.AsyncClient(
+                transport   = httpx.ASGITransport(app = pfbridge.app),
+                base_url    = 'http://pfbridge',
+                timeout     = None
+        ) as client:
+            if options.warmup:
+                await level_run(client, 1, options.warmup, l_payloads, options.test)
+            for concurrency in options.concurrency:
+                l_results.append(await level_run(client, concurrency, options.requests,
+                                                 l_payloads, options.test))
+                l_results[-1]['pflinkPosts'] = fake.state.stats.workflowPosts
+                l_results[-1]['tokenRequests'] = fake.state.stats.tokenRequests
+    return l_results
+
+def results_print(l_results:list[dict]) -> None:
+    str_header:str = '%6s %8s %10s %9s %9s %9s %6s %6s %6s %8s %6s' % (
+        'conc', 'reqs', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+        'httpE', 'comms', 'model', 'pflink', 'token')
+    print(str_header)
+    print('-' * len(str_header))
+    for r in l_results:
+        print('%6d %8d %10.1f %9.2f %9.2f %9.2f %6d %6d %6d %8d %6d' % (
+            r['concurrency'], r['requests'], r['throughput'],
+            r['p50_ms'], r['p95_ms'], r['p99_ms'],
+            r['httpErrors'], r['commsFailures'], r['modelViolations'],
+            r['pflinkPosts'], r['tokenRequests']))
+
+def main(argv:list[str] | None = None) -> int:
+    options:Namespace       = parser_setup().parse_args(argv)
+    env_setup(options)
+    l_results:list[dict]    = asyncio.run(bench_run(options))
+    results_print(l_results)
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump({'options': vars(options), 'results': l_results}, f, indent = 4)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+str_description = """
+    A local stand-in for `pflink`, used by the benchmark harness.
+
+    This serves the `pflink` workflow, testing and auth-token endpoints
+    with configurable latency, auth-token expiry and error injection. It
+    is an ordinary ASGI app and is normally driven in-process through an
+    `httpx.ASGITransport`, so no network is involved.
+
+    Each workflow (keyed on its StudyInstanceUID/SeriesInstanceUID) steps
+    through the `pflink` workflow states, one state per POST, ending in
+    "completed".
+"""
+
+import  asyncio
+import  base64
+import  json
+import  random
+import  time
+from    dataclasses         import dataclass, field
+from    urllib              import parse
+
+from    fastapi             import FastAPI, Request
+from    fastapi.responses   import JSONResponse
+
+workflowStates:list[str] = [
+    "initializing workflow",
+    "retrieving from PACS",
+    "pushing to swift",
+    "registering to CUBE",
+    "feed created",
+    "analyzing study",
+    "completed"
+]
+
+@dataclass
+class FakeConfig:
+    latency:float           = 0.010     # mean seconds per workflow POST
+    jitter:float            = 0.005     # +/- uniform jitter on the latency
+    tokenLifetime:float     = 3600.0    # seconds before an issued token is rejected
+    errorRate:float         = 0.0       # fraction of POSTs answered with a 503
+    dropRate:float          = 0.0       # fraction of POSTs that fail at transport level
+    username:str            = 'pflink'
+    password:str            = 'pflink1234'
+    l_downHosts:list[str]   = field(default_factory = list)  # hosts that fail health checks and POSTs
+    d_hostDelay:dict[str, float] = field(default_factory = dict)  # extra seconds per workflow POST, by host
+
+@dataclass
+class FakeStats:
+    workflowPosts:int       = 0
+    tokenRequests:int       = 0
+    rejected:int            = 0
+    errors:int              = 0
+    drops:int               = 0
+    d_polls:dict[str, int]  = field(default_factory = dict)
+    d_hosts:dict[str, int]  = field(default_factory = dict)  # workflow POSTs per Host
+
+class InjectedDrop(Exception):
+    """Raised to simulate a connection level failure"""
+
+def token_make(lifetime:float) -> str:
+    payload:str = base64.urlsafe_b64encode(
+        json.dumps({'sub': 'pflink', 'exp': time.time() + lifetime}).encode()
+    ).decode().rstrip('=')
+    return 'fake.%s.%d' % (payload, random.getrandbits(32))
+
+def token_check(token:str) -> bool:
+    try:
+        payload:str = token.split('.')[1]
+        payload    += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))['exp'] > time.time()
+    except Exception:
+        return False
+
+def fakePflink_create(config:FakeConfig | None = None) -> FastAPI:
+    """
+    Create a fake pflink app. Its config and stats are available as
+    `app.state.config` and `app.state.stats`.
+    """
+    app:FastAPI             = FastAPI(title = 'fake pflink')
+    app.state.config        = config if config else FakeConfig()
+    app.state.stats         = FakeStats()
+
+    @app.post('/api/v1/auth-token')
+    async def authToken(request: Request):
+        cfg:FakeConfig      = app.state.config
+        app.state.stats.tokenRequests += 1
+        d_form:dict         = parse.parse_qs((await request.body()).decode())
+        if d_form.get('username') != [cfg.username] or d_form.get('password') != [cfg.password]:
+            return JSONResponse({'detail': 'Incorrect username or password'}, status_code = 401)
+        return {'access_token': token_make(cfg.tokenLifetime), 'token_type': 'bearer'}
+
+    async def workflow(request: Request):
+        cfg:FakeConfig      = app.state.config
+        stats:FakeStats     = app.state.stats
+        stats.workflowPosts += 1
+        host:str            = request.headers.get('host', '')
+        stats.d_hosts[host] = stats.d_hosts.get(host, 0) + 1
+        if host in cfg.l_downHosts:
+            stats.drops += 1
+            raise InjectedDrop('injected transport failure')
+        if not token_check(request.headers.get('authorization', '')[len('Bearer '):]):
+            stats.rejected += 1
+            return JSONResponse({'detail': 'Not authenticated'}, status_code = 403)
+        await asyncio.sleep(max(0.0, cfg.latency + random.uniform(-cfg.jitter, cfg.jitter))
+                            + cfg.d_hostDelay.get(host, 0.0))
+        if random.random() < cfg.dropRate:
+            stats.drops += 1
+            raise InjectedDrop('injected transport failure')
+        if random.random() < cfg.errorRate:
+            stats.errors += 1
+            return JSONResponse({'detail': 'injected error'}, status_code = 503)
+        d_body:dict         = json.loads(await request.body())
+        d_pacs:dict         = d_body.get('PACS_directive', {})
+        key:str             = '%s/%s' % (d_pacs.get('StudyInstanceUID'), d_pacs.get('SeriesInstanceUID'))
+        poll:int            = stats.d_polls.get(key, 0)
+        stats.d_polls[key]  = poll + 1
+        state:str           = workflowStates[min(poll, len(workflowStates) - 1)]
+        return {
+            'status':                   True,
+            'workflow_state':           state,
+            'state_progress':           '100%',
+            'feed_id':                  '',
+            'feed_name':                d_body.get('workflow_info', {}).get('feed_name', ''),
+            'message':                  '',
+            'duplicates':               None,
+            'error':                    '',
+            'workflow_progress_perc':   int(100 * workflowStates.index(state) / (len(workflowStates) - 1))
+        }
+
+    @app.get('/api/v1/hello/')
+    async def hello(request: Request):
+        if request.headers.get('host', '') in app.state.config.l_downHosts:
+            return JSONResponse({'detail': 'down'}, status_code = 503)
+        return {'name': 'fakepflink'}
+
+    app.add_api_route('/api/v1/workflow', workflow, methods = ['POST'])
+    app.add_api_route('/api/v1/testing',  workflow, methods = ['POST'])
+    return app
@@ -4,13 +4,9 @@ from pydantic   import BaseModel, Field
 from typing     import Optional, List, Tuple
 
 # /hello dependencies
-# these modules provide some information on the host
-# system/environment
-import platform
-import psutil
-import multiprocessing
-import os
-import socket
+# the host system/environment is described (once) and
+# sampled (in the background) by lib/sysinfo
+from lib        import sysinfo
 
 class ValueStr(BaseModel):
     value:              str         = ""
@@ -58,6 +54,11 @@ def helloRouter_create(
 
     about_model = AboutModel()
 
+    # Example values for the docs. These skip the address, as resolving
+    # it here would block the import of the app on DNS: the sampler
+    # looks it up off the event loop when it starts.
+    d_static    = sysinfo.static_compute(resolve = False)
+
     class SysInfoModel(BaseModel):
         """
         For the most part, copied from
@@ -67,20 +68,20 @@ def helloRouter_create(
         is currently running.
         """
         system:         str         =                                       \
-        Field(  platform.system(),
+        Field(  d_static['system'],
                 title       = 'Operating system')
 
         machine:        str         =                                       \
-        Field(  platform.machine(),
+        Field(  d_static['machine'],
                 title       = 'Computer architecture')
 
         uname:          List[str]   =                                       \
-        Field(  list(platform.uname()),
+        Field(  d_static['uname'],
                 title       = 'uname output',
                 description = 'Uname output, converted from object to list')
 
         platform:       str =                                               \
-        Field(  platform.platform(),
+        Field(  d_static['platform'],
                 title       = 'Kernel name')
 
         # NB: Not working?
@@ -95,7 +96,7 @@ def helloRouter_create(
                 description = "Actually a NamedTuple but I'm not typing it out")
 
         cpucount:       int =                                               \
-        Field(  multiprocessing.cpu_count(),
+        Field(  d_static['cpucount'],
                 title       = 'Number of CPU cores')
 
         # NB: Not working?
@@ -109,13 +110,21 @@ def helloRouter_create(
                 title       = 'Current CPU usage percent', le=100.0)
 
         hostname:       str =                                               \
-        Field(  socket.gethostname(),
+        Field(  d_static['hostname'],
                 title       = 'Hostname')
 
         inet:           str =                                               \
-        Field(  socket.gethostbyname(socket.gethostname()),
+        Field(  d_static['inet'],
                 title       = 'Local IP address')
 
+        cpu_percent_1m: float =                                             \
+        Field(  0.0,
+                title       = 'Mean CPU usage percent over the last minute')
+
+        cpu_percent_5m: float =                                             \
+        Field(  0.0,
+                title       = 'Mean CPU usage percent over the last 5 minutes')
+
 
     # TypedDict not supported yet in Python 3.8
     # https://pydantic-docs.helpmanual.io/usage/types/#typeddict
@@ -146,6 +155,16 @@ def helloRouter_create(
     # ========== ========== ========== ==========
     router = APIRouter()
 
+    # The response is rebuilt only when a new sample is published
+    d_hello:dict = {'sample': None, 'model': None}
+
+    def hello_current() -> HelloModel:
+        d_current:dict = sysinfo.sampler.current()
+        if d_current is not d_hello['sample']:
+            d_hello['model']    = HelloModel(sysinfo = SysInfoModel(**d_current))
+            d_hello['sample']   = d_current
+        return d_hello['model']
+
     @router.get(
         '/about/',
         tags            = tags,
@@ -168,33 +187,15 @@ def helloRouter_create(
             description = 'something to print back verbatim')
     ):
         """
-        Produce some information like the OG pfcon
+        Produce some information like the OG pfcon. The dynamic values
+        (memory, load, CPU and its 1m/5m trends) are those of the latest
+        background sample, so this never waits on the host.
         """
-        d_ret = {
-            'sysinfo': {}
-        }
-        d_ret['sysinfo']['system']      = platform.system()
-        d_ret['sysinfo']['machine']     = platform.machine()
-        d_ret['sysinfo']['uname']       = platform.uname()
-        d_ret['sysinfo']['platform']    = platform.platform()
-        d_ret['sysinfo']['version']     = platform.version()
-        d_ret['sysinfo']['memory']      = psutil.virtual_memory()
-        d_ret['sysinfo']['cpucount']    = multiprocessing.cpu_count()
-        d_ret['sysinfo']['loadavg']     = os.getloadavg()
-        d_ret['sysinfo']['cpu_percent'] = psutil.cpu_percent()
-        d_ret['sysinfo']['hostname']    = socket.gethostname()
-        d_ret['sysinfo']['inet']        = socket.gethostbyname(socket.gethostname())
-        sysinfo = SysInfoModel(**d_ret['sysinfo'])
+        hello = hello_current()
 
         if echoBack:
-            echo = EchoModel(msg = echoBack)
-            return HelloModel(
-                echoBack    = echo,
-                sysinfo     = sysinfo
-            )
-
-        return HelloModel(
-            sysinfo     = sysinfo
-        )
+            return hello.copy(update = {'echoBack': EchoModel(msg = echoBack)})
+
+        return hello
 
     return router
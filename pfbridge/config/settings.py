@@ -1,18 +1,34 @@
+import  hashlib
+import  hmac
 import  os
+import  threading
+import  uuid
 from typing import Any
-from    pydantic    import AnyHttpUrl, BaseSettings, AnyUrl
+from    pydantic    import AnyHttpUrl, BaseSettings, AnyUrl, BaseModel
 from    models      import relayModel
 from    pftag       import pftag
+from    lib         import configstore
 
 class Pflink(BaseSettings):
     prodURL:str             = 'http://localhost:8050/api/v1/workflow'
     testURL:str             = 'http://localhost:8050/api/v1/testing'
     ignore_duplicate:bool   = True
+    # A pool of production workflow URLs (see Routing). If empty, only
+    # prodURL is used.
+    prodURLs:list[str]      = []
+
+    class Config:
+        # Runtime changes go through config_set()/analysis_set() which
+        # replace (never mutate) settings objects. See Snapshot below.
+        allow_mutation      = False
 
 
 class Analyses(BaseSettings):
     analyses: dict = {}
 
+    class Config:
+        allow_mutation      = False
+
 class DylldAnalysis(Pflink):
     pipelineName:str        = ''
     pluginName:str          = ''
@@ -24,7 +40,219 @@ class PflinkAuth(Pflink):
     pflink_auth_url:str = "http://localhost:8050/api/v1/auth-token"
     pflink_username:str = "pflink"
     pflink_password:str = "pflink1234"
-    token:str           = "invalid"  # will be generated while making POST request to pflink
+    token:str           = "invalid"  # seed value; managed at runtime by relayController.pflinkToken
+    tokenRenewMargin:float  = 60.0   # renew this many seconds before the token expires
+    tokenRetryDelay:float   = 5.0    # wait before retrying a failed background renewal
+
+class HttpPool(BaseSettings):
+    poolMaxConnections:int      = 100
+    poolMaxKeepalive:int        = 20
+    poolKeepaliveExpiry:float   = 30.0
+    poolHTTP2:bool              = False
+
+class Circuit(BaseSettings):
+    # Per pflink URL circuit breaking: after circuitFailureThreshold
+    # consecutive failures calls fail at once for circuitOpenSeconds,
+    # then circuitHalfOpenProbes trial calls decide whether to close.
+    # Request timeouts track timeoutFactor times the timeoutPercentile
+    # of the last timeoutWindow latencies, within [timeoutMin, timeoutMax].
+    circuitFailureThreshold:int = 5
+    circuitOpenSeconds:float    = 10.0
+    circuitHalfOpenProbes:int   = 1
+    timeoutWindow:int           = 256
+    timeoutPercentile:float     = 99.0
+    timeoutFactor:float         = 3.0
+    timeoutMin:float            = 1.0
+    timeoutMax:float            = 10.0
+    timeoutMinSamples:int       = 20
+
+class Pacing(BaseSettings):
+    # AIMD pacing per pflink URL (see pflinkclient.Pacer): from paceRate
+    # requests per second, +paceIncrease/s while answers come within
+    # paceLatencyTarget, *paceDecrease (once per paceCooldown) otherwise.
+    paceEnabled:bool            = False
+    paceRate:float              = 50.0
+    paceMinRate:float           = 1.0
+    paceMaxRate:float           = 1000.0
+    paceIncrease:float          = 1.0
+    paceDecrease:float          = 0.5
+    paceLatencyTarget:float     = 2.0
+    paceCooldown:float          = 1.0
+
+class Admission(BaseSettings):
+    # At most admit*Concurrency relays per target (prod/test) are in
+    # flight to pflink; up to admit*Queue more wait in line for at most
+    # admit*QueueTimeout seconds. Relays beyond that are refused with
+    # 429 (queue full) or 503 (waited too long) and a Retry-After.
+    admitProdConcurrency:int    = 64
+    admitProdQueue:int          = 256
+    admitProdQueueTimeout:float = 5.0
+    admitTestConcurrency:int    = 8
+    admitTestQueue:int          = 32
+    admitTestQueueTimeout:float = 2.0
+
+class StatusCache(BaseSettings):
+    # Status replies are cached per relay for a time that depends on the
+    # pflink workflow_state. States not listed use statusCacheTTL. A TTL
+    # of 0 disables caching for that state; comms failures and model
+    # violations are never cached.
+    statusCacheSize:int         = 4096
+    statusCacheTTL:float        = 2.0
+    statusCacheTTLs:dict[str, float] = {
+        "retrieving from PACS":     2.0,
+        "analyzing study":          5.0,
+        "completed":                300.0,
+        "feed deleted from CUBE":   300.0
+    }
+
+class Batch(BaseSettings):
+    batchMaxItems:int           = 1000  # largest accepted batch
+    batchConcurrency:int        = 16    # relays in flight per batch
+
+class Tracker(BaseSettings):
+    # Relayed workflows are tracked and re-polled in the background, and
+    # /analyze/ calls for them are answered from the tracker. A workflow
+    # is polled every trackIntervals[workflow_state] (else trackInterval)
+    # seconds while it progresses; each poll that finds it unchanged
+    # stretches the interval by trackBackoff, up to trackMaxInterval.
+    # Polling stops once it is done (completed, deleted or failed); it
+    # is then kept for trackRetain seconds. Workflows nobody asked about
+    # (or watches) for trackIdle seconds are dropped.
+    trackEnabled:bool           = True
+    trackIntervals:dict[str, float] = {
+        "initializing workflow":    2.0,
+        "retrieving from PACS":     2.0,
+        "pushing to swift":         3.0,
+        "registering to CUBE":      3.0,
+        "feed created":             5.0,
+        "analyzing study":          20.0
+    }
+    trackInterval:float         = 5.0
+    trackMaxInterval:float      = 60.0
+    trackBackoff:float          = 1.5
+    trackRetain:float           = 300.0
+    trackIdle:float             = 600.0
+    trackMaxWorkflows:int       = 10000
+    trackConcurrency:int        = 32
+
+class Watch(BaseSettings):
+    # Progress streams follow the tracker (see Tracker). Idle streams
+    # get a keep-alive every watchHeartbeat seconds.
+    watchHeartbeat:float        = 15.0
+    watchMaxStreams:int         = 1000
+
+class EventLogging(BaseSettings):
+    # Per-stage verbosity of relay event logging: 0 off, 1 summary, 2 full.
+    # Only one in logSampleEvery relays is logged at full detail; the
+    # others are capped at summary level.
+    logStages:dict[str, int]    = {
+        "Incoming":     2,
+        "Transmitting": 2,
+        "Reply":        2,
+        "Return":       2
+    }
+    logSampleEvery:int          = 1
+    logQueueSize:int            = 10000
+
+class MapSpecs(BaseSettings):
+    # Per-analysis response maps (see lib/map.py:defaultSpec), keyed by
+    # analysis name, read from the JSON mapSpecFile and/or mapSpecs.
+    # Analyses without a spec use the default map.
+    mapSpecFile:str             = ''
+    mapSpecs:dict[str, dict]    = {}
+
+class SharedConfig(BaseSettings):
+    # If set, runtime configuration changes (PUTs) are kept in this SQLite
+    # file and shared by all worker processes, which pick up each other's
+    # changes within configPollInterval seconds. Credentials are not
+    # stored, and are then set in the environment only.
+    #
+    # configStoreBoot identifies one start of the server; the store is
+    # reseeded from the startup settings whenever it changes. It is set
+    # by the gunicorn on_starting hook (see gunicorn_conf.py) so that all
+    # workers of one start share it. If unset, every process reseeds.
+    configStorePath:str         = ''
+    configPollInterval:float    = 0.05
+    configStoreBoot:str         = ''
+
+class Ledger(BaseSettings):
+    # If set, every relay and its latest mapped state is recorded in this
+    # SQLite file (see lib/ledger.py). Workflows not seen for
+    # ledgerMaxAgeDays are purged.
+    ledgerPath:str              = ''
+    ledgerQueueSize:int         = 10000
+    ledgerMaxAgeDays:float      = 90.0
+
+class Routing(BaseSettings):
+    # Production relays are spread over the pflink prodURLs pool by a
+    # consistent hash of StudyInstanceUID and SeriesInstanceUID, so that
+    # every poll of a workflow goes to the same pflink. Each node is
+    # probed at its healthPath (relative to its URL) every healthInterval
+    # seconds; a node failing healthFall probes in a row is skipped until
+    # it passes healthRise in a row.
+    routingReplicas:int         = 160
+    healthPath:str              = 'hello/'
+    healthInterval:float        = 5.0
+    healthTimeout:float         = 2.0
+    healthFall:int              = 2
+    healthRise:int              = 2
+
+class Hedge(BaseSettings):
+    # With a pflink pool, a relay for a workflow already known to pflink
+    # (seen within hedgeSeenTTL seconds) that has not been answered after
+    # the hedgePercentile of the recent latency of its node (but at least
+    # hedgeMinDelay seconds) is also sent to the next node on the ring.
+    # The first answer wins. Hedges are limited to hedgeBudget of the
+    # relays that could be hedged.
+    hedgeEnabled:bool           = False
+    hedgePercentile:float       = 95.0
+    hedgeMinDelay:float         = 0.02
+    hedgeMinSamples:int         = 20
+    hedgeBudget:float           = 0.1
+    hedgeSeenSize:int           = 10000
+    hedgeSeenTTL:float          = 3600.0
+
+class RequestDeadline(BaseSettings):
+    # Clients may send their own timeout (in seconds) in deadlineHeader.
+    # Work on the relay stops, and the client is answered with a 504,
+    # deadlineMargin seconds before it runs out. deadlineDefault applies
+    # to requests without the header (0 for no deadline).
+    deadlineHeader:str          = 'X-Request-Timeout'
+    deadlineMargin:float        = 0.05
+    deadlineDefault:float       = 0.0
+
+class RateLimit(BaseSettings):
+    # Token buckets per client (host, plus any of the rateLimitKeys) and
+    # analyzeFunction; rateLimitQuotas overrides the rate and burst per
+    # analysis, e.g. {"dylld": {"rate": 2, "burst": 5}}. Shared by all
+    # workers through the rateLimitPath SQLite file, if set.
+    rateLimitEnabled:bool       = False
+    rateLimitRate:float         = 10.0
+    rateLimitBurst:float        = 20.0
+    rateLimitQuotas:dict[str, dict[str, float]] = {}
+    rateLimitKeyHeader:str      = 'X-API-Key'
+    rateLimitKeys:list[str]     = []
+    rateLimitPath:str           = ''
+    rateLimitSyncInterval:float = 0.1
+    rateLimitMaxClients:int     = 10000
+
+class Outbox(BaseSettings):
+    # If set, relays that cannot reach pflink are queued in this SQLite
+    # file and replayed in the background (see lib/outbox.py), backing
+    # off up to outboxMaxDelay, for outboxMaxAttempts (0: no limit) or
+    # outboxMaxAge seconds.
+    outboxPath:str              = ''
+    outboxBaseDelay:float       = 1.0
+    outboxMaxDelay:float        = 30.0
+    outboxMaxAttempts:int       = 0
+    outboxMaxAge:float          = 86400.0
+    outboxConcurrency:int       = 8
+    outboxPollInterval:float    = 5.0
+
+class Hello(BaseSettings):
+    # /hello/ reports the host state sampled every helloSampleInterval
+    # seconds in the background (see lib/sysinfo.py).
+    helloSampleInterval:float   = 5.0
 
 class Pfdcm(BaseSettings):
     name:str            = "PFDCMLOCAL"
@@ -35,6 +263,9 @@ class ServiceURLs(BaseSettings):
     urlCUBE:str             = "http://localhost:8000/api/v1/"
     urlOrthanc:str          = "http://localhost:8888"
 
+    class Config:
+        allow_mutation      = False
+
 class Vault(BaseSettings):
     locked:bool             = False
     vaultKey:str            = ''
@@ -43,31 +274,312 @@ class CredentialsCUBE(BaseSettings):
     usernameCUBE:str        = 'chris'
     passwordCUBE:str        = 'chris1234'
 
+    class Config:
+        allow_mutation      = False
+
 class CredentialsOrthanc(BaseSettings):
     usernameOrthanc:str     = ''
     passwordOrthanc:str     = ''
 
+    class Config:
+        allow_mutation      = False
+
 def vaultCheckLock(vault:Vault) -> None:
     if vault.vaultKey and not vault.locked:
         vault.locked        = True
         print("Vault check: key has already been set. Vault is now LOCKED.")
 
-def analysis_decode(key:str) -> DylldAnalysis:
+class Snapshot(BaseModel):
+    """
+    An immutable, versioned view of all runtime-settable configuration.
+
+    Each change (a PUT to some URL, new credentials, an analysis update)
+    builds a new Snapshot from copies of the old one and swaps it in as
+    a single reference assignment. Readers take the current snapshot
+    once with snapshot_get() and use it for the whole request, so they
+    never need a lock and never see a half-applied update.
+
+    The `decodeVersion` only changes when an input to analysis_decode()
+    changes.
+    """
+    version:int                             = 0
+    decodeVersion:int                       = 0
+    pflink:Pflink
+    pflinkAuth:PflinkAuth
+    credentialsCUBE:CredentialsCUBE
+    credentialsOrthanc:CredentialsOrthanc
+    serviceURLs:ServiceURLs
+    analyses:dict[str, DylldAnalysis]
+
+    class Config:
+        allow_mutation      = False
+
+# Sections of the Snapshot that feed analysis_decode()
+decodeSections:list[str]    = ['credentialsCUBE', 'credentialsOrthanc', 'serviceURLs', 'analyses']
+
+# Writers are serialized; readers never lock.
+snapshotLock:threading.Lock = threading.Lock()
+
+def snapshot_get() -> Snapshot:
+    """
+    Return the current configuration snapshot. Callers should take this
+    once per request and read all settings from it.
+    """
+    return snapshot
+
+def snapshot_swap(**changes) -> Snapshot:
+    """
+    Build a new snapshot with <changes> applied and atomically publish it,
+    also rebinding the module level aliases (pflink, serviceURLs, ...).
+
+    This must be called with the snapshotLock held.
+    """
+    global snapshot, pflink, pflinkAuth, credentialsCUBE, credentialsOrthanc, serviceURLs, analyses
+    d_version:dict = {'version': snapshot.version + 1}
+    if any(section in decodeSections for section in changes):
+        d_version['decodeVersion']  = snapshot.decodeVersion + 1
+    new:Snapshot        = snapshot.copy(update = {**changes, **d_version})
+    snapshot            = new
+    pflink              = new.pflink
+    pflinkAuth          = new.pflinkAuth
+    credentialsCUBE     = new.credentialsCUBE
+    credentialsOrthanc  = new.credentialsOrthanc
+    serviceURLs         = new.serviceURLs
+    analyses            = Analyses(analyses = new.analyses)
+    return new
+
+def config_set(section:str, **fields) -> Snapshot:
+    """
+    Copy-on-write update of one section of the configuration, for example
+
+        config_set('pflink', testURL = URL)
+
+    Args:
+        section (str): the Snapshot field to update
+        **fields: the new values
+
+    Returns:
+        Snapshot: the newly published snapshot
+
+    Raises:
+        ValueError: the fields are secrets of a configuration shared by workers
+    """
+    if not config_settable(section, *fields):
+        raise ValueError(f"{section} {sorted(fields)} can only be set in the environment "
+                          "while the configuration is shared by workers")
+    if store is None:
+        with snapshotLock:
+            return snapshot_swap(**{section: getattr(snapshot, section).copy(update = fields)})
+    exclude:set[str] = localFields.get(section, set())
+    store.update(section,
+                 lambda current: {**(current or getattr(snapshot, section).dict(exclude = exclude)), **fields})
+    return config_reload()
+
+def analysis_set(name:str, **fields) -> Snapshot:
+    """
+    Copy-on-write update (or creation) of the analysis called <name>.
+
+    Args:
+        name (str): the analysis name
+        **fields: the new DylldAnalysis values
+
+    Returns:
+        Snapshot: the newly published snapshot
+    """
+    if store is not None:
+        store.update('analysis:' + name,
+                     lambda current: {**(current or DylldAnalysis().dict()), **fields})
+        return config_reload()
+    with snapshotLock:
+        d_analyses:dict     = dict(snapshot.analyses)
+        d_analyses[name]    = d_analyses.get(name, DylldAnalysis()).copy(update = fields)
+        return snapshot_swap(analyses = d_analyses)
+
+# The configuration shared with other workers, if any (see SharedConfig).
+# Sections are stored as documents named after the Snapshot fields, with
+# one "analysis:<name>" document per analysis, and a "vault" document.
+# Secrets are never stored: the CUBE and Orthanc credentials and the
+# localFields of a section come from the environment every worker shares,
+# and cannot be changed at runtime (see config_settable). The vault
+# document only holds a salted hash of the vault key.
+store:configstore.ConfigStore | None   = None
+storeVersion:int                        = 0
+storedSections:dict[str, type]          = {
+    'pflink':               Pflink,
+    'pflinkAuth':           PflinkAuth,
+    'serviceURLs':          ServiceURLs
+}
+localFields:dict[str, set[str]]         = {
+    'pflinkAuth':           {'pflink_password', 'token'}
+}
+vaultDigest:dict[str, str]              = {}
+
+def config_settable(section:str, *fields:str) -> bool:
+    """
+    Whether <fields> of <section> can be changed at runtime: always,
+    unless the configuration is shared by workers and they are secrets.
+    """
+    return store is None or (
+        section in storedSections and not set(fields) & localFields.get(section, set())
+    )
+
+def vaultKey_hash(key:str, salt:str = '') -> dict[str, str]:
+    salt = salt or os.urandom(16).hex()
+    digest:bytes = hashlib.pbkdf2_hmac('sha256', key.encode(), bytes.fromhex(salt), 100000)
+    return {'salt': salt, 'digest': digest.hex()}
+
+def vaultKey_matches(key:str, d_digest:dict[str, str]) -> bool:
+    return bool(d_digest) and hmac.compare_digest(
+        vaultKey_hash(key, d_digest['salt'])['digest'], d_digest['digest'])
+
+def vault_check(key:str) -> bool:
+    """
+    Whether <key> opens the (locked) vault. With a shared store the key
+    may have been set on another worker, in which case it is checked
+    against the stored hash and then remembered.
+    """
+    if not vault.locked:
+        return False
+    if vault.vaultKey:
+        return hmac.compare_digest(key.encode(), vault.vaultKey.encode())
+    if vaultKey_matches(key, vaultDigest):
+        vault.vaultKey = key
+        return True
+    return False
+
+def vault_dump() -> dict:
+    if not vault.locked:
+        return {'locked': False}
+    return {'locked': True, **vaultKey_hash(vault.vaultKey)}
+
+def vault_load(d_vault:dict) -> None:
+    global vaultDigest
+    d_digest:dict[str, str] = {k: d_vault[k] for k in ('salt', 'digest') if k in d_vault}
+    if d_digest != vaultDigest and vault.vaultKey and not vaultKey_matches(vault.vaultKey, d_digest):
+        vault.vaultKey  = ''
+    vaultDigest         = d_digest
+    vault.locked        = bool(d_vault.get('locked'))
+
+def sections_dump(snap:Snapshot) -> dict[str, dict]:
+    d_documents:dict[str, dict] = {
+        section: getattr(snap, section).dict(exclude = localFields.get(section, set()))
+        for section in storedSections
+    }
+    d_documents.update({'analysis:' + name: value.dict() for name, value in snap.analyses.items()})
+    d_documents['vault'] = vault_dump()
+    return d_documents
+
+def config_reload() -> Snapshot:
+    """
+    Publish a new snapshot if the shared store holds a newer version of
+    the configuration than this process has seen.
+
+    Returns:
+        Snapshot: the current snapshot
+    """
+    global storeVersion
+    if store is None:
+        return snapshot
+    version, d_documents = store.load()
+    with snapshotLock:
+        if version <= storeVersion:
+            return snapshot
+        changes:dict = {}
+        for section, model in storedSections.items():
+            if section in d_documents:
+                current = getattr(snapshot, section)
+                d_local:dict = current.dict(include = localFields.get(section, set()))
+                value = model(**{**d_documents[section], **d_local})
+                if value != current:
+                    changes[section] = value
+        d_analyses:dict[str, DylldAnalysis] = {
+            key[len('analysis:'):]: DylldAnalysis(**value)
+            for key, value in d_documents.items() if key.startswith('analysis:')
+        }
+        if d_analyses != snapshot.analyses:
+            changes['analyses'] = d_analyses
+        if 'vault' in d_documents:
+            vault_load(d_documents['vault'])
+        storeVersion = version
+        if changes:
+            snapshot_swap(**changes)
+        return snapshot
+
+def vault_lock(key:str) -> bool:
+    """
+    Set the vault key and lock the vault, unless it is already locked
+    (by this or, with a shared store, any other worker).
+
+    Returns:
+        bool: True if this call locked the vault
+    """
+    if store is None:
+        if vault.locked:
+            return False
+        vault.vaultKey  = key
+        vault.locked    = True
+        return True
+    l_locked:list[bool] = []
+
+    def lock(current:dict | None) -> dict | None:
+        if current and current.get('locked'):
+            return None
+        l_locked.append(True)
+        return {'locked': True, **vaultKey_hash(key)}
+
+    store.update('vault', lock)
+    config_reload()
+    if l_locked:
+        vault.vaultKey  = key
+    return bool(l_locked)
+
+def configStore_open(path:str, boot:str = '') -> configstore.ConfigStore:
+    """
+    Share the configuration through the store at <path>. The first
+    worker of a server start (<boot>) seeds the store from its own
+    startup configuration; all workers then load the configuration
+    from it. Without a <boot>, this process reseeds the store.
+    """
+    global store
+    store = configstore.ConfigStore(path)
+    vaultCheckLock(vault)
+    store.seed(sections_dump(snapshot), boot or uuid.uuid4().hex)
+    config_reload()
+    return store
+
+# Decoded analyses are cached per analysis name and tagged with the
+# decodeVersion of the snapshot they were decoded from.
+analysisDecoder:tuple[int, pftag.Pftag] | None          = None
+analysisCache:dict[str, tuple[int, DylldAnalysis, list[str]]] = {}
+
+# Tags whose value changes on every lookup and hence cannot be cached
+dynamicTags:list[str]   = ['%timestamp']
+decodeFields:list[str]  = ["pluginArgs", "pipelineName", "pluginName", "feedName", "pluginVersion"]
+
+def analysisDecoder_get(snap:Snapshot) -> pftag.Pftag:
+    """
+    Return a pftag decoder primed with the lookups of the <snap>
+    configuration, building it only if the decodeVersion changed.
+    """
+    global analysisDecoder
+    cached = analysisDecoder
+    if cached and cached[0] == snap.decodeVersion:
+        return cached[1]
     decode:pftag.Pftag  = pftag.Pftag({})
     addDict:bool = decode.lookupDict_add(
         [
             {
                 'CUBE': {
-                    'usernameCUBE': credentialsCUBE.usernameCUBE,
-                    'passwordCUBE': credentialsCUBE.passwordCUBE,
-                    'urlCUBE':      serviceURLs.urlCUBE
+                    'usernameCUBE': snap.credentialsCUBE.usernameCUBE,
+                    'passwordCUBE': snap.credentialsCUBE.passwordCUBE,
+                    'urlCUBE':      snap.serviceURLs.urlCUBE
                 }
             },
             {
                 'orthanc': {
-                    'usernameOrthanc':  credentialsOrthanc.usernameOrthanc,
-                    'passwordOrthanc':  credentialsOrthanc.passwordOrthanc,
-                    'urlOrthanc':       serviceURLs.urlOrthanc
+                    'usernameOrthanc':  snap.credentialsOrthanc.usernameOrthanc,
+                    'passwordOrthanc':  snap.credentialsOrthanc.passwordOrthanc,
+                    'urlOrthanc':       snap.serviceURLs.urlOrthanc
                 }
             },
             {
@@ -77,21 +589,87 @@ def analysis_decode(key:str) -> DylldAnalysis:
             }
         ]
     )
-    for field in ["pluginArgs", "pipelineName", "pluginName", "feedName", "pluginVersion"]:
-        d_decode: dict = decode(analyses.analyses[key].__getattribute__(field))
-        analysisDecoded.__setattr__(field, d_decode["result"])
-    return analysisDecoded
+    analysisDecoder = (snap.decodeVersion, decode)
+    return decode
+
+def analysis_decode(key:str, snap:Snapshot | None = None) -> DylldAnalysis:
+    """
+    Return the analysis <key> with its template fields decoded.
+
+    The decoding is cached per snapshot decodeVersion. Only fields that
+    contain dynamic tags (like %timestamp) are re-decoded on each call.
+    The returned object is never shared with the settings themselves.
+
+    Args:
+        key (str): the analysis name
+        snap (Snapshot): the configuration to decode against (default current)
+
+    Returns:
+        DylldAnalysis: the decoded analysis
+    """
+    snap                = snap if snap else snapshot
+    template:DylldAnalysis  = snap.analyses[key]
+    cached              = analysisCache.get(key)
+    decode:pftag.Pftag  = analysisDecoder_get(snap)
+    if not cached or cached[0] != snap.decodeVersion:
+        d_decoded:dict          = {}
+        l_dynamic:list[str]     = []
+        for field in decodeFields:
+            value:str           = template.__getattribute__(field)
+            if any(tag in value for tag in dynamicTags):
+                l_dynamic.append(field)
+            d_decoded[field]    = decode(value)["result"]
+        cached                  = (snap.decodeVersion, template.copy(update = d_decoded), l_dynamic)
+        analysisCache[key]      = cached
+    version, decoded, l_dynamic = cached
+    if not l_dynamic:
+        return decoded
+    return decoded.copy(update = {
+        field: decode(template.__getattribute__(field))["result"] for field in l_dynamic
+    })
 
 pflink              = Pflink()
 analysis            = DylldAnalysis()
-analysisDecoded     = DylldAnalysis()
 vault               = Vault()
 credentialsCUBE     = CredentialsCUBE()
 credentialsOrthanc  = CredentialsOrthanc()
 serviceURLs         = ServiceURLs()
 pflinkAuth          = PflinkAuth()
+httpPool            = HttpPool()
+circuit             = Circuit()
+pacing              = Pacing()
+admission           = Admission()
+statusCache         = StatusCache()
+batch               = Batch()
+tracker             = Tracker()
+watch               = Watch()
+eventLogging        = EventLogging()
 pfdcm               = Pfdcm()
-analyses            = Analyses()
-analyses.analyses["default"] = analysisDecoded
-
+mapSpecs            = MapSpecs()
+sharedConfig        = SharedConfig()
+ledger              = Ledger()
+outbox              = Outbox()
+routing             = Routing()
+hedge               = Hedge()
+requestDeadline     = RequestDeadline()
+rateLimit           = RateLimit()
+hello               = Hello()
+analyses            = Analyses(analyses = {"default": DylldAnalysis()})
+snapshot            = Snapshot(
+    pflink              = pflink,
+    pflinkAuth          = pflinkAuth,
+    credentialsCUBE     = credentialsCUBE,
+    credentialsOrthanc  = credentialsOrthanc,
+    serviceURLs         = serviceURLs,
+    analyses            = analyses.analyses
+)
+# The snapshot holds validated copies; alias those so both views agree.
+pflink              = snapshot.pflink
+pflinkAuth          = snapshot.pflinkAuth
+credentialsCUBE     = snapshot.credentialsCUBE
+credentialsOrthanc  = snapshot.credentialsOrthanc
+serviceURLs         = snapshot.serviceURLs
+analyses            = Analyses(analyses = snapshot.analyses)
 
+if sharedConfig.configStorePath:
+    configStore_open(sharedConfig.configStorePath, sharedConfig.configStoreBoot)
@@ -22,6 +22,12 @@ from    lib                 import map
 
 import  sys
 
+# Workers sharing the configuration (see SharedConfig) all take their
+# credentials from the environment
+credentialsShared_message:str = \
+    "Credentials cannot be changed while the configuration is shared by workers. " \
+    "Set them in the environment instead."
+
 def CUBElogin_set(
         payload             : credentialModel.credentials,
         request             : Request
@@ -37,8 +43,13 @@ def CUBElogin_set(
         credentialModel.credentialsStatus: status of the setting operation
     """
     d_ret:credentialModel.credentialsStatus = credentialModel.credentialsStatus()
-    settings.credentialsCUBE.usernameCUBE   = payload.username
-    settings.credentialsCUBE.passwordCUBE   = payload.password
+    if not settings.config_settable('credentialsCUBE', 'usernameCUBE', 'passwordCUBE'):
+        d_ret.status                        = False
+        d_ret.message                       = credentialsShared_message
+        return d_ret
+    settings.config_set('credentialsCUBE',
+                        usernameCUBE    = payload.username,
+                        passwordCUBE    = payload.password)
     d_ret.status                            = True
     d_ret.message                           = "CUBE credentials set successfully."
     return d_ret
@@ -58,8 +69,13 @@ def orthanclogin_set(
         credentialModel.credentialsStatus: status of the setting operation
     """
     d_ret:credentialModel.credentialsStatus = credentialModel.credentialsStatus()
-    settings.credentialsOrthanc.usernameOrthanc     = payload.username
-    settings.credentialsOrthanc.passwordOrthanc     = payload.password
+    if not settings.config_settable('credentialsOrthanc', 'usernameOrthanc', 'passwordOrthanc'):
+        d_ret.status                        = False
+        d_ret.message                       = credentialsShared_message
+        return d_ret
+    settings.config_set('credentialsOrthanc',
+                        usernameOrthanc = payload.username,
+                        passwordOrthanc = payload.password)
     d_ret.status                                    = True
     d_ret.message                                   = "Orthanc credentials set successfully."
     return d_ret
@@ -9,7 +9,7 @@ from    fastapi             import  APIRouter, Query, Request
 from    fastapi.encoders    import  jsonable_encoder
 from    fastapi.concurrency import  run_in_threadpool
 from    pydantic            import  BaseModel, Field
-from    typing              import  Optional, List, Dict, Callable, Any
+from    typing              import  Optional, List, Dict, Callable, Any, AsyncIterator
 
 from    .jobController      import  jobber
 import  asyncio
@@ -18,12 +18,15 @@ import  os
 from    datetime            import  datetime
 
 import  json
+import  hashlib
+import  math
+import  time
 import  pudb
 from    pudb.remote         import set_trace
 from    config              import settings
 import  httpx
 
-from    lib                 import map, pflinkclient
+from    lib                 import map, pflinkclient, singleflight, ttlcache, jsonlog, metrics, admission, broadcast, tracker, ledger, outbox, hashring, health, deadline, ratelimit
 
 import  sys
 from    loguru              import logger
@@ -39,13 +42,172 @@ logger_format = (
 )
 logger.remove()
 logger.opt(colors = True)
-logger.add(sys.stderr, format=logger_format)
+logger.add(sys.stderr, format=logger_format, enqueue = True)
 LOG     = logger.info
 
+# Relay events are logged as compact JSON lines from a background thread
+eventLog: jsonlog.JSONLog   = jsonlog.JSONLog(
+    stages      = settings.eventLogging.logStages,
+    sampleEvery = settings.eventLogging.logSampleEvery,
+    queueSize   = settings.eventLogging.logQueueSize
+)
+
 
 threadpool: ThreadPoolExecutor      = ThreadPoolExecutor()
 processpool: ProcessPoolExecutor    = ProcessPoolExecutor()
 
+# The pflink auth token, shared by all relays and renewed in the
+# background (see main.lifespan)
+pflinkToken: pflinkclient.AuthToken = pflinkclient.AuthToken(
+    settings.pflinkAuth.token,
+    margin  = settings.pflinkAuth.tokenRenewMargin,
+    retry   = settings.pflinkAuth.tokenRetryDelay
+)
+
+# Identical relays in flight at the same time share one pflink request
+inflight: singleflight.SingleFlight = singleflight.SingleFlight()
+
+# Relays to pflink are admitted through separate prod and test limiters
+admissionLimiters:dict[str, admission.Limiter] = {
+    'prod': admission.Limiter(
+        'prod',
+        maxConcurrent   = settings.admission.admitProdConcurrency,
+        maxQueue        = settings.admission.admitProdQueue,
+        queueTimeout    = settings.admission.admitProdQueueTimeout
+    ),
+    'test': admission.Limiter(
+        'test',
+        maxConcurrent   = settings.admission.admitTestConcurrency,
+        maxQueue        = settings.admission.admitTestQueue,
+        queueTimeout    = settings.admission.admitTestQueueTimeout
+    )
+}
+
+# Relay metrics are labelled by analyzeFunction and by target (test/prod)
+relayLabels:tuple[str, str]         = ('analyzeFunction', 'target')
+metricIntoTransform:metrics.Histogram   = metrics.registry.histogram(
+    'pfbridge_transform_into_seconds',
+    'Time to map a client payload into a pflink payload', relayLabels)
+metricPflinkRequest:metrics.Histogram   = metrics.registry.histogram(
+    'pfbridge_pflink_request_seconds',
+    'Round trip time of a POST to pflink', relayLabels)
+metricFromTransform:metrics.Histogram   = metrics.registry.histogram(
+    'pfbridge_transform_from_seconds',
+    'Time to map a pflink response into a client response', relayLabels)
+metricTokenRefresh:metrics.Histogram    = metrics.registry.histogram(
+    'pfbridge_token_refresh_seconds',
+    'Time to obtain a new pflink auth token')
+metricCommsFailures:metrics.Counter     = metrics.registry.counter(
+    'pfbridge_comms_failures_total',
+    'Relays that failed to communicate with pflink', relayLabels)
+metricModelViolations:metrics.Counter   = metrics.registry.counter(
+    'pfbridge_model_violations_total',
+    'pflink responses that violated the pflink response model', relayLabels)
+metricTokenRetries:metrics.Counter      = metrics.registry.counter(
+    'pfbridge_token_retries_total',
+    'Relays retried after pflink rejected the auth token (403)', relayLabels)
+metricCircuitRejections:metrics.Counter = metrics.registry.counter(
+    'pfbridge_circuit_rejections_total',
+    'Relays failed at once because the circuit to pflink was open', relayLabels)
+metricAdmissionWait:metrics.Histogram   = metrics.registry.histogram(
+    'pfbridge_admission_wait_seconds',
+    'Time a relay waited for admission', ('target',))
+metricAdmissionRejections:metrics.Counter = metrics.registry.counter(
+    'pfbridge_admission_rejections_total',
+    'Relays refused admission, by reason', ('target', 'reason'))
+metricWatchStreams:metrics.Gauge        = metrics.registry.gauge(
+    'pfbridge_watch_streams',
+    'Open workflow progress streams')
+metricTracked:metrics.Gauge             = metrics.registry.gauge(
+    'pfbridge_tracked_workflows',
+    'Workflows in the tracker registry')
+metricTrackerPolls:metrics.Counter      = metrics.registry.counter(
+    'pfbridge_tracker_polls_total',
+    'Background polls of tracked workflows', relayLabels)
+metricTrackerPollTime:metrics.Histogram = metrics.registry.histogram(
+    'pfbridge_tracker_poll_seconds',
+    'Time taken by background polls of tracked workflows, hedges included', relayLabels)
+metricTrackerAnswers:metrics.Counter    = metrics.registry.counter(
+    'pfbridge_tracker_answers_total',
+    'Relays answered from the tracker registry', relayLabels)
+metricOutboxQueued:metrics.Counter      = metrics.registry.counter(
+    'pfbridge_outbox_queued_total',
+    'Relays queued for replay after failing to reach pflink', relayLabels)
+metricOutboxReplays:metrics.Counter     = metrics.registry.counter(
+    'pfbridge_outbox_replays_total',
+    'Replays of queued relays, by result', ('target', 'result'))
+metricOutboxDepth:metrics.Gauge         = metrics.registry.gauge(
+    'pfbridge_outbox_depth',
+    'Relays waiting in the outbox file (of any worker), as last counted')
+metricHedges:metrics.Counter            = metrics.registry.counter(
+    'pfbridge_hedges_total',
+    'Relays also sent to a second pflink node after a slow first answer, by source (client, poll, replay)',
+    relayLabels + ('source',))
+metricHedgeWins:metrics.Counter         = metrics.registry.counter(
+    'pfbridge_hedge_wins_total',
+    'Hedged relays, by which request answered first', ('target', 'source', 'winner'))
+metricDeadlines:metrics.Counter         = metrics.registry.counter(
+    'pfbridge_deadline_exceeded_total',
+    'Relays abandoned because the client deadline passed', ('target',))
+metricRateLimited:metrics.Counter       = metrics.registry.counter(
+    'pfbridge_rate_limited_total',
+    'Requests refused because the client exceeded its rate limit', ('analyzeFunction',))
+metricPaceRate:metrics.Gauge            = metrics.registry.gauge(
+    'pfbridge_pace_rate',
+    'Requests per second currently allowed to a pflink URL (if pacing is enabled)', ('url',))
+metricPaceRate.series_set(lambda: {(url,): pacer.rate for url, pacer in pflinkclient.pacers.d_pacers.items()})
+metricPaceQueue:metrics.Gauge           = metrics.registry.gauge(
+    'pfbridge_pace_queue_depth',
+    'Requests waiting for their turn to be sent to a pflink URL', ('url',))
+metricPaceQueue.series_set(lambda: {(url,): pacer.queued for url, pacer in pflinkclient.pacers.d_pacers.items()})
+metricInflight:metrics.Gauge            = metrics.registry.gauge(
+    'pfbridge_relays_inflight',
+    'Relays currently in flight to pflink', relayLabels)
+
+def relayLabels_get(
+        payload             : relayModel.clientPayload,
+        test                : bool,
+        snap                : settings.Snapshot
+) -> tuple[str, str]:
+    """
+    The metric label values of a relay. Unconfigured analyzeFunctions are
+    reported as "unknown" to keep the label cardinality bounded.
+    """
+    analyzeFunction:str = payload.analyzeFunction if payload.analyzeFunction in snap.analyses else 'unknown'
+    return (analyzeFunction, 'test' if test else 'prod')
+
+# A persistent record of every relay, if configured
+workflowLedger: ledger.Ledger | None = ledger.Ledger(
+    settings.ledger.ledgerPath,
+    queueSize   = settings.ledger.ledgerQueueSize,
+    maxAge      = settings.ledger.ledgerMaxAgeDays * 86400.0
+) if settings.ledger.ledgerPath else None
+metricLedgerDropped:metrics.Counter     = metrics.registry.counter(
+    'pfbridge_ledger_dropped_total',
+    'Ledger records not written, because the queue was full or the write failed', ('reason',))
+if workflowLedger is not None:
+    metricLedgerDropped.function_set(lambda: workflowLedger.dropped, 'queue_full')
+    metricLedgerDropped.function_set(lambda: workflowLedger.failed, 'write_failed')
+
+# Relays that failed to reach pflink, kept for replay, if configured
+relayOutbox: outbox.Outbox | None = outbox.Outbox(
+    settings.outbox.outboxPath,
+    baseDelay   = settings.outbox.outboxBaseDelay,
+    maxDelay    = settings.outbox.outboxMaxDelay,
+    maxAttempts = settings.outbox.outboxMaxAttempts,
+    maxAge      = settings.outbox.outboxMaxAge,
+    concurrency = settings.outbox.outboxConcurrency
+) if settings.outbox.outboxPath else None
+if relayOutbox is not None:
+    metricOutboxDepth.function_set(lambda: relayOutbox.depth)
+
+# Recent status replies, so that repeated polls can be answered locally
+statusCache: ttlcache.TTLCache      = ttlcache.TTLCache(settings.statusCache.statusCacheSize)
+
+# Relays that pflink has answered, i.e. whose workflow exists and which
+# are therefore safe to send to a second node (see pflinkHedgeURL_get)
+seenWorkflows: ttlcache.TTLCache    = ttlcache.TTLCache(settings.hedge.hedgeSeenSize)
+
 def noop():
     """
     A dummy function that does nothing.
@@ -54,35 +216,129 @@ def noop():
         'status':   True
     }
 
-def logToStdout(description:str, d_log:dict) -> None:
+def logToStdout(description:str, d_log:Any) -> None:
     """
-    Simply "write" the d_log to console stdout
+    Simply "write" the d_log to console stdout. The log is only queued
+    here; it is serialized and written by a background thread.
 
     Args:
-        d_log (dict): some dictionary to log
+        description (str): the logging stage
+        d_log (Any): some dictionary, model, or JSON bytes to log
     """
-    LOG("\n%s\n%s" % (description, json.dumps(d_log, indent =4)))
+    eventLog.emit(description, d_log)
 
-def logEvent(payload:relayModel.clientPayload, request: Request)-> dict:
+def requestLogEvent(request: Request) -> dict:
     """
-    Output an "input" log event
+    The fields of a log event that describe the incoming request
 
     Args:
         request (Request): the incoming request
 
     Returns:
-        dict: a log event
+        dict: a log event without a payload
     """
     timestamp = lambda : '%s' % datetime.now()
     d_logEvent:dict      = {
         '_timestamp'        : timestamp(),
         'requestHost'       : request.client.host,
         'requestPort'       : str(request.client.port),
-        'requestUserAgent'  : request.headers['user-agent'],
-        'payload'           : json.loads(payload.json())
+        'requestUserAgent'  : request.headers['user-agent']
     }
     return d_logEvent
 
+def logEvent(payload:relayModel.clientPayload, request: Request)-> dict:
+    """
+    Output an "input" log event
+
+    Args:
+        request (Request): the incoming request
+
+    Returns:
+        dict: a log event
+    """
+    d_logEvent:dict      = requestLogEvent(request)
+    d_logEvent['payload'] = payload
+    return d_logEvent
+
+def batchLogEvent(request: Request, n:int) -> dict:
+    """
+    Output an "input" log event for a batch of <n> payloads
+
+    Args:
+        request (Request): the incoming request
+        n (int): the number of payloads in the batch
+
+    Returns:
+        dict: a log event
+    """
+    d_logEvent:dict      = requestLogEvent(request)
+    d_logEvent['batch']  = n
+    return d_logEvent
+
+# Per-client rate limiting of the analyze endpoints
+ingressLimiter:ratelimit.RateLimiter        = ratelimit.RateLimiter(
+    maxKeys         = settings.rateLimit.rateLimitMaxClients,
+    path            = settings.rateLimit.rateLimitPath,
+    syncInterval    = settings.rateLimit.rateLimitSyncInterval
+)
+quotaDefault:ratelimit.Quota                = ratelimit.Quota(
+    settings.rateLimit.rateLimitRate, settings.rateLimit.rateLimitBurst
+)
+d_quotas:dict[str, ratelimit.Quota]         = {
+    analyzeFunction: ratelimit.Quota(
+        d_quota.get('rate', quotaDefault.rate), d_quota.get('burst', quotaDefault.burst)
+    )
+    for analyzeFunction, d_quota in settings.rateLimit.rateLimitQuotas.items()
+}
+rateLimitKeyDigests:set[str]                = {
+    hashlib.sha256(key.encode()).hexdigest() for key in settings.rateLimit.rateLimitKeys
+}
+
+def clientIdentity_get(request:Request) -> str:
+    """
+    Who is calling: the host, qualified by the API key it sends if that
+    key is one of the rateLimitKeys. Any other key is ignored, so that
+    callers cannot make up fresh identities (and buckets) at will.
+    """
+    identity:str        = 'host:' + (request.client.host if request.client else '')
+    apiKey:str | None   = request.headers.get(settings.rateLimit.rateLimitKeyHeader)
+    if apiKey:
+        digest:str      = hashlib.sha256(apiKey.encode()).hexdigest()
+        if digest in rateLimitKeyDigests:
+            identity   += '|key:' + digest[:16]
+    return identity
+
+def ingress_check(request:Request, payloads:list[relayModel.clientPayload]) -> None:
+    """
+    Charge the caller one token per payload, from its bucket for each
+    payload's analyzeFunction. Either every bucket is charged, or (if
+    any is short) none is.
+
+    Args:
+        request (Request): the incoming request
+        payloads (list[relayModel.clientPayload]): the payloads it carries
+
+    Raises:
+        ratelimit.RateLimited: the caller is over its quota
+    """
+    if not settings.rateLimit.rateLimitEnabled:
+        return
+    identity:str                = clientIdentity_get(request)
+    d_costs:dict[str, int]      = {}
+    for payload in payloads:
+        d_costs[payload.analyzeFunction] = d_costs.get(payload.analyzeFunction, 0) + 1
+    l_waits:list[float]         = ingressLimiter.take_all([
+        ('%s|%s' % (identity, analyzeFunction), d_quotas.get(analyzeFunction, quotaDefault), cost)
+        for analyzeFunction, cost in d_costs.items()
+    ])
+    for analyzeFunction, wait in zip(d_costs, l_waits):
+        if wait:
+            metricRateLimited.inc(analyzeFunction or 'unknown')
+            raise ratelimit.RateLimited(
+                "Rate limit exceeded for '%s'" % analyzeFunction,
+                min(3600, max(1, math.ceil(max(l_waits))))
+            )
+
 def commsFailed_handle(URL:str, e:Exception) -> relayModel.clientResponseSchema:
     """
     Handle a failed comms state
@@ -104,77 +360,909 @@ def commsFailed_handle(URL:str, e:Exception) -> relayModel.clientResponseSchema:
     errorResponse.error         = str(e)
     errorResponse.help          = "Please check that the pflink URL is correct (note 'localhost' can be problematic in some proxy settings)"
     failedClient.ErrorComms     = errorResponse
+    failedClient._unavailable   = isinstance(e, pflinkclient.PflinkUnavailableException)
     return failedClient
 
+def prodURLs_get(snap:settings.Snapshot) -> list[str]:
+    """
+    The pool of production pflink URLs: `prodURLs`, or just `prodURL`.
+    """
+    return list(snap.pflink.prodURLs) or [snap.pflink.prodURL]
+
+async def pflinkNode_probe(URL:str) -> None:
+    await pflinkclient.health_probe(
+        pflinkclient.pool_get(),
+        str(httpx.URL(URL).join(settings.routing.healthPath)),
+        settings.routing.healthTimeout
+    )
+
+def pflinkNodes_probed() -> list[str]:
+    """
+    The production URLs to health check: none unless there is a pool
+    to choose from.
+    """
+    l_URLs:list[str] = prodURLs_get(settings.snapshot_get())
+    return l_URLs if len(l_URLs) > 1 else []
+
+# Active health checks of the production pool (see main.lifespan)
+pflinkHealth:health.HealthChecker   = health.HealthChecker(
+    pflinkNode_probe,
+    interval    = settings.routing.healthInterval,
+    fall        = settings.routing.healthFall,
+    rise        = settings.routing.healthRise
+)
+
+def pflinkNode_isHealthy(URL:str) -> bool:
+    """
+    A node is skipped if it fails its health checks, or while its
+    circuit is open.
+    """
+    breaker = pflinkclient.circuits.get(URL)
+    return pflinkHealth.isHealthy(URL) and not (breaker.state == 'open' and breaker.retryAfter() > 0)
+
+# The ring over the current pool, rebuilt only when the pool changes
+pflinkRing:hashring.HashRing        = hashring.HashRing([])
+
+def pflinkURL_get(
+        payload             : relayModel.clientPayload,
+        test                : bool,
+        snap                : settings.Snapshot
+) -> str:
+    """
+    The pflink URL to relay <payload> to. Production relays are routed
+    over the pool by a consistent hash of the study and series, skipping
+    unhealthy nodes.
+
+    Returns:
+        str: the URL
+    """
+    global pflinkRing
+    if test:
+        return snap.pflink.testURL
+    l_URLs:list[str]            = prodURLs_get(snap)
+    if len(l_URLs) == 1:
+        return l_URLs[0]
+    if pflinkRing.nodes != tuple(dict.fromkeys(l_URLs)):
+        pflinkRing              = hashring.HashRing(l_URLs, settings.routing.routingReplicas)
+    return pflinkRing.node_get(routeKey_make(payload), pflinkNode_isHealthy)
+
+def routeKey_make(payload:relayModel.clientPayload) -> str:
+    return '%s|%s' % (payload.imageMeta.StudyInstanceUID, payload.imageMeta.SeriesInstanceUID)
+
+def pflinkHedgeURL_get(
+        payload             : relayModel.clientPayload,
+        test                : bool,
+        snap                : settings.Snapshot,
+        relayKey            : str,
+        URL                 : str
+) -> str | None:
+    """
+    The pflink URL a slow relay to <URL> may be hedged to: the next
+    routable node on the ring.
+
+    pflink has one endpoint for submitting a workflow and asking after
+    it: a POST of a workflow it already holds answers with that
+    workflow's status. A repeat that follows a request pflink has
+    recorded (a client retry, an outbox replay) is therefore harmless.
+    Two concurrent first submissions, though, can both miss the other
+    and create two workflows. A hedge is concurrent by nature, so only
+    relays of workflows that pflink has already answered are hedged:
+    the hedge is then a status request.
+
+    With tracking on, relays of such workflows come mostly from the
+    tracker (clients are answered from its registry), so hedges mostly
+    speed up background polls rather than client relays; see the
+    `source` label of pfbridge_hedges_total and
+    pfbridge_tracker_poll_seconds.
+
+    Returns:
+        str | None: the URL, or None if the relay is not to be hedged
+    """
+    if not settings.hedge.hedgeEnabled or test or len(prodURLs_get(snap)) < 2:
+        return None
+    if seenWorkflows.get(relayKey) is None:
+        return None
+    for node in pflinkRing.nodes_iter(routeKey_make(payload)):
+        if node != URL and pflinkNode_isHealthy(node):
+            return node
+    return None
+
+def pflinkNodes_status() -> list[relayModel.pflinkNode]:
+    """
+    The health of every node in the production pool.
+
+    Returns:
+        list[relayModel.pflinkNode]: one entry per URL
+    """
+    d_health:dict[str, dict]    = {d_node['url']: d_node for d_node in pflinkHealth.status()}
+    l_nodes:list[relayModel.pflinkNode] = []
+    for URL in prodURLs_get(settings.snapshot_get()):
+        d_node:dict             = d_health.get(URL, {'url': URL})
+        l_nodes.append(relayModel.pflinkNode(
+            **d_node,
+            circuit     = pflinkclient.circuits.get(URL).state,
+            routable    = pflinkNode_isHealthy(URL)
+        ))
+    return l_nodes
+
+def circuits_status() -> list[relayModel.circuitStatus]:
+    """
+    The circuit breaker state of every pflink URL used so far.
+
+    Returns:
+        list[relayModel.circuitStatus]: one entry per URL
+    """
+    return [relayModel.circuitStatus(**d_status) for d_status in pflinkclient.circuits.status()]
+
+def admissionRejected_handle(e:admission.AdmissionRejected) -> relayModel.clientResponseSchema:
+    """
+    The response for a relay that was refused admission, used where an
+    HTTP error cannot be returned (e.g. one item of a batch).
+
+    Args:
+        e (admission.AdmissionRejected): the rejection
+
+    Returns:
+        relayModel.clientResponseSchema: a response with appropriate failure
+                                         conditions
+    """
+    rejectedClient:relayModel.clientResponseSchema  = relayModel.clientResponseSchema()
+    rejectedClient.Status       = False
+    rejectedClient.State        = "Rejected"
+    rejectedClient.ProgressPerc = 0
+    rejectedClient.ErrorWorkflow = "n/a"
+    errorResponse:relayModel.pflinkError            = relayModel.pflinkError()
+    errorResponse.error         = str(e)
+    errorResponse.help          = "pfbridge is saturated, please retry after %d seconds" % e.retryAfter
+    rejectedClient.ErrorComms   = errorResponse
+    return rejectedClient
+
+def queued_handle(entry:outbox.Entry) -> relayModel.clientResponseSchema:
+    """
+    The response for a relay that could not reach pflink and has been
+    queued for replay. The relay has not (yet) succeeded, so the Status
+    is False; the "Queued" State tells the client it will be resubmitted.
+
+    Args:
+        entry (outbox.Entry): the outbox entry of the relay
+
+    Returns:
+        relayModel.clientResponseSchema: a "Queued" response
+    """
+    queuedClient:relayModel.clientResponseSchema    = relayModel.clientResponseSchema()
+    queuedClient.Status         = False
+    queuedClient.State          = "Queued"
+    queuedClient.ProgressPerc   = 0
+    queuedClient.ErrorWorkflow  = ""
+    errorResponse:relayModel.pflinkError            = relayModel.pflinkError()
+    errorResponse.error         = entry.error
+    errorResponse.help          = "pflink could not be reached; the request was queued %s and is resubmitted automatically (%d attempts so far)" % (
+        datetime.fromtimestamp(entry.queued).isoformat(timespec = 'seconds'), entry.attempts
+    )
+    queuedClient.ErrorComms     = errorResponse
+    return queuedClient
+
+def relayKey_make(payload:relayModel.clientPayload, test:bool) -> str:
+    """
+    A normalized hash identifying a relay: identical payloads (regardless
+    of field order) to the same pflink endpoint produce the same key.
+
+    Args:
+        payload (relayModel.clientPayload): the relay payload
+        test (bool): whether the pflink test endpoint is targeted
+
+    Returns:
+        str: the relay key
+    """
+    str_payload:str = json.dumps(payload.dict(), sort_keys = True, separators = (',', ':'))
+    return hashlib.sha256(('%s|%s' % (str_payload, test)).encode()).hexdigest()
+
 async def relayAndEchoBack(
         payload             : relayModel.clientPayload,
         request             : Request,
-        test                : bool
+        test                : bool,
+        requestDeadline     : float | None = None
 ) -> relayModel.clientResponseSchema:
     """
     Parse the incoming payload, expand to pflink needs,
     transmit, and return remote response.
 
+    Concurrent calls with an identical payload share a single
+    outbound request to pflink and each receive its own copy
+    of the response. Workflows already tracked are answered from
+    the tracker registry, and repeated calls within the freshness
+    window of a previous reply from the status cache.
+
+    Once <requestDeadline> passes, the caller stops waiting, and work on
+    the relay is cancelled unless another caller still waits for it.
+
     Args:
         payload (relayModel.clientPayload): the relay payload
+        requestDeadline (float): the monotonic deadline of the caller
 
     Returns:
         dict: the reponse from the remote server
 
+    Raises:
+        admission.AdmissionRejected: too many relays are in flight
+        deadline.DeadlineExceeded: no answer before the deadline
+
     """
-    boundary:map.Map            = map.Map(name = 'Leg Length Analysis')
+    eventLog.sample()
     d_logEvent:dict             = logEvent(payload, request)
     logToStdout("Incoming", d_logEvent)
-    toPflink:relayModel.pflinkInput = boundary.intoPflink_transform(payload)
-    logToStdout("Transmitting", json.loads(toPflink.json()))
-    URL:str                     = settings.pflink.testURL if test else settings.pflink.prodURL
-    toClient:relayModel.clientResponseSchema    = relayModel.clientResponseSchema()
+    snap:settings.Snapshot      = settings.snapshot_get()
+    boundary:map.Map            = map.map_get(payload.analyzeFunction)
+    try:
+        return await relay_cached(payload, test, snap, boundary, requestDeadline = requestDeadline)
+    except deadline.DeadlineExceeded:
+        metricDeadlines.inc('test' if test else 'prod')
+        raise
+
+async def relay_cached(
+        payload             : relayModel.clientPayload,
+        test                : bool,
+        snap                : settings.Snapshot,
+        boundary            : map.Map,
+        toPflink            : bytes | None = None,
+        requestDeadline     : float | None = None,
+        watched             : bool = False
+) -> relayModel.clientResponseSchema:
+    """
+    Answer a relay from the tracker registry or the status cache, or
+    join/perform the single in-flight relay for this payload. Only a
+    relay that goes out to pflink needs admission; callers joining it
+    do not. A workflow relayed here is then tracked.
+
+    Tracked responses obtained under an older configuration than <snap>
+    are not served, but refreshed from pflink.
+
+    Args:
+        payload (relayModel.clientPayload): the relay payload
+        test (bool): use the pflink test endpoint
+        snap (settings.Snapshot): the pinned configuration
+        boundary (map.Map): the map to transform with
+        toPflink (bytes): the request body already serialized for
+                          pflink, if available
+        requestDeadline (float): the monotonic deadline of the caller
+        watched (bool): the workflow is to be watched, and so tracked
+                        regardless of the tracker settings
+
+    Returns:
+        relayModel.clientResponseSchema: a copy of the response for the client
+
+    Raises:
+        admission.AdmissionRejected: too many relays are in flight
+        deadline.DeadlineExceeded: no answer before the deadline
+    """
+    relayKey:str                = relayKey_make(payload, test)
+    generation:int              = trackerGeneration_get(snap)
+    tracked:tracker.Tracked | None  = workflowTracker.get(relayKey) if settings.tracker.trackEnabled else None
+    if tracked is not None and workflowTracker.isFresh(tracked):
+        metricTrackerAnswers.inc(*relayLabels_get(payload, test, snap))
+        relay_record(relayKey, payload, test, boundary, tracked.response)
+        return tracked.response.copy(deep = True)
+    key:str                     = '%s:%d' % (relayKey, snap.version)
+    toClient:relayModel.clientResponseSchema | None = statusCache.get(key)
+    if toClient is None:
+        toClient                = await inflight.do(
+            key,
+            lambda: relay_admitted(payload, test, snap, key, boundary, toPflink),
+            requestDeadline
+        )
+    queued:relayModel.clientResponseSchema | None = await relay_outbox(relayKey, payload, test, snap, toClient)
+    if queued is None:
+        workflow_track(relayKey, payload, test, boundary, toClient, generation, watched)
+    else:
+        toClient                = queued
+    relay_record(relayKey, payload, test, boundary, toClient)
+    return toClient.copy(deep = True)
+
+async def relay_outbox(
+        relayKey            : str,
+        payload             : relayModel.clientPayload,
+        test                : bool,
+        snap                : settings.Snapshot,
+        toClient            : relayModel.clientResponseSchema
+) -> relayModel.clientResponseSchema | None:
+    """
+    Queue a relay that failed because pflink was unreachable or failing
+    (a transport error or 5xx) for replay; or, once a relay gets
+    through, clear any queued copy of it. Other comms failures (no free
+    local connection, an open circuit, token problems) are answered as
+    they are: replaying them would not help, or the circuit already
+    holds relays back.
+
+    Returns:
+        relayModel.clientResponseSchema | None: the "Queued" response to
+                answer instead of the comms failure, or None if the relay
+                was not queued (it got through, or there is no outbox)
+    """
+    if relayOutbox is None:
+        return None
+    if not toClient.ErrorComms.error:
+        if relayKey in relayOutbox.keys:
+            await relayOutbox.done(relayKey)
+        return None
+    if not toClient._unavailable:
+        return None
+    entry, created              = await relayOutbox.enqueue(relayKey, payload.dict(), test, toClient.ErrorComms.error)
+    if created:
+        metricOutboxQueued.inc(*relayLabels_get(payload, test, snap))
+    return queued_handle(entry)
+
+async def outbox_replay(entry:outbox.Entry) -> bool:
+    """
+    Resubmit a queued relay on behalf of the outbox. A relay that gets
+    through is then tracked like any other.
+
+    Returns:
+        bool: whether pflink was reached
+    """
+    payload:relayModel.clientPayload    = relayModel.clientPayload(**entry.payload)
+    snap:settings.Snapshot              = settings.snapshot_get()
+    boundary:map.Map                    = map.map_get(payload.analyzeFunction)
+    key:str                             = '%s:%d' % (entry.key, snap.version)
+    target:str                          = 'test' if entry.test else 'prod'
+    try:
+        toClient:relayModel.clientResponseSchema = await inflight.do(
+            key,
+            lambda: relay_admitted(payload, entry.test, snap, key, boundary, source = 'replay')
+        )
+    except admission.AdmissionRejected:
+        metricOutboxReplays.inc(target, 'rejected')
+        return False
+    if toClient.ErrorComms.error:
+        metricOutboxReplays.inc(target, 'failed')
+        entry.error             = toClient.ErrorComms.error
+        return False
+    metricOutboxReplays.inc(target, 'delivered')
+    workflow_track(entry.key, payload, entry.test, boundary, toClient)
+    relay_record(entry.key, payload, entry.test, boundary, toClient, isPoll = True)
+    return True
+
+def relay_record(
+        relayKey            : str,
+        payload             : relayModel.clientPayload,
+        test                : bool,
+        boundary            : map.Map,
+        toClient            : relayModel.clientResponseSchema,
+        isPoll              : bool = False
+) -> None:
+    """
+    Record a relay (or background poll) in the ledger, if there is one.
+    This only queues the record.
+    """
+    if workflowLedger is None:
+        return
+    workflowLedger.record(
+        relayKey,
+        {
+            'StudyInstanceUID':     payload.imageMeta.StudyInstanceUID,
+            'SeriesInstanceUID':    payload.imageMeta.SeriesInstanceUID,
+            'AccessionNumber':      payload.imageMeta.AccessionNumber,
+            'analyzeFunction':      payload.analyzeFunction
+        },
+        test,
+        boundary.workflowState_get(toClient),
+        toClient.dict(),
+        isPoll
+    )
+
+def ledgerWorkflows_get(
+        d_filter            : dict[str, str],
+        limit               : int,
+        before              : int | None
+) -> relayModel.ledgerWorkflowPage | None:
+    """
+    Page through the ledger workflows matching <d_filter>.
+
+    Returns:
+        relayModel.ledgerWorkflowPage | None: the page, or None if there
+                                              is no ledger
+    """
+    if workflowLedger is None:
+        return None
+    l_items, after = workflowLedger.workflows_query(d_filter, limit, before)
+    return relayModel.ledgerWorkflowPage(items = l_items, before = after)
+
+def ledgerEvents_get(
+        key                 : str,
+        limit               : int,
+        before              : int | None
+) -> relayModel.ledgerEventPage | None:
+    """
+    Page through the recorded state changes of the workflow <key>.
+
+    Returns:
+        relayModel.ledgerEventPage | None: the page, or None if there
+                                           is no ledger
+    """
+    if workflowLedger is None:
+        return None
+    l_items, after = workflowLedger.events_query(key, limit, before)
+    return relayModel.ledgerEventPage(items = l_items, before = after)
+
+async def relay_admitted(
+        payload             : relayModel.clientPayload,
+        test                : bool,
+        snap                : settings.Snapshot,
+        key                 : str,
+        boundary            : map.Map,
+        toPflink            : bytes | None = None,
+        source              : str = 'client'
+) -> relayModel.clientResponseSchema:
+    """
+    Wait for admission through the limiter of the target (prod/test)
+    and then perform the relay. See relay_do() for the arguments.
+
+    Raises:
+        admission.AdmissionRejected: the relay was not admitted
+    """
+    target:str                  = 'test' if test else 'prod'
+    queued:float                = time.perf_counter()
     try:
-        toClient:relayModel.clientResponseSchema    = await pflinkPost(URL, toPflink.json(), boundary)
-    except pflinkclient.PflinkRequestInvalidTokenException:
-        LOG(f"Auth token has expired while POSTing request to {URL}")
+        async with admissionLimiters[target].admit():
+            metricAdmissionWait.observe(time.perf_counter() - queued, target)
+            return await relay_do(payload, test, snap, key, boundary, toPflink, source)
+    except admission.AdmissionRejected as e:
+        metricAdmissionRejections.inc(target, e.reason)
+        raise
+
+async def relayBatch_iter(
+        payloads            : list[relayModel.clientPayload],
+        request             : Request,
+        test                : bool
+) -> AsyncIterator[relayModel.clientBatchItem]:
+    """
+    Relay a batch of payloads, yielding each result as it completes.
+
+    All payloads are transformed up front, each with the map of its
+    analysis, against one pinned configuration snapshot. The relays then
+    run over the shared connection pool with at most `batchConcurrency`
+    in flight.
+
+    Args:
+        payloads (list[relayModel.clientPayload]): the batch
+        request (Request): the incoming request
+        test (bool): use the pflink test endpoint
+
+    Yields:
+        relayModel.clientBatchItem: an indexed result
+    """
+    eventLog.sample()
+    logToStdout("Incoming", batchLogEvent(request, len(payloads)))
+    snap:settings.Snapshot      = settings.snapshot_get()
+    l_boundary:list[map.Map]    = [map.map_get(payload.analyzeFunction) for payload in payloads]
+    l_toPflink:list[bytes]      = []
+    for payload, boundary in zip(payloads, l_boundary):
+        with metricIntoTransform.time(*relayLabels_get(payload, test, snap)):
+            l_toPflink.append(boundary.intoPflink_serialize(payload, snap))
+    gate:asyncio.Semaphore      = asyncio.Semaphore(max(1, settings.batch.batchConcurrency))
+
+    async def item_relay(index:int) -> relayModel.clientBatchItem:
+        async with gate:
+            try:
+                toClient:relayModel.clientResponseSchema = await relay_cached(
+                    payloads[index], test, snap, l_boundary[index], l_toPflink[index]
+                )
+            except admission.AdmissionRejected as e:
+                toClient:relayModel.clientResponseSchema = admissionRejected_handle(e)
+        return relayModel.clientBatchItem(index = index, response = toClient)
+
+    l_tasks:list[asyncio.Task]  = [asyncio.create_task(item_relay(i)) for i in range(len(payloads))]
+    try:
+        for done in asyncio.as_completed(l_tasks):
+            yield await done
+    finally:
+        for task in l_tasks:
+            task.cancel()
+
+async def relayBatch(
+        payloads            : list[relayModel.clientPayload],
+        request             : Request,
+        test                : bool
+) -> list[relayModel.clientResponseSchema]:
+    """
+    Relay a batch of payloads and return all results in payload order.
+
+    Args:
+        payloads (list[relayModel.clientPayload]): the batch
+        request (Request): the incoming request
+        test (bool): use the pflink test endpoint
+
+    Returns:
+        list[relayModel.clientResponseSchema]: the per-payload results
+    """
+    l_results:list[relayModel.clientResponseSchema] = [relayModel.clientResponseSchema()] * len(payloads)
+    async for item in relayBatch_iter(payloads, request, test):
+        l_results[item.index] = item.response
+    return l_results
+
+def workflowDone_check(boundary:map.Map, toClient:relayModel.clientResponseSchema) -> bool:
+    """
+    Whether a workflow has reached a state it will not leave, i.e. it
+    completed, its feed was deleted, or pflink reported it as failed.
+    Comms failures and refusals are transient and are not final.
+    """
+    if toClient.ErrorComms.error or toClient.ModelViolation is not None:
+        return False
+    if not toClient.Status:
+        return True
+    return boundary.workflowState_get(toClient) in ('completed', 'feed deleted from CUBE')
+
+def trackInterval_get(tracked:tracker.Tracked, changed:bool) -> float:
+    """
+    Seconds until a tracked workflow is polled again: the interval for
+    its pflink state while it is progressing, growing by trackBackoff
+    (up to trackMaxInterval) with each poll that finds it unchanged.
+    """
+    base:float = settings.tracker.trackIntervals.get(tracked.state, settings.tracker.trackInterval)
+    if changed:
+        return base
+    return min(settings.tracker.trackMaxInterval,
+               max(base, tracked.interval * settings.tracker.trackBackoff))
+
+async def workflow_poll(tracked:tracker.Tracked) -> tuple[relayModel.clientResponseSchema, str, bool] | None:
+    """
+    Re-poll a tracked workflow on behalf of the tracker. The poll skips
+    the registry and the status cache, but shares in-flight coalescing
+    and admission with client relays. A poll that fails to reach pflink
+    (or gets a reply that violates its model) brings no news: the
+    tracker keeps the last good response, and never serves the failure.
+
+    Returns:
+        tuple | None: the response, its pflink state, and whether it is
+                      final; or None if the poll was not admitted or
+                      failed
+    """
+    payload, test               = tracked.context
+    snap:settings.Snapshot      = settings.snapshot_get()
+    trackerGeneration_get(snap)
+    boundary:map.Map            = map.map_get(payload.analyzeFunction)
+    key:str                     = '%s:%d' % (tracked.key, snap.version)
+    metricTrackerPolls.inc(*relayLabels_get(payload, test, snap))
+    metricTracked.set(len(workflowTracker))
+    try:
+        with metricTrackerPollTime.time(*relayLabels_get(payload, test, snap)):
+            toClient:relayModel.clientResponseSchema = await inflight.do(
+                key,
+                lambda: relay_admitted(payload, test, snap, key, boundary, source = 'poll')
+            )
+    except admission.AdmissionRejected:
+        return None
+    relay_record(tracked.key, payload, test, boundary, toClient, isPoll = True)
+    if toClient.ErrorComms.error or toClient.ModelViolation is not None:
+        return None
+    return toClient, boundary.workflowState_get(toClient), workflowDone_check(boundary, toClient)
+
+# Every workflow relayed is tracked, and re-polled in the background
+# (see main.lifespan) at an interval that depends on its state.
+workflowTracker:tracker.Tracker         = tracker.Tracker(
+    poll        = workflow_poll,
+    interval    = trackInterval_get,
+    maxSize     = settings.tracker.trackMaxWorkflows,
+    idle        = settings.tracker.trackIdle,
+    retain      = settings.tracker.trackRetain,
+    concurrency = settings.tracker.trackConcurrency
+)
+
+# The configuration version that the current tracker generation (see
+# trackerGeneration_get) belongs to
+trackedVersion:int                      = settings.snapshot_get().version
+
+def trackerGeneration_get(snap:settings.Snapshot) -> int:
+    """
+    The tracker generation of responses obtained under <snap>. The first
+    relay or poll to see a newer configuration invalidates every tracked
+    response, so that none obtained under the old one is served.
+    """
+    global trackedVersion
+    if snap.version > trackedVersion:
+        trackedVersion = snap.version
+        workflowTracker.invalidate()
+    if snap.version < trackedVersion:
+        return workflowTracker.generation - 1
+    return workflowTracker.generation
+
+def workflow_track(
+        relayKey            : str,
+        payload             : relayModel.clientPayload,
+        test                : bool,
+        boundary            : map.Map,
+        toClient            : relayModel.clientResponseSchema,
+        generation          : int | None = None,
+        watched             : bool = False
+) -> tracker.Tracked | None:
+    """
+    Start tracking a workflow from its first response, obtained in
+    tracker <generation>. Comms failures and replies that violate the
+    pflink model are never tracked. Unless the workflow is <watched>,
+    nothing is tracked with tracking disabled, nor are payloads for
+    analyses that are not configured.
+    """
+    if toClient.ErrorComms.error or toClient.ModelViolation is not None:
+        return None
+    if not watched and (not settings.tracker.trackEnabled
+                        or payload.analyzeFunction not in settings.snapshot_get().analyses):
+        return None
+    tracked:tracker.Tracked | None = workflowTracker.track(
+        relayKey, (payload, test), toClient,
+        boundary.workflowState_get(toClient), workflowDone_check(boundary, toClient),
+        generation
+    )
+    metricTracked.set(len(workflowTracker))
+    return tracked
+
+async def relayWatch_open(
+        payload             : relayModel.clientPayload,
+        request             : Request,
+        test                : bool
+) -> tuple[broadcast.Topic, broadcast.Subscription] | None:
+    """
+    Subscribe to the progress of a workflow, relaying it first (and so
+    starting to track it) if it is not tracked yet.
+
+    All callers watching the same workflow share its tracker entry, so
+    N watchers cost no more polls of pflink than one.
+
+    Args:
+        payload (relayModel.clientPayload): the workflow to watch
+        request (Request): the incoming request
+        test (bool): use the pflink test endpoint
+
+    Workflows are tracked for watching even with tracking disabled, and
+    for analyses that are not configured.
+
+    Returns:
+        tuple | None: the topic and the subscription to it, or None if
+                      the workflow cannot be tracked (pflink could not be
+                      reached, or the tracker is full)
+
+    Raises:
+        admission.AdmissionRejected: too many relays are in flight
+    """
+    eventLog.sample()
+    logToStdout("Incoming", logEvent(payload, request))
+    relayKey:str                    = relayKey_make(payload, test)
+    tracked:tracker.Tracked | None  = workflowTracker.get(relayKey)
+    if tracked is None:
+        snap:settings.Snapshot      = settings.snapshot_get()
+        await relay_cached(payload, test, snap, map.map_get(payload.analyzeFunction), watched = True)
+        tracked                     = workflowTracker.get(relayKey)
+    if tracked is None:
+        return None
+    return tracked.topic, tracked.topic.subscribe()
+
+async def relayWatch_iter(
+        topic               : broadcast.Topic,
+        subscription        : broadcast.Subscription
+) -> AsyncIterator[relayModel.clientResponseSchema | None]:
+    """
+    Yield the current response of a watched workflow and then every
+    change to it, ending once the workflow is done.
+
+    Args:
+        topic (broadcast.Topic): the workflow topic
+        subscription (broadcast.Subscription): from relayWatch_open()
+
+    Yields:
+        relayModel.clientResponseSchema | None: a changed response, or
+                None if nothing changed for `watchHeartbeat` seconds
+    """
+    with metricWatchStreams.track():
         try:
-            await refreshPflinkAuthToken()
-            toClient: relayModel.clientResponseSchema = await pflinkPost(URL, toPflink.json(), boundary)
-        except Exception as e:
-            toClient: relayModel.clientResponseSchema = commsFailed_handle(URL, e)
-    except pflinkclient.PflinkRequestException as e:
-        toClient:relayModel.clientResponseSchema = commsFailed_handle(URL, e)
+            while True:
+                update = await subscription.get(settings.watch.watchHeartbeat)
+                if update is broadcast.closed:
+                    return
+                yield update
+        finally:
+            topic.unsubscribe(subscription)
+
+def watchStreams_count() -> int:
+    """
+    The number of progress streams currently open.
+    """
+    return sum(len(tracked.topic.subscribers) for tracked in workflowTracker.d_tracked.values())
+
+def statusTTL_get(boundary:map.Map, toClient:relayModel.clientResponseSchema) -> float:
+    """
+    How long a reply may be served from the status cache, based on the
+    underlying pflink workflow state. Comms failures and replies that
+    violate the pflink model are never cached.
+
+    Args:
+        boundary (map.Map): the map that produced the reply
+        toClient (relayModel.clientResponseSchema): the reply
+
+    Returns:
+        float: the TTL in seconds (0 means do not cache)
+    """
+    if toClient.ErrorComms.error or toClient.ModelViolation is not None:
+        return 0.0
+    return settings.statusCache.statusCacheTTLs.get(
+        boundary.workflowState_get(toClient),
+        settings.statusCache.statusCacheTTL
+    )
+
+async def relay_do(
+        payload             : relayModel.clientPayload,
+        test                : bool,
+        snap                : settings.Snapshot,
+        key                 : str,
+        boundary            : map.Map,
+        toPflink            : bytes | None = None,
+        source              : str = 'client'
+) -> relayModel.clientResponseSchema:
+    """
+    Perform the actual relay to pflink and cache the reply. The
+    configuration snapshot is pinned by the caller so that concurrent
+    settings changes never leak into a relay in progress. The request
+    body is serialized once and reused for the log and any retry.
+
+    Args:
+        payload (relayModel.clientPayload): the relay payload
+        test (bool): use the pflink test endpoint
+        snap (settings.Snapshot): the pinned configuration
+        key (str): the status cache key for this relay
+        boundary (map.Map): the map to transform with
+        toPflink (bytes): the request body already serialized for
+                          pflink, if available
+        source (str): who the relay is for: a 'client', a tracker
+                      'poll' or an outbox 'replay' (for the metrics)
+
+    Returns:
+        relayModel.clientResponseSchema: the response for the client
+
+    Raises:
+        deadline.DeadlineExceeded: the deadline of the relay passed
+    """
+    labels:tuple[str, str]      = relayLabels_get(payload, test, snap)
+    if toPflink is None:
+        with metricIntoTransform.time(*labels):
+            toPflink            = boundary.intoPflink_serialize(payload, snap)
+    logToStdout("Transmitting", toPflink)
+    URL:str                     = pflinkURL_get(payload, test, snap)
+    relayKey:str                = key.rpartition(':')[0]
+    hedgeURL:str | None         = pflinkHedgeURL_get(payload, test, snap, relayKey, URL)
+    toClient:relayModel.clientResponseSchema    = relayModel.clientResponseSchema()
+    token:str                   = ''
+    with metricInflight.track(*labels):
+        try:
+            token               = await pflinkToken.token_get(pflinkAuthToken_fetch)
+            toClient:relayModel.clientResponseSchema    = await pflinkPost(URL, toPflink, boundary, token, labels, hedgeURL, source)
+        except pflinkclient.PflinkRequestInvalidTokenException:
+            LOG(f"Auth token has expired while POSTing request to {URL}")
+            metricTokenRetries.inc(*labels)
+            try:
+                token           = await refreshPflinkAuthToken(stale = token)
+                toClient: relayModel.clientResponseSchema = await pflinkPost(URL, toPflink, boundary, token, labels, hedgeURL, source)
+            except deadline.DeadlineExceeded:
+                raise
+            except Exception as e:
+                toClient: relayModel.clientResponseSchema = commsFailed_handle(URL, e)
+        except pflinkclient.PflinkCircuitOpenException as e:
+            metricCircuitRejections.inc(*labels)
+            toClient:relayModel.clientResponseSchema = commsFailed_handle(URL, e)
+        except pflinkclient.PflinkRequestException as e:
+            toClient:relayModel.clientResponseSchema = commsFailed_handle(URL, e)
+    if toClient.ErrorComms.error:
+        metricCommsFailures.inc(*labels)
+    if toClient.ModelViolation is not None:
+        metricModelViolations.inc(*labels)
+    elif not toClient.ErrorComms.error:
+        seenWorkflows.set(relayKey, True, settings.hedge.hedgeSeenTTL)
+    statusCache.set(key, toClient, statusTTL_get(boundary, toClient))
     return toClient
 
 
-async def refreshPflinkAuthToken():
+async def pflinkAuthToken_fetch() -> str:
     """
-    Get a new auth token from a pflink service and update the Base settings.
+    Request a new auth token from the pflink service.
     """
-    token = await pflinkclient.Client.get_auth_token(
-            settings.pflinkAuth.pflink_auth_url,
-            settings.pflinkAuth.pflink_username,
-            settings.pflinkAuth.pflink_password
-            )
-    settings.pflinkAuth.token = token
+    auth:settings.PflinkAuth    = settings.snapshot_get().pflinkAuth
+    with metricTokenRefresh.time():
+        return await pflinkclient.Client.get_auth_token(
+                auth.pflink_auth_url,
+                auth.pflink_username,
+                auth.pflink_password,
+                client = pflinkclient.pool_get()
+                )
+
+
+async def refreshPflinkAuthToken(stale:str | None = None) -> str:
+    """
+    Get a new auth token from a pflink service. Concurrent callers
+    share a single request to pflink.
+
+    Args:
+        stale (str): the token the caller found to be invalid, if any
+
+    Returns:
+        str: the current auth token
+    """
+    return await pflinkToken.refresh(pflinkAuthToken_fetch, stale)
 
 
 async def pflinkPost(
         URL: str,
-        data: str,
-        boundary: map.Map
+        data: bytes,
+        boundary: map.Map,
+        token: str = '',
+        labels: tuple[str, str] = ('unknown', 'prod'),
+        hedgeURL: str | None = None,
+        source: str = 'client'
 ) -> relayModel.clientResponseSchema:
     """
     Make a POST request to pflink at a given service API endpoint
     Args:
         url: Service API endpoint of pflink
-        data: the request payload
+        data: the serialized request payload
+        token: the auth token to use (defaults to the current one)
+        labels: the metric labels of this relay
+        hedgeURL: a second endpoint to try if the first is slow
+        source: who the relay is for (see relay_do)
 
     Returns:
        dict: the reponse from the remote pflink server
     """
-    pfClient = pflinkclient.Client(URL, settings.pflinkAuth.token)
-    response: httpx.Response = await pfClient.post(data=data)
-    logToStdout("Reply", response.json())
-    toClient: relayModel.clientResponseSchema = boundary.fromPflink_transform(response)
-    logToStdout("Return", json.loads(toClient.json()))
+    pfClient = pflinkclient.Client(URL, token or pflinkToken.token, pflinkclient.pool_get())
+    with metricPflinkRequest.time(*labels):
+        if hedgeURL:
+            response: httpx.Response = await pflinkHedged_post(pfClient, data, hedgeURL, labels, source)
+        else:
+            response: httpx.Response = await pfClient.post(data=data)
+    logToStdout("Reply", response.content)
+    with metricFromTransform.time(*labels):
+        toClient: relayModel.clientResponseSchema = boundary.fromPflink_transform(response)
+    logToStdout("Return", toClient)
     return toClient
 
 
+# Hedges earned: each relay that could be hedged earns hedgeBudget, and
+# each hedge spends 1
+hedgeCredit:float = 0.0
 
+async def pflinkHedged_post(
+        pfClient: pflinkclient.Client,
+        data: bytes,
+        hedgeURL: str,
+        labels: tuple[str, str],
+        source: str = 'client'
+) -> httpx.Response:
+    """
+    POST to pflink, and if no answer has come after the recent latency
+    percentile of that node, POST the same request to <hedgeURL> too.
+    The first good answer (not an error or a 5xx) wins and the other
+    request is cancelled. If both fail, the first request's outcome is
+    returned (or raised).
+    """
+    global hedgeCredit
+    hedgeCredit = min(10.0, hedgeCredit + settings.hedge.hedgeBudget)
+    breaker = pflinkclient.circuits.get(pfClient.url)
+    if len(breaker.latency) < settings.hedge.hedgeMinSamples:
+        return await pfClient.post(data=data)
+    delay: float = max(settings.hedge.hedgeMinDelay, breaker.latency.percentile(settings.hedge.hedgePercentile))
+    primary: asyncio.Task = asyncio.create_task(pfClient.post(data=data))
+    l_tasks: list[asyncio.Task] = [primary]
+    try:
+        done, _ = await asyncio.wait(l_tasks, timeout=delay)
+        if done or hedgeCredit < 1.0:
+            return await primary
+        hedgeCredit -= 1.0
+        metricHedges.inc(*labels, source)
+        hedgeClient = pflinkclient.Client(hedgeURL, pfClient.auth_token, pfClient.client)
+        l_tasks.append(asyncio.create_task(hedgeClient.post(data=data)))
+        pending: set[asyncio.Task] = set(l_tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result().status_code < 500:
+                    metricHedgeWins.inc(labels[1], source, 'primary' if task is primary else 'hedge')
+                    return task.result()
+        return primary.result()
+    finally:
+        for task in l_tasks:
+            if not task.done():
+                task.cancel()
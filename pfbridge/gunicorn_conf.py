@@ -0,0 +1,21 @@
+"""
+Gunicorn configuration for the pfbridge image.
+
+This takes the image's own configuration (workers, bind address, ...,
+all set from the environment as usual) and adds a hook that marks each
+start of the server with a fresh CONFIGSTOREBOOT. Workers forked by the
+master inherit it, so the shared configuration store (see SharedConfig
+in config/settings.py) is reseeded exactly once per server start, and
+never by a worker that gunicorn restarts.
+"""
+
+import  os
+import  uuid
+
+imageConf:str = '/gunicorn_conf.py'
+if os.path.exists(imageConf):
+    with open(imageConf) as f:
+        exec(compile(f.read(), imageConf, 'exec'))
+
+def on_starting(server) -> None:
+    os.environ['CONFIGSTOREBOOT'] = uuid.uuid4().hex
@@ -0,0 +1,143 @@
+"""
+This module provides admission control: a concurrency limiter with a
+bounded FIFO wait queue and a deadline on the time spent queued.
+
+Work is admitted while fewer than `maxConcurrent` units are active.
+Beyond that, callers wait in line for a free slot. A caller is turned
+away with an `AdmissionRejected` if the line is already `maxQueue` long,
+or if it has waited `queueTimeout` seconds without being admitted. The
+rejection carries a suggested `retryAfter`, estimated from the recent
+time that admitted work holds a slot.
+"""
+
+import  asyncio
+import  math
+import  time
+from    collections         import deque
+from    contextlib          import asynccontextmanager
+from    typing              import AsyncIterator
+
+class AdmissionRejected(Exception):
+    """
+    Raised when work is not admitted. `status` is the HTTP status that
+    best describes the reason: 429 when the queue is full, 503 when the
+    queue-time deadline passed.
+    """
+
+    def __init__(self, message:str, reason:str, status:int, retryAfter:int) -> None:
+        super().__init__(message)
+        self.reason:str         = reason
+        self.status:int         = status
+        self.retryAfter:int     = retryAfter
+
+class Limiter:
+    """
+    A concurrency limiter with a bounded, deadline-aware wait queue.
+    """
+
+    def __init__(
+            self,
+            name:str,
+            maxConcurrent:int   = 64,
+            maxQueue:int        = 256,
+            queueTimeout:float  = 5.0
+    ) -> None:
+        self.name:str                           = name
+        self.maxConcurrent:int                  = max(1, maxConcurrent)
+        self.maxQueue:int                       = max(0, maxQueue)
+        self.queueTimeout:float                 = queueTimeout
+        self.active:int                         = 0
+        self.waiters:deque[asyncio.Future]      = deque()
+        self.holdTime:float                     = 0.0     # moving average of seconds a slot is held
+        self.admitted:int                       = 0
+        self.rejected:int                       = 0
+
+    def retryAfter_estimate(self) -> int:
+        """
+        Whole seconds until a newcomer would likely be admitted.
+        """
+        ahead:int = len(self.waiters) + 1
+        return max(1, math.ceil(ahead * self.holdTime / self.maxConcurrent))
+
+    def reject(self, reason:str, status:int) -> AdmissionRejected:
+        self.rejected += 1
+        return AdmissionRejected(
+            "%s relays are saturated (%s: %d active, %d queued)" %
+                (self.name, reason, self.active, len(self.waiters)),
+            reason, status, self.retryAfter_estimate()
+        )
+
+    async def acquire(self) -> None:
+        """
+        Wait for, and take, a slot.
+
+        Raises:
+            AdmissionRejected: the queue is full or the wait timed out
+        """
+        if self.active < self.maxConcurrent and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self.waiters) >= self.maxQueue:
+            raise self.reject('queue full', 429)
+        waiter:asyncio.Future = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queueTimeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait timed out
+                # (Python >= 3.12 raises rather than returning): pass it on
+                self.release()
+            else:
+                self.waiter_remove(waiter)
+            raise self.reject('queue timeout', 503)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled
+                self.release()
+            else:
+                self.waiter_remove(waiter)
+            raise
+        self.admitted += 1
+
+    def waiter_remove(self, waiter:asyncio.Future) -> None:
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self) -> None:
+        """
+        Free a slot, handing it straight to the longest waiting caller.
+        """
+        while self.waiters:
+            waiter:asyncio.Future = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """
+        Hold a slot for the duration of the block.
+        """
+        await self.acquire()
+        start:float = time.monotonic()
+        try:
+            yield
+        finally:
+            self.holdTime = 0.9 * self.holdTime + 0.1 * (time.monotonic() - start)
+            self.release()
+
+    def status(self) -> dict:
+        return {
+            'name':             self.name,
+            'active':           self.active,
+            'queued':           len(self.waiters),
+            'maxConcurrent':    self.maxConcurrent,
+            'maxQueue':         self.maxQueue,
+            'admitted':         self.admitted,
+            'rejected':         self.rejected
+        }
@@ -0,0 +1,76 @@
+"""
+This module provides a simple in-process publish/subscribe "topic".
+
+A `Topic` fans each published value out to all of its subscribers. Each
+subscriber has its own small queue; a subscriber that falls behind loses
+its oldest pending values, never the newest, so slow readers cannot hold
+up the publisher or grow memory without bound. A new subscriber first
+receives the most recently published value, if any.
+"""
+
+import  asyncio
+from    typing              import Any
+
+# Marks the end of a subscription
+closed:object = object()
+
+class Subscription:
+    """
+    One subscriber's view of a Topic.
+    """
+
+    def __init__(self, size:int = 8) -> None:
+        self.queue:asyncio.Queue    = asyncio.Queue(maxsize = max(1, size))
+
+    def put(self, value:Any) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(value)
+
+    async def get(self, timeout:float | None = None) -> Any:
+        """
+        The next value, `broadcast.closed` once the topic is closed, or
+        None if nothing arrived within <timeout> seconds.
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class Topic:
+    """
+    A set of subscriptions that published values are fanned out to.
+    """
+
+    def __init__(self, size:int = 8) -> None:
+        self.size:int                       = size
+        self.subscribers:set[Subscription]  = set()
+        self.last:Any                       = None
+        self.isClosed:bool                  = False
+
+    def subscribe(self) -> Subscription:
+        subscription:Subscription = Subscription(self.size)
+        if self.last is not None:
+            subscription.put(self.last)
+        if self.isClosed:
+            subscription.put(closed)
+        else:
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription:Subscription) -> None:
+        self.subscribers.discard(subscription)
+
+    def publish(self, value:Any) -> None:
+        self.last = value
+        for subscription in self.subscribers:
+            subscription.put(value)
+
+    def close(self) -> None:
+        """
+        End all subscriptions. Pending values are still delivered first.
+        """
+        self.isClosed = True
+        for subscription in self.subscribers:
+            subscription.put(closed)
+        self.subscribers.clear()
@@ -0,0 +1,177 @@
+"""
+This module provides per-endpoint circuit breakers with adaptive request
+timeouts.
+
+A `CircuitBreaker` guards one URL and moves between three states:
+
+    closed      -- calls go through; consecutive failures are counted
+    open        -- calls are refused at once, for `openSeconds`
+    halfOpen    -- up to `halfOpenProbes` trial calls go through; one
+                   success closes the circuit, one failure re-opens it
+
+Each breaker also keeps a window of recent successful latencies and
+derives its request timeout from them: a high percentile times a safety
+factor, clamped to [timeoutMin, timeoutMax]. Until enough samples are
+seen, timeoutMax is used.
+
+A `CircuitBoard` holds one breaker per URL, all sharing one config.
+"""
+
+import  time
+from    collections         import deque
+from    dataclasses         import dataclass, asdict
+
+@dataclass
+class CircuitConfig:
+    failureThreshold:int        = 5         # consecutive failures that open the circuit
+    openSeconds:float           = 10.0      # time an open circuit refuses calls
+    halfOpenProbes:int          = 1         # trial calls allowed when half-open
+    window:int                  = 256       # latency samples kept per URL
+    timeoutPercentile:float     = 99.0      # latency percentile the timeout follows
+    timeoutFactor:float         = 3.0       # multiple of that percentile
+    timeoutMin:float            = 1.0       # never time out sooner than this
+    timeoutMax:float            = 10.0      # never wait longer than this
+    timeoutMinSamples:int       = 20        # samples needed before adapting
+
+class LatencyWindow:
+    """
+    A ring buffer of the most recent latencies (in seconds).
+    """
+
+    def __init__(self, size:int = 256) -> None:
+        self.samples:deque[float]   = deque(maxlen = max(1, size))
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def add(self, latency:float) -> None:
+        self.samples.append(latency)
+
+    def percentile(self, p:float) -> float:
+        """
+        The nearest-rank <p>th percentile of the window, or 0 if empty.
+        """
+        if not self.samples:
+            return 0.0
+        l_sorted:list[float] = sorted(self.samples)
+        index:int = min(len(l_sorted) - 1, max(0, int(p / 100.0 * len(l_sorted) + 0.5) - 1))
+        return l_sorted[index]
+
+class CircuitBreaker:
+    """
+    The circuit breaker and latency tracker for one URL.
+
+    Callers ask `allow()` before each call and then report its outcome
+    with exactly one of `success()`, `failure()` or `release()` (the
+    last for calls that were abandoned, e.g. cancelled, and say nothing
+    about the health of the endpoint).
+    """
+
+    def __init__(self, url:str, config:CircuitConfig | None = None) -> None:
+        self.url:str                = url
+        self.config:CircuitConfig   = config if config else CircuitConfig()
+        self.state:str              = 'closed'
+        self.failures:int           = 0
+        self.openedAt:float         = 0.0
+        self.probes:int             = 0
+        self.rejected:int           = 0
+        self.latency:LatencyWindow  = LatencyWindow(self.config.window)
+
+    def allow(self) -> bool:
+        """
+        Whether a call may be made now. An open circuit turns half-open
+        once `openSeconds` have passed.
+
+        Returns:
+            bool: True if the call may proceed
+        """
+        if self.state == 'open':
+            if time.monotonic() - self.openedAt < self.config.openSeconds:
+                self.rejected += 1
+                return False
+            self.state      = 'halfOpen'
+            self.probes     = 0
+        if self.state == 'halfOpen':
+            if self.probes >= self.config.halfOpenProbes:
+                self.rejected += 1
+                return False
+            self.probes += 1
+        return True
+
+    def success(self, latency:float) -> None:
+        self.latency.add(latency)
+        self.failures   = 0
+        if self.state == 'halfOpen':
+            self.probes = 0
+        self.state      = 'closed'
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.state == 'halfOpen' or self.failures >= self.config.failureThreshold:
+            self.state      = 'open'
+            self.openedAt   = time.monotonic()
+            self.probes     = 0
+
+    def release(self) -> None:
+        if self.state == 'halfOpen' and self.probes:
+            self.probes -= 1
+
+    def retryAfter(self) -> float:
+        """
+        Seconds until an open circuit will let a trial call through.
+        """
+        if self.state != 'open':
+            return 0.0
+        return max(0.0, self.config.openSeconds - (time.monotonic() - self.openedAt))
+
+    def timeout(self) -> float:
+        """
+        The request timeout to use now, adapted to the observed latency.
+        """
+        cfg:CircuitConfig = self.config
+        if len(self.latency) < cfg.timeoutMinSamples:
+            return cfg.timeoutMax
+        return min(cfg.timeoutMax,
+                   max(cfg.timeoutMin, cfg.timeoutFactor * self.latency.percentile(cfg.timeoutPercentile)))
+
+    def status(self) -> dict:
+        return {
+            'url':              self.url,
+            'state':            self.state,
+            'failures':         self.failures,
+            'rejected':         self.rejected,
+            'retryAfter':       self.retryAfter(),
+            'timeout':          self.timeout(),
+            'samples':          len(self.latency),
+            'latencyP50':       self.latency.percentile(50),
+            'latencyP99':       self.latency.percentile(99)
+        }
+
+class CircuitBoard:
+    """
+    One CircuitBreaker per URL, created on first use.
+    """
+
+    def __init__(self, config:CircuitConfig | None = None) -> None:
+        self.config:CircuitConfig                   = config if config else CircuitConfig()
+        self.d_breakers:dict[str, CircuitBreaker]   = {}
+
+    def configure(self, **fields) -> None:
+        """
+        Replace the config of the board and of all existing breakers.
+        Latency windows are resized, keeping their newest samples.
+        """
+        self.config = CircuitConfig(**{**asdict(self.config), **fields})
+        for breaker in self.d_breakers.values():
+            breaker.config  = self.config
+            breaker.latency.samples = deque(breaker.latency.samples, maxlen = max(1, self.config.window))
+
+    def get(self, url:str) -> CircuitBreaker:
+        breaker:CircuitBreaker | None = self.d_breakers.get(url)
+        if breaker is None:
+            breaker                 = CircuitBreaker(url, self.config)
+            self.d_breakers[url]    = breaker
+        return breaker
+
+    def status(self) -> list[dict]:
+        return [breaker.status() for breaker in self.d_breakers.values()]
@@ -0,0 +1,196 @@
+"""
+This module provides a small configuration store, shared by all worker
+processes of one `pfbridge` deployment through a local SQLite file.
+
+The store holds named JSON documents (configuration sections) and a
+monotonic version that every committed change increments. Changes are
+read-modify-write transactions, so concurrent updates from different
+workers never overwrite each other.
+
+Workers learn of changes made by others by polling SQLite's
+`PRAGMA data_version`, which only changes when another connection has
+committed to the database. Polling it costs a few microseconds, so it
+can be done every few milliseconds.
+
+The store file is created readable by its owner only, in a directory
+that is created likewise if need be.
+
+A store is tied to one "boot" of the deployment: when it is seeded by a
+new boot (e.g. after a server restart) its contents are replaced, so
+that runtime changes still revert to the startup settings on restart.
+"""
+
+import  asyncio
+import  json
+import  os
+import  sqlite3
+import  threading
+from    typing              import Callable
+
+from    loguru              import logger
+
+def file_secure(path:str) -> None:
+    """
+    Create <path> (and its directory) accessible by the owner only,
+    unless it already exists. SQLite gives its -wal and -shm files the
+    permissions of the database file.
+    """
+    directory:str = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode = 0o700, exist_ok = True)
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+    except FileExistsError:
+        pass
+
+class ConfigStore:
+    """
+    A versioned set of JSON documents in a SQLite file.
+    """
+
+    def __init__(self, path:str) -> None:
+        self.path:str                       = path
+        file_secure(path)
+        self.lock:threading.Lock            = threading.Lock()
+        self.db:sqlite3.Connection          = sqlite3.connect(
+            path,
+            timeout             = 10.0,
+            isolation_level     = None,
+            check_same_thread   = False
+        )
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self.dataVersion:int                = self.dataVersion_get()
+        self.watchTask:asyncio.Task | None  = None
+
+    def dataVersion_get(self) -> int:
+        with self.lock:
+            return self.db.execute('PRAGMA data_version').fetchone()[0]
+
+    def changed(self) -> bool:
+        """
+        Whether another connection has committed since the last call.
+        """
+        current:int         = self.dataVersion_get()
+        isChanged:bool      = current != self.dataVersion
+        self.dataVersion    = current
+        return isChanged
+
+    def meta_get(self, key:str, default:str = '') -> str:
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def meta_set(self, key:str, value:str) -> None:
+        self.db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def version_bump(self) -> int:
+        version:int = int(self.meta_get('version', '0')) + 1
+        self.meta_set('version', str(version))
+        return version
+
+    def version(self) -> int:
+        with self.lock:
+            return int(self.meta_get('version', '0'))
+
+    def seed(self, d_documents:dict[str, dict], boot:str) -> bool:
+        """
+        Replace the contents of the store with <d_documents>, unless the
+        store was already seeded by the same <boot>.
+
+        Returns:
+            bool: True if the store was (re)seeded
+        """
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                if self.meta_get('boot') == boot:
+                    self.db.execute('COMMIT')
+                    return False
+                self.db.execute('DELETE FROM config')
+                self.db.executemany('INSERT INTO config (key, value) VALUES (?, ?)',
+                                    [(k, json.dumps(v)) for k, v in d_documents.items()])
+                self.meta_set('boot', boot)
+                self.version_bump()
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+        return True
+
+    def load(self) -> tuple[int, dict[str, dict]]:
+        """
+        Returns:
+            tuple[int, dict[str, dict]]: the version and all documents
+        """
+        with self.lock:
+            self.db.execute('BEGIN')
+            try:
+                version:int = int(self.meta_get('version', '0'))
+                d_documents:dict[str, dict] = {
+                    k: json.loads(v) for k, v in self.db.execute('SELECT key, value FROM config')
+                }
+            finally:
+                self.db.execute('COMMIT')
+        return version, d_documents
+
+    def update(self, key:str, change:Callable[[dict | None], dict | None]) -> int:
+        """
+        Atomically replace the document <key> with change(current), where
+        current is None if there is no such document yet. If change()
+        returns None, nothing is written.
+
+        Returns:
+            int: the store version after the update
+        """
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                row                 = self.db.execute('SELECT value FROM config WHERE key = ?', (key,)).fetchone()
+                value:dict | None   = change(json.loads(row[0]) if row else None)
+                if value is not None:
+                    self.db.execute('INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)',
+                                    (key, json.dumps(value)))
+                    version:int     = self.version_bump()
+                else:
+                    version:int     = int(self.meta_get('version', '0'))
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+        return version
+
+    def watch_do(self, callback:Callable[[], None]) -> None:
+        if self.changed():
+            callback()
+
+    async def watch_run(self, callback:Callable[[], None], interval:float) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.watch_do, callback)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"config store: reload failed: {e}")
+            await asyncio.sleep(interval)
+
+    def watch_start(self, callback:Callable[[], None], interval:float = 0.05) -> None:
+        """
+        Call <callback> (off the event loop, in a thread) whenever another
+        process has changed the store, checking every <interval> seconds.
+        """
+        if self.watchTask is None or self.watchTask.done():
+            self.watchTask = asyncio.create_task(self.watch_run(callback, interval))
+
+    async def watch_stop(self) -> None:
+        if self.watchTask is not None:
+            self.watchTask.cancel()
+            try:
+                await self.watchTask
+            except asyncio.CancelledError:
+                pass
+        self.watchTask = None
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
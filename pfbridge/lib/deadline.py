@@ -0,0 +1,89 @@
+"""
+This module provides request deadlines.
+
+A `Deadline` is the (monotonic) time by which the result of some work is
+no longer wanted. The deadline of the work in progress is carried in a
+context variable, so that it reaches every step of that work (token
+refresh, the POST to `pflink`, ...) without being passed through each
+call. Work started without a deadline is unbounded.
+
+Work shared by several callers (see `lib/singleflight.py`) runs until
+the latest of their deadlines: a caller with a later (or no) deadline
+extends the deadline of the shared work.
+"""
+
+import  contextvars
+import  time
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when work runs out of time.
+    """
+
+class Deadline:
+    """
+    A point in (monotonic) time, or None for no deadline.
+    """
+
+    def __init__(self, at:float | None = None) -> None:
+        self.at:float | None = at
+
+    def extend(self, at:float | None) -> None:
+        """
+        Push the deadline out to <at> if that is later (None is latest).
+        """
+        if self.at is not None:
+            self.at = None if at is None else max(self.at, at)
+
+    def remaining(self) -> float | None:
+        """
+        Seconds left, or None if there is no deadline.
+        """
+        if self.at is None:
+            return None
+        return self.at - time.monotonic()
+
+    def isExpired(self) -> bool:
+        return self.at is not None and time.monotonic() >= self.at
+
+current:contextvars.ContextVar[Deadline | None] = contextvars.ContextVar('deadline', default = None)
+
+def remaining() -> float | None:
+    """
+    Seconds left for the current work, or None if it has no deadline.
+    """
+    deadline:Deadline | None = current.get()
+    return None if deadline is None else deadline.remaining()
+
+def check(what:str = 'request') -> None:
+    """
+    Fail fast if the deadline of the current work has passed.
+
+    Raises:
+        DeadlineExceeded: it has
+    """
+    deadline:Deadline | None = current.get()
+    if deadline is not None and deadline.isExpired():
+        raise DeadlineExceeded("Deadline exceeded before %s" % what)
+
+def timeout_parse(value:str | None, margin:float = 0.0, default:float = 0.0) -> float | None:
+    """
+    The deadline for a request given a timeout of <value> seconds (e.g.
+    from a request header), less <margin> seconds to answer in. Without
+    a value, <default> seconds (0 for no deadline) is used.
+
+    Returns:
+        float | None: the monotonic deadline, or None
+
+    Raises:
+        ValueError: <value> is not a positive number of seconds
+    """
+    if value is None or value == '':
+        if default <= 0:
+            return None
+        seconds:float = default
+    else:
+        seconds = float(value)
+        if not seconds > 0:
+            raise ValueError("timeout must be a positive number of seconds, not %r" % value)
+    return time.monotonic() + max(0.0, seconds - margin)
@@ -0,0 +1,67 @@
+"""
+This module provides a consistent-hash ring, used to spread workflows
+over a pool of `pflink` nodes.
+
+Each node is placed on the ring at `replicas` pseudo-random points
+("virtual nodes"), and a key belongs to the first node found clockwise
+from the key's own point. Adding or removing a node only moves the keys
+of that node, and a node that is skipped (e.g. while unhealthy) hands
+its keys to the following nodes on the ring, spread over the whole
+pool, while every other key stays where it was.
+"""
+
+import  bisect
+import  hashlib
+from    typing              import Callable, Iterator
+
+class HashRing:
+    """
+    An immutable consistent-hash ring over a list of nodes.
+    """
+
+    def __init__(self, nodes:list[str], replicas:int = 160) -> None:
+        self.nodes:tuple[str, ...]          = tuple(dict.fromkeys(nodes))
+        l_points:list[tuple[int, str]]      = sorted(
+            (self.hash('%s#%d' % (node, replica)), node)
+            for node in self.nodes
+            for replica in range(max(1, replicas))
+        )
+        self.points:list[int]               = [point for point, _ in l_points]
+        self.owners:list[str]               = [node for _, node in l_points]
+
+    @staticmethod
+    def hash(key:str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def nodes_iter(self, key:str) -> Iterator[str]:
+        """
+        The distinct nodes in ring order, starting from the owner of <key>.
+        """
+        if not self.points:
+            return
+        start:int           = bisect.bisect(self.points, self.hash(key))
+        seen:set[str]       = set()
+        for i in range(len(self.points)):
+            node:str        = self.owners[(start + i) % len(self.points)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
+
+    def node_get(self, key:str, isHealthy:Callable[[str], bool] | None = None) -> str | None:
+        """
+        The node for <key>: its owner, or if that is not healthy the next
+        healthy node on the ring. If no node is healthy, the owner is
+        returned anyway.
+
+        Returns:
+            str | None: the node, or None if the ring is empty
+        """
+        owner:str | None = None
+        for node in self.nodes_iter(key):
+            if owner is None:
+                owner = node
+            if isHealthy is None or isHealthy(node):
+                return node
+        return owner
@@ -0,0 +1,103 @@
+"""
+This module provides active health checking of a set of URLs.
+
+A background task probes every URL each `interval` seconds. A URL is
+marked unhealthy after `fall` consecutive failed probes and healthy
+again after `rise` consecutive successful ones, so that a single slow
+or lost probe does not flap it. URLs that have not been probed yet are
+taken to be healthy.
+"""
+
+import  asyncio
+import  time
+from    dataclasses         import dataclass
+from    typing              import Awaitable, Callable
+
+@dataclass
+class NodeHealth:
+    url:str
+    healthy:bool            = True
+    failures:int            = 0         # consecutive failed probes
+    successes:int           = 0         # consecutive successful probes
+    lastCheck:float         = 0.0       # epoch seconds
+    latency:float           = 0.0       # seconds taken by the last probe
+    lastError:str           = ''
+
+# probe(url) raises if the URL is not healthy
+ProbeFunction = Callable[[str], Awaitable[None]]
+
+class HealthChecker:
+    """
+    Periodic probes of a (changing) set of URLs.
+    """
+
+    def __init__(
+            self,
+            probe:ProbeFunction,
+            interval:float      = 5.0,
+            fall:int            = 2,
+            rise:int            = 2
+    ) -> None:
+        self.probe:ProbeFunction                = probe
+        self.interval:float                     = interval
+        self.fall:int                           = max(1, fall)
+        self.rise:int                           = max(1, rise)
+        self.d_nodes:dict[str, NodeHealth]      = {}
+        self.task:asyncio.Task | None           = None
+
+    def isHealthy(self, url:str) -> bool:
+        node:NodeHealth | None = self.d_nodes.get(url)
+        return node is None or node.healthy
+
+    async def check(self, url:str) -> NodeHealth:
+        """
+        Probe <url> once and update its health.
+        """
+        node:NodeHealth     = self.d_nodes.setdefault(url, NodeHealth(url = url))
+        start:float         = time.perf_counter()
+        try:
+            await self.probe(url)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            node.failures  += 1
+            node.successes  = 0
+            node.lastError  = str(e)
+            if node.failures >= self.fall:
+                node.healthy = False
+        else:
+            node.successes += 1
+            node.failures   = 0
+            if node.successes >= self.rise:
+                node.healthy = True
+        node.latency        = time.perf_counter() - start
+        node.lastCheck      = time.time()
+        return node
+
+    async def run(self, urls:Callable[[], list[str]]) -> None:
+        """
+        Probe the current <urls>() every `interval` seconds, forgetting
+        URLs that are no longer listed.
+        """
+        while True:
+            l_urls:list[str] = urls()
+            for url in set(self.d_nodes) - set(l_urls):
+                del self.d_nodes[url]
+            await asyncio.gather(*[self.check(url) for url in l_urls])
+            await asyncio.sleep(self.interval)
+
+    def start(self, urls:Callable[[], list[str]]) -> None:
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run(urls))
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+
+    def status(self) -> list[dict]:
+        return [node.__dict__.copy() for node in self.d_nodes.values()]
@@ -0,0 +1,156 @@
+"""
+This module provides a queued, JSON-lines event log.
+
+Callers hand records (dicts, pydantic models, or already serialized JSON
+bytes/str) to `JSONLog.emit()`, which only enqueues them. A background
+thread serializes each record exactly once, as one compact JSON line, and
+writes the lines out in batches. Nothing is serialized or written on the
+caller's (async) thread.
+
+Each named stage has a verbosity:
+
+    0   -- do not log the stage at all
+    1   -- log a summary (only the scalar top-level fields of the record)
+    2   -- log the full record
+
+and a sampling rate `sampleEvery` of N logs only one in N sampled units
+(e.g. relays) at full detail, the rest being capped at summary level.
+"""
+
+import  contextvars
+import  itertools
+import  json
+import  queue
+import  sys
+import  threading
+from    datetime            import datetime
+from    typing              import Any, TextIO
+
+from    pydantic            import BaseModel
+
+# Whether the current unit of work (e.g. relay) is logged at full detail
+fullDetail: contextvars.ContextVar[bool] = contextvars.ContextVar('fullDetail', default = True)
+
+def json_default(obj:Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    if isinstance(obj, (bytes, bytearray)):
+        try:
+            return json.loads(obj)
+        except ValueError:
+            return obj.decode(errors = 'replace')
+    return str(obj)
+
+def record_summarize(record:Any) -> dict:
+    """
+    Reduce a record to its scalar top-level fields.
+    """
+    if isinstance(record, BaseModel):
+        record = record.dict()
+    elif isinstance(record, (bytes, bytearray, str)):
+        try:
+            record = json.loads(record)
+        except ValueError:
+            return {'text': str(record[:80])}
+    if not isinstance(record, dict):
+        return {'value': str(record)}
+    return {k: v for k, v in record.items()
+            if isinstance(v, (str, int, float, bool)) or v is None}
+
+class JSONLog:
+    """
+    A JSON-lines log written from a background thread.
+    """
+
+    def __init__(
+            self,
+            stages:dict[str, int]   = {},
+            sampleEvery:int         = 1,
+            queueSize:int           = 10000,
+            stream:TextIO | None    = None
+    ) -> None:
+        self.stages:dict[str, int]          = dict(stages)
+        self.sampleEvery:int                = max(1, sampleEvery)
+        self.stream:TextIO                  = stream if stream else sys.stdout
+        self.queue:queue.Queue              = queue.Queue(maxsize = queueSize)
+        self.counter                        = itertools.count()
+        self.dropped:int                    = 0
+        self.thread:threading.Thread | None = None
+        self.startLock:threading.Lock       = threading.Lock()
+
+    def sample(self) -> bool:
+        """
+        Decide whether the current unit of work is logged at full detail
+        and remember the decision (in a context variable) for all the
+        stages it emits, including those in tasks it spawns.
+
+        Returns:
+            bool: True if the unit is logged at full detail
+        """
+        full:bool = next(self.counter) % self.sampleEvery == 0
+        fullDetail.set(full)
+        return full
+
+    def emit(self, stage:str, record:Any) -> None:
+        """
+        Enqueue a record for <stage>. Never blocks: if the queue is full
+        the record is dropped (and counted).
+
+        Args:
+            stage (str): the stage name, which selects the verbosity
+            record (Any): a dict, pydantic model, or serialized JSON
+        """
+        verbosity:int = self.stages.get(stage, 2)
+        if not verbosity:
+            return
+        full:bool = verbosity >= 2 and fullDetail.get()
+        try:
+            self.queue.put_nowait((datetime.now(), stage, record, full))
+        except queue.Full:
+            self.dropped += 1
+        if self.thread is None:
+            self.start()
+
+    def line_make(self, timestamp:datetime, stage:str, record:Any, full:bool) -> str:
+        head:str = '{"_timestamp":"%s","stage":%s,"record":' % (timestamp, json.dumps(stage))
+        if not full:
+            record = record_summarize(record)
+        return head + json.dumps(record, separators = (',', ':'), default = json_default) + '}'
+
+    def sink_run(self) -> None:
+        stop:bool = False
+        while not stop:
+            l_items:list = [self.queue.get()]
+            while True:
+                try:
+                    l_items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            l_lines:list[str] = []
+            for item in l_items:
+                if item is None:
+                    stop = True
+                    continue
+                try:
+                    l_lines.append(self.line_make(*item))
+                except Exception as e:
+                    l_lines.append(json.dumps({'stage': item[1], 'logError': str(e)}))
+            if l_lines:
+                self.stream.write('\n'.join(l_lines) + '\n')
+                self.stream.flush()
+
+    def start(self) -> None:
+        with self.startLock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target = self.sink_run, name = 'jsonlog', daemon = True)
+                self.thread.start()
+
+    def stop(self, timeout:float = 5.0) -> None:
+        """
+        Flush any queued records and stop the writer thread.
+        """
+        with self.startLock:
+            if self.thread is not None and self.thread.is_alive():
+                self.queue.put(None)
+                self.thread.join(timeout)
+            self.thread = None
@@ -0,0 +1,268 @@
+"""
+This module provides a persistent ledger of relayed workflows in a
+local SQLite file.
+
+The ledger keeps one row per workflow (its identifying DICOM tags,
+analysis, latest mapped state and counters) and one event row for every
+change of that state. Workflows are indexed by StudyInstanceUID,
+SeriesInstanceUID, AccessionNumber and analyzeFunction.
+
+The ledger holds patient study identifiers, so its file is created
+readable by its owner only (see configstore.file_secure).
+
+Recording never blocks the caller: records are queued and written, in
+batched transactions, by a background thread. Records that are dropped
+because the queue is full, or lost because their batch failed to
+write, are counted in `dropped` and `failed`. Queries read through
+per-thread connections and page with an opaque "before" cursor (the row
+id of the last item of the previous page), newest first.
+"""
+
+import  json
+import  queue
+import  sqlite3
+import  threading
+import  time
+from    typing              import Any
+
+from    loguru              import logger
+
+from    lib                 import configstore
+
+schema:list[str] = [
+    '''CREATE TABLE IF NOT EXISTS workflows (
+        id                  INTEGER PRIMARY KEY,
+        key                 TEXT UNIQUE NOT NULL,
+        StudyInstanceUID    TEXT,
+        SeriesInstanceUID   TEXT,
+        AccessionNumber     TEXT,
+        analyzeFunction     TEXT,
+        test                INTEGER,
+        firstSeen           REAL,
+        lastSeen            REAL,
+        relays              INTEGER DEFAULT 0,
+        polls               INTEGER DEFAULT 0,
+        pflinkState         TEXT,
+        State               TEXT,
+        Status              INTEGER,
+        ProgressPerc        INTEGER,
+        ErrorWorkflow       TEXT,
+        response            TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS workflows_study    ON workflows (StudyInstanceUID)',
+    'CREATE INDEX IF NOT EXISTS workflows_series   ON workflows (SeriesInstanceUID)',
+    'CREATE INDEX IF NOT EXISTS workflows_accession ON workflows (AccessionNumber)',
+    'CREATE INDEX IF NOT EXISTS workflows_analysis ON workflows (analyzeFunction)',
+    'CREATE INDEX IF NOT EXISTS workflows_lastSeen ON workflows (lastSeen)',
+    '''CREATE TABLE IF NOT EXISTS events (
+        id                  INTEGER PRIMARY KEY,
+        key                 TEXT NOT NULL,
+        timestamp           REAL,
+        pflinkState         TEXT,
+        State               TEXT,
+        Status              INTEGER,
+        ProgressPerc        INTEGER,
+        ErrorWorkflow       TEXT,
+        error               TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS events_key ON events (key, id)'
+]
+
+# The columns a workflow query may filter on
+indexedFields:list[str] = ['StudyInstanceUID', 'SeriesInstanceUID', 'AccessionNumber', 'analyzeFunction']
+
+class Ledger:
+    """
+    A SQLite workflow ledger with a queued, background writer.
+    """
+
+    def __init__(self, path:str, queueSize:int = 10000, maxAge:float = 90 * 86400.0) -> None:
+        self.path:str                       = path
+        self.maxAge:float                   = maxAge
+        self.queue:queue.Queue              = queue.Queue(maxsize = queueSize)
+        self.local:threading.local          = threading.local()
+        self.dropped:int                    = 0
+        self.failed:int                     = 0
+        self.lastPurge:float                = 0.0
+        self.thread:threading.Thread | None = None
+        configstore.file_secure(path)
+        db:sqlite3.Connection               = self.connect()
+        db.execute('PRAGMA journal_mode=WAL')
+        for statement in schema:
+            db.execute(statement)
+
+    def connect(self) -> sqlite3.Connection:
+        db:sqlite3.Connection = sqlite3.connect(self.path, timeout = 10.0, isolation_level = None)
+        db.row_factory = sqlite3.Row
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def reader(self) -> sqlite3.Connection:
+        db:sqlite3.Connection | None = getattr(self.local, 'db', None)
+        if db is None:
+            db              = self.connect()
+            self.local.db   = db
+        return db
+
+    def record(
+            self,
+            key:str,
+            d_meta:dict[str, str],
+            test:bool,
+            pflinkState:str,
+            d_response:dict,
+            isPoll:bool = False
+    ) -> None:
+        """
+        Queue a relay (or, if <isPoll>, a background poll) of workflow
+        <key> and its mapped response. Never blocks: if the queue is
+        full the record is dropped (and counted).
+
+        Args:
+            key (str): the workflow key
+            d_meta (dict): the indexed fields of the workflow
+            test (bool): whether the pflink test endpoint was used
+            pflinkState (str): the underlying pflink workflow state
+            d_response (dict): the mapped client response
+            isPoll (bool): a background poll rather than a client relay
+        """
+        try:
+            self.queue.put_nowait((time.time(), key, d_meta, test, pflinkState, d_response, isPoll))
+        except queue.Full:
+            self.dropped += 1
+        if self.thread is None:
+            self.start()
+
+    def write(self, db:sqlite3.Connection, item:tuple) -> None:
+        timestamp, key, d_meta, test, pflinkState, d_response, isPoll = item
+        errorComms:str          = (d_response.get('ErrorComms') or {}).get('error', '')
+        d_state:dict            = {
+            'pflinkState':      pflinkState,
+            'State':            d_response.get('State', ''),
+            'Status':           int(bool(d_response.get('Status'))),
+            'ProgressPerc':     d_response.get('ProgressPerc', 0),
+            'ErrorWorkflow':    d_response.get('ErrorWorkflow', '')
+        }
+        row = db.execute('SELECT pflinkState, State, Status, ProgressPerc, ErrorWorkflow FROM workflows WHERE key = ?',
+                         (key,)).fetchone()
+        if row is None:
+            db.execute(
+                '''INSERT INTO workflows (key, StudyInstanceUID, SeriesInstanceUID, AccessionNumber,
+                       analyzeFunction, test, firstSeen, lastSeen, relays, polls)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, 0)''',
+                (key, *[d_meta.get(field, '') for field in indexedFields], int(test), timestamp, timestamp)
+            )
+        db.execute(
+            '''UPDATE workflows SET lastSeen = ?, relays = relays + ?, polls = polls + ?,
+                   pflinkState = ?, State = ?, Status = ?, ProgressPerc = ?, ErrorWorkflow = ?, response = ?
+               WHERE key = ?''',
+            (timestamp, int(not isPoll), int(isPoll), *d_state.values(), json.dumps(d_response), key)
+        )
+        if row is None or tuple(row) != tuple(d_state.values()):
+            db.execute(
+                '''INSERT INTO events (key, timestamp, pflinkState, State, Status, ProgressPerc, ErrorWorkflow, error)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                (key, timestamp, *d_state.values(), errorComms)
+            )
+
+    def purge(self, db:sqlite3.Connection) -> None:
+        """
+        Remove workflows (and their events) not seen for `maxAge` seconds.
+        """
+        cutoff:float = time.time() - self.maxAge
+        db.execute('BEGIN IMMEDIATE')
+        db.execute('DELETE FROM events WHERE key IN (SELECT key FROM workflows WHERE lastSeen < ?)', (cutoff,))
+        db.execute('DELETE FROM workflows WHERE lastSeen < ?', (cutoff,))
+        db.execute('COMMIT')
+        self.lastPurge = time.time()
+
+    def sink_run(self) -> None:
+        db:sqlite3.Connection   = self.connect()
+        stop:bool               = False
+        while not stop:
+            l_items:list = [self.queue.get()]
+            while True:
+                try:
+                    l_items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                db.execute('BEGIN IMMEDIATE')
+                for item in l_items:
+                    if item is None:
+                        stop = True
+                        continue
+                    self.write(db, item)
+                db.execute('COMMIT')
+                if self.maxAge > 0 and time.time() - self.lastPurge > 3600:
+                    self.purge(db)
+            except Exception as e:
+                if db.in_transaction:
+                    db.execute('ROLLBACK')
+                self.failed += sum(item is not None for item in l_items)
+                logger.error(f"ledger: write failed: {e}")
+        db.close()
+
+    def start(self) -> None:
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target = self.sink_run, name = 'ledger', daemon = True)
+            self.thread.start()
+
+    def stop(self, timeout:float = 5.0) -> None:
+        """
+        Write any queued records and stop the writer thread.
+        """
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout)
+        self.thread = None
+
+    def workflows_query(
+            self,
+            d_filter:dict[str, str],
+            limit:int           = 50,
+            before:int | None   = None
+    ) -> tuple[list[dict], int | None]:
+        """
+        Page through the workflows matching <d_filter> (on the indexed
+        fields), newest first.
+
+        Returns:
+            tuple[list[dict], int | None]: the page, and the cursor for
+                                           the next page (None if last)
+        """
+        l_where:list[str]   = ['%s = ?' % field for field in indexedFields if d_filter.get(field)]
+        l_args:list[Any]    = [d_filter[field] for field in indexedFields if d_filter.get(field)]
+        if before is not None:
+            l_where.append('id < ?')
+            l_args.append(before)
+        where:str           = ('WHERE ' + ' AND '.join(l_where)) if l_where else ''
+        rows = self.reader().execute(
+            'SELECT * FROM workflows %s ORDER BY id DESC LIMIT ?' % where, (*l_args, limit + 1)
+        ).fetchall()
+        l_items:list[dict]  = [self.row_decode(row) for row in rows[:limit]]
+        return l_items, (l_items[-1]['id'] if len(rows) > limit else None)
+
+    def events_query(
+            self,
+            key:str,
+            limit:int           = 50,
+            before:int | None   = None
+    ) -> tuple[list[dict], int | None]:
+        """
+        Page through the state changes of workflow <key>, newest first.
+        """
+        rows = self.reader().execute(
+            'SELECT * FROM events WHERE key = ? AND id < ? ORDER BY id DESC LIMIT ?',
+            (key, before if before is not None else 2**63 - 1, limit + 1)
+        ).fetchall()
+        l_items:list[dict]  = [dict(row) for row in rows[:limit]]
+        return l_items, (l_items[-1]['id'] if len(rows) > limit else None)
+
+    @staticmethod
+    def row_decode(row:sqlite3.Row) -> dict:
+        d_row:dict          = dict(row)
+        d_row['test']       = bool(d_row['test'])
+        d_row['Status']     = bool(d_row['Status'])
+        d_row['response']   = json.loads(d_row['response']) if d_row['response'] else None
+        return d_row
@@ -8,37 +8,172 @@ clinical payload is "mapped" into one suitable for `pflink`.
 On the "output" (or "return" from `pflink`) side, the `pflink` response
 is mapped into a simpler resultant suitable for consumption by the clinical
 service.
+
+The constant parts of the `pflink` payload are compiled once per settings
+version into a `PflinkTemplate`, so that each relay only serializes its
+PACS directive (and any dynamic workflow fields) and splices it in.
 """
 
 from models         import relayModel
 from config         import settings
 import              httpx
+import              json
+
+def json_bytes(obj) -> bytes:
+    return json.dumps(obj, separators = (',', ':')).encode()
+
+class PflinkTemplate:
+    """
+    The serialized `pflinkInput` for one analysis under one settings
+    version, split around the per-request PACS directive:
+
+        head + PACS_directive + workflow_info + tail
+
+    The workflow_info is serialized here too, unless the analysis
+    plugin arguments contain dynamic tags (like %timestamp) that must
+    be decoded afresh for every relay.
+    """
+
+    def __init__(self, snap:settings.Snapshot, analyzeFunction:str) -> None:
+        self.version:int                = snap.version
+        self.analyzeFunction:str        = analyzeFunction
+        self.analysis:settings.DylldAnalysis | None = snap.analyses.get(analyzeFunction)
+        pflinkPOST:relayModel.pflinkInput = relayModel.pflinkInput()
+        pflinkPOST.ignore_duplicate     = snap.pflink.ignore_duplicate
+        pflinkPOST.cube_user_info.username  = snap.credentialsCUBE.usernameCUBE
+        pflinkPOST.cube_user_info.password  = snap.credentialsCUBE.passwordCUBE
+        d_post:dict                     = pflinkPOST.dict()
+        self.head:bytes                 = b'{"ignore_duplicate":%s,"pfdcm_info":%s,"PACS_directive":' % (
+                                            json_bytes(d_post['ignore_duplicate']),
+                                            json_bytes(d_post['pfdcm_info']))
+        self.tail:bytes                 = b',"cube_user_info":%s}' % json_bytes(d_post['cube_user_info'])
+        self.d_workflow:dict            = d_post['workflow_info']
+        self.isDynamic:bool             = False
+        if self.analysis:
+            self.d_workflow.update({
+                'feed_name':        self.analysis.feedName,
+                'pipeline_name':    self.analysis.pipelineName,
+                'plugin_name':      self.analysis.pluginName,
+                'plugin_version':   self.analysis.pluginVersion
+            })
+            self.isDynamic              = any(tag in self.analysis.pluginArgs for tag in settings.dynamicTags)
+            self.d_workflow['plugin_params'] = settings.analysis_decode(analyzeFunction, snap).pluginArgs
+        self.workflow:bytes             = self.workflow_serialize(self.d_workflow)
+
+    @staticmethod
+    def workflow_serialize(d_workflow:dict) -> bytes:
+        return b',"workflow_info":' + json_bytes(d_workflow)
+
+    def render(self, payload:relayModel.clientPayload, snap:settings.Snapshot) -> bytes:
+        """
+        The complete pflink request body for <payload>.
+        """
+        workflow:bytes = self.workflow
+        if self.isDynamic:
+            workflow = self.workflow_serialize({
+                **self.d_workflow,
+                'plugin_params': settings.analysis_decode(self.analyzeFunction, snap).pluginArgs
+            })
+        return b''.join((self.head, json_bytes(payload.imageMeta.dict()), workflow, self.tail))
+
+# Compiled templates, by analysis name ('' for analyses not configured)
+templates:dict[str, PflinkTemplate] = {}
+
+def template_get(analyzeFunction:str, snap:settings.Snapshot) -> PflinkTemplate:
+    """
+    The PflinkTemplate for <analyzeFunction> under <snap>, compiled on
+    first use after each settings change.
+    """
+    name:str                        = analyzeFunction if analyzeFunction in snap.analyses else ''
+    template:PflinkTemplate | None  = templates.get(name)
+    if template is None or template.version != snap.version:
+        template                    = PflinkTemplate(snap, name)
+        templates[name]             = template
+    return template
+
+# The map used for any analysis without a spec of its own. A spec may
+# give any of these keys; those it leaves out are taken from here. The
+# "states" of a spec are merged over these; its "projections" replace
+# them.
+defaultSpec:dict = {
+    "name":         "Leg Length Analysis",
+    "states": {
+        "UNKNOWN":                   "An unknown state was encounted",
+        "initializing workflow":     "Initializing workflow",
+        "retrieving from PACS":      "Pulling image for analysis",
+        "pushing to swift":          "Pushing image into ChRIS",
+        "registering to CUBE":       "Registering image to ChRIS",
+        "feed created":              "Analysis created in ChRIS",
+        "analyzing study":           "Analysis running in ChRIS",
+        "completed":                 "Results available in PACS",
+        "feed deleted from CUBE":    "Analysis deleted from ChRIS",
+        "duplicate workflow exists": "Duplicate workflows found"
+    },
+    "unknownState": "Unknown state encountered",
+    "failedState":  "Workflow failed. Please check any error messages.",
+    # clientResponseSchema field <- pflink response field
+    "projections": {
+        "Status":           "status",
+        "ProgressPerc":     "workflow_progress_perc",
+        "ErrorWorkflow":    "error"
+    }
+}
 
 class Map:
     """
     A class that maps or "transforms" JSON data across a boundary.
+
+    A Map is compiled once from a declarative spec (see defaultSpec)
+    and is then reused, unchanged, by every relay of its analysis.
     """
 
-    def __init__(self, *args, **kwargs) -> None:
-        self.mapName:str        = "dylld"
+    def __init__(self, *args, spec:dict | None = None, **kwargs) -> None:
+        spec                    = spec if spec else {}
+        d_spec:dict             = {**defaultSpec, **spec}
+        d_spec["states"]        = {**defaultSpec["states"], **spec.get("states", {})}
+        self.mapName:str        = d_spec["name"]
         self.mapContext:str     = "radstar"
-        self.d_description: dict[str, str]      = \
-        {
-            "UNKNOWN":                   "An unknown state was encounted",
-            "initializing workflow":     "Initializing workflow",
-            "retrieving from PACS":      "Pulling image for analysis",
-            "pushing to swift":          "Pushing image into ChRIS",
-            "registering to CUBE":       "Registering image to ChRIS",
-            "feed created":              "Analysis created in ChRIS",
-            "analyzing study":           "Analysis running in ChRIS",
-            "completed":                 "Results available in PACS",
-            "feed deleted from CUBE":    "Analysis deleted from ChRIS",
-            "duplicate workflow exists": "Duplicate workflows found"
-        }
         for k, v in kwargs.items():
             if k == 'name'      : self.mapName  = v
+        self.d_description: dict[str, str]      = dict(d_spec["states"])
+        self.unknownState:str   = d_spec["unknownState"]
+        self.failedState:str    = d_spec["failedState"]
+        self.l_projections:list[tuple[str, str]] = list(d_spec["projections"].items())
+        self.spec_check()
+        # Compiled lookups
+        self.state_describe     = self.d_description.get
+
+    def spec_check(self) -> None:
+        """
+        Reject a spec that could only fail (or mislead) once relays use
+        it: projections between fields the client or pflink responses do
+        not have, and states sharing a description, which clients could
+        not tell apart.
+
+        Raises:
+            ValueError: the spec is invalid
+        """
+        l_fields:list[str]  = [field for field in relayModel.clientResponseSchema.__fields__
+                               if field not in ('ModelViolation', 'ErrorComms')]
+        for clientField, pflinkField in self.l_projections:
+            if clientField not in l_fields:
+                raise ValueError("map '%s': cannot project onto '%s' (not one of %s)" %
+                                 (self.mapName, clientField, ', '.join(l_fields)))
+            if pflinkField not in relayModel.pflinkResponseSchema.__fields__:
+                raise ValueError("map '%s': cannot project '%s' from '%s' (not a pflink response field)" %
+                                 (self.mapName, clientField, pflinkField))
+        d_seen:dict[str, str] = {}
+        for state, description in self.d_description.items():
+            if description in d_seen:
+                raise ValueError("map '%s': states '%s' and '%s' have the same description '%s'" %
+                                 (self.mapName, d_seen[description], state, description))
+            d_seen[description] = state
 
-    def intoPflink_transform(self, payload:relayModel.clientPayload) -> relayModel.pflinkInput:
+    def intoPflink_transform(
+            self,
+            payload:relayModel.clientPayload,
+            snap:settings.Snapshot | None = None
+    ) -> relayModel.pflinkInput:
         """
         Convert the payload received from the clinical service into
         a payload suitable for `pflink`.
@@ -46,24 +181,51 @@ class Map:
         Args:
             payload (relayModel.clientPayload): the imageMeta to process and
                                                 analysis to perform
+            snap (settings.Snapshot): the configuration pinned for this
+                                      request (default current)
 
         Returns:
             relayModel.pflinkInput: a payload suitable for relaying on to `pflink`.
         """
+        snap                                 = snap if snap else settings.snapshot_get()
         pflinkPOST:relayModel.pflinkInput    = relayModel.pflinkInput()
-        pflinkPOST.ignore_duplicate          = settings.pflink.ignore_duplicate
+        pflinkPOST.ignore_duplicate          = snap.pflink.ignore_duplicate
         pflinkPOST.PACS_directive            = payload.imageMeta
-        pflinkPOST.cube_user_info.username   = settings.credentialsCUBE.usernameCUBE
-        pflinkPOST.cube_user_info.password   = settings.credentialsCUBE.passwordCUBE
-        if settings.analyses.analyses.get(payload.analyzeFunction):
-            pflinkPOST.workflow_info.feed_name      = settings.analyses.analyses[payload.analyzeFunction].feedName
-            pflinkPOST.workflow_info.pipeline_name  = settings.analyses.analyses[payload.analyzeFunction].pipelineName
-            pflinkPOST.workflow_info.plugin_name    = settings.analyses.analyses[payload.analyzeFunction].pluginName
-            pflinkPOST.workflow_info.plugin_version = settings.analyses.analyses[payload.analyzeFunction].pluginVersion
-            decoded = settings.analysis_decode(payload.analyzeFunction)
+        pflinkPOST.cube_user_info.username   = snap.credentialsCUBE.usernameCUBE
+        pflinkPOST.cube_user_info.password   = snap.credentialsCUBE.passwordCUBE
+        analysis:settings.DylldAnalysis | None  = snap.analyses.get(payload.analyzeFunction)
+        if analysis:
+            pflinkPOST.workflow_info.feed_name      = analysis.feedName
+            pflinkPOST.workflow_info.pipeline_name  = analysis.pipelineName
+            pflinkPOST.workflow_info.plugin_name    = analysis.pluginName
+            pflinkPOST.workflow_info.plugin_version = analysis.pluginVersion
+            decoded = settings.analysis_decode(payload.analyzeFunction, snap)
             pflinkPOST.workflow_info.plugin_params  = decoded.pluginArgs
         return pflinkPOST
 
+    def intoPflink_serialize(
+            self,
+            payload:relayModel.clientPayload,
+            snap:settings.Snapshot | None = None
+    ) -> bytes:
+        """
+        Convert the payload received from the clinical service directly
+        into the serialized (JSON) request body for `pflink`. This is
+        equivalent to `intoPflink_transform(...).json()`, but only the
+        parts that vary per request are serialized.
+
+        Args:
+            payload (relayModel.clientPayload): the imageMeta to process and
+                                                analysis to perform
+            snap (settings.Snapshot): the configuration pinned for this
+                                      request (default current)
+
+        Returns:
+            bytes: the JSON request body for `pflink`
+        """
+        snap = snap if snap else settings.snapshot_get()
+        return template_get(payload.analyzeFunction, snap).render(payload, snap)
+
     def fromPflink_transform(self, payload:httpx.Response) -> relayModel.clientResponseSchema:
         """
         The response that is ultimately returned back to the client. This is
@@ -78,16 +240,68 @@ class Map:
         """
         toClinicalService:relayModel.clientResponseSchema   = relayModel.clientResponseSchema()
         fromPflink:dict             = payload.json()
-        toClinicalService.State    = self.d_description.get(fromPflink.get('workflow_state',
-                                                                            'UNKNOWN'),
-                                                                 "Unknown state encountered")
+        toClinicalService._pflinkState  = str(fromPflink.get('workflow_state', 'UNKNOWN'))
+        toClinicalService.State    = self.state_describe(toClinicalService._pflinkState,
+                                                         self.unknownState)
         if not 'status' in fromPflink.keys():
             # Here the response from the client violates its own response model!
             toClinicalService.ModelViolation  = fromPflink
             return toClinicalService
         if not fromPflink['status']:
-            toClinicalService.State     = "Workflow failed. Please check any error messages."
-        toClinicalService.Status        = fromPflink['status']
-        toClinicalService.ProgressPerc  = fromPflink['workflow_progress_perc']
-        toClinicalService.ErrorWorkflow = fromPflink['error']
+            toClinicalService.State     = self.failedState
+        for clientField, pflinkField in self.l_projections:
+            setattr(toClinicalService, clientField, fromPflink[pflinkField])
         return toClinicalService
+
+    def workflowState_get(self, response:relayModel.clientResponseSchema) -> str:
+        """
+        The pflink `workflow_state` behind a mapped client response, as
+        carried along with it by fromPflink_transform().
+
+        Args:
+            response (relayModel.clientResponseSchema): a mapped response
+
+        Returns:
+            str: the pflink workflow state, or "UNKNOWN"
+        """
+        return response._pflinkState
+
+def specs_load(d_specs:dict[str, dict], specFile:str = '') -> dict[str, dict]:
+    """
+    Collect the map specs: those in the JSON <specFile> (if any), then
+    those in <d_specs>, keyed by analysis name.
+    """
+    d_all:dict[str, dict] = {}
+    if specFile:
+        with open(specFile) as f:
+            d_all.update(json.load(f))
+    d_all.update(d_specs)
+    return d_all
+
+def maps_compile(d_specs:dict[str, dict]) -> dict[str, Map]:
+    """
+    Compile the map specs <d_specs>, keyed by analysis name.
+
+    Raises:
+        ValueError: a spec is invalid
+    """
+    d_maps:dict[str, Map] = {}
+    for name, spec in d_specs.items():
+        try:
+            d_maps[name] = Map(spec = spec)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError("Invalid response map spec for analysis '%s': %s" % (name, e)) from e
+    return d_maps
+
+# The compiled maps, by analysis name, and the default map. Specs are
+# checked here, so that a bad one stops the server from starting.
+maps:dict[str, Map]     = maps_compile(
+    specs_load(settings.mapSpecs.mapSpecs, settings.mapSpecs.mapSpecFile)
+)
+defaultMap:Map          = Map()
+
+def map_get(analyzeFunction:str) -> Map:
+    """
+    The compiled map for <analyzeFunction>, or the default map.
+    """
+    return maps.get(analyzeFunction, defaultMap)
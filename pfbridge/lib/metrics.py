@@ -0,0 +1,193 @@
+"""
+This module provides a minimal, dependency-free set of Prometheus style
+metrics (counters, gauges and histograms, each with optional labels) and
+renders them in the Prometheus text exposition format.
+
+Updates are plain dictionary operations on the event loop thread and so
+are cheap enough to leave on in production. Note that metrics are kept
+per process: with several workers, each worker reports its own.
+"""
+
+import  abc
+import  bisect
+import  time
+from    contextlib          import contextmanager
+from    typing              import Callable, Iterator
+
+LabelValues = tuple[str, ...]
+
+def labels_format(names:tuple[str, ...], values:LabelValues, extra:str = '') -> str:
+    l_pairs:list[str] = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                         for name, value in zip(names, values)]
+    if extra:
+        l_pairs.append(extra)
+    return '{%s}' % ','.join(l_pairs) if l_pairs else ''
+
+class Metric(abc.ABC):
+    """
+    Base class for a named metric family with a fixed set of label names.
+    """
+    kind:str = 'untyped'
+
+    def __init__(self, name:str, help:str, labelNames:tuple[str, ...] = ()) -> None:
+        self.name:str                   = name
+        self.help:str                   = help
+        self.labelNames:tuple[str, ...] = tuple(labelNames)
+
+    def header(self) -> list[str]:
+        return ['# HELP %s %s' % (self.name, self.help),
+                '# TYPE %s %s' % (self.name, self.kind)]
+
+    @abc.abstractmethod
+    def render(self) -> list[str]:
+        """
+        The exposition lines of this metric family, header included.
+        """
+
+class Counter(Metric):
+    kind:str = 'counter'
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.d_values:dict[LabelValues, float] = {}
+        self.d_functions:dict[LabelValues, Callable[[], float]] = {}
+
+    def inc(self, *labels:str, amount:float = 1.0) -> None:
+        self.d_values[labels] = self.d_values.get(labels, 0.0) + amount
+
+    def function_set(self, function:Callable[[], float], *labels:str) -> None:
+        """
+        Read the counter from function() whenever it is rendered, for
+        counts kept elsewhere. function() must never decrease.
+        """
+        self.d_functions[labels] = function
+
+    def render(self) -> list[str]:
+        d_values:dict[LabelValues, float] = {**self.d_values,
+                                             **{k: f() for k, f in self.d_functions.items()}}
+        return self.header() + ['%s%s %s' % (self.name, labels_format(self.labelNames, k), v)
+                                for k, v in d_values.items()]
+
+class Gauge(Metric):
+    kind:str = 'gauge'
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.d_values:dict[LabelValues, float] = {}
+        self.d_functions:dict[LabelValues, Callable[[], float]] = {}
+        self.seriesFunction:Callable[[], dict[LabelValues, float]] | None = None
+
+    def set(self, value:float, *labels:str) -> None:
+        self.d_values[labels] = value
+
+    def function_set(self, function:Callable[[], float], *labels:str) -> None:
+        """
+        Read the gauge from function() whenever it is rendered.
+        """
+        self.d_functions[labels] = function
+
+    def series_set(self, function:Callable[[], dict[LabelValues, float]]) -> None:
+        """
+        Read the gauge, for every label value it returns, from function()
+        whenever it is rendered, for series that come and go.
+        """
+        self.seriesFunction = function
+
+    def inc(self, *labels:str, amount:float = 1.0) -> None:
+        self.d_values[labels] = self.d_values.get(labels, 0.0) + amount
+
+    def dec(self, *labels:str, amount:float = 1.0) -> None:
+        self.inc(*labels, amount = -amount)
+
+    @contextmanager
+    def track(self, *labels:str) -> Iterator[None]:
+        """
+        Increment the gauge for the duration of the block.
+        """
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+    def render(self) -> list[str]:
+        d_values:dict[LabelValues, float] = {**self.d_values,
+                                             **{k: f() for k, f in self.d_functions.items()},
+                                             **(self.seriesFunction() if self.seriesFunction else {})}
+        return self.header() + ['%s%s %s' % (self.name, labels_format(self.labelNames, k), v)
+                                for k, v in d_values.items()]
+
+class Histogram(Metric):
+    kind:str = 'histogram'
+    defaultBuckets:tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                                        0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, *args, buckets:tuple[float, ...] | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets:tuple[float, ...]                  = tuple(sorted(buckets or self.defaultBuckets))
+        self.d_counts:dict[LabelValues, list[int]]      = {}
+        self.d_sums:dict[LabelValues, float]            = {}
+
+    def observe(self, value:float, *labels:str) -> None:
+        counts:list[int] | None = self.d_counts.get(labels)
+        if counts is None:
+            counts                  = [0] * (len(self.buckets) + 1)
+            self.d_counts[labels]   = counts
+            self.d_sums[labels]     = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.d_sums[labels] += value
+
+    @contextmanager
+    def time(self, *labels:str) -> Iterator[None]:
+        """
+        Observe the wall time (in seconds) taken by the block.
+        """
+        start:float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> list[str]:
+        l_lines:list[str] = self.header()
+        for labels, counts in self.d_counts.items():
+            cumulative:int = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le:str = '+Inf' if bound == float('inf') else repr(bound)
+                l_lines.append('%s_bucket%s %d' % (self.name,
+                               labels_format(self.labelNames, labels, 'le="%s"' % le), cumulative))
+            l_lines.append('%s_sum%s %s' % (self.name, labels_format(self.labelNames, labels), self.d_sums[labels]))
+            l_lines.append('%s_count%s %d' % (self.name, labels_format(self.labelNames, labels), cumulative))
+        return l_lines
+
+class Registry:
+    """
+    A collection of metrics, rendered together.
+    """
+
+    def __init__(self) -> None:
+        self.d_metrics:dict[str, Metric] = {}
+
+    def register(self, metric:Metric) -> Metric:
+        self.d_metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name:str, help:str, labelNames:tuple[str, ...] = ()) -> Counter:
+        return self.d_metrics.get(name) or self.register(Counter(name, help, labelNames))
+
+    def gauge(self, name:str, help:str, labelNames:tuple[str, ...] = ()) -> Gauge:
+        return self.d_metrics.get(name) or self.register(Gauge(name, help, labelNames))
+
+    def histogram(self, name:str, help:str, labelNames:tuple[str, ...] = (),
+                  buckets:tuple[float, ...] | None = None) -> Histogram:
+        return self.d_metrics.get(name) or self.register(Histogram(name, help, labelNames, buckets = buckets))
+
+    def render(self) -> str:
+        l_lines:list[str] = []
+        for metric in self.d_metrics.values():
+            l_lines.extend(metric.render())
+        return '\n'.join(l_lines) + '\n'
+
+# The process-wide registry
+registry:Registry = Registry()
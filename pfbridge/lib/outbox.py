@@ -0,0 +1,282 @@
+"""
+This module provides a durable outbox: relays that could not be
+delivered to `pflink` are kept in a local SQLite file and resubmitted
+in the background until they get through.
+
+Each entry is keyed by its relay key, so a relay is queued at most once
+however often it fails or is repeated by clients. A relay is only
+queued when `pflink` was unreachable or failing (see the caller), and a
+replay is the very request the client would repeat itself, sent after
+the failed attempt has ended: `pflink` answers a workflow request it
+already holds with that workflow, so a replay never duplicates one.
+(Concurrent first submissions are another matter; see the hedging in
+controllers/relayController.py.) Entries are claimed for a short lease before they are
+replayed, so that several worker processes sharing the file never
+replay the same entry at once.
+
+Failed replays are retried with jittered exponential backoff. Entries
+that keep failing are given up after `maxAttempts` attempts or `maxAge`
+seconds.
+
+The file holds the relay payloads, so it is created readable by its
+owner only. All file access runs in a worker thread (asyncio.to_thread), so that a
+busy file never stalls the event loop. `depth` is the number of entries
+in the file (queued by any process) as last seen.
+"""
+
+import  asyncio
+import  json
+import  random
+import  sqlite3
+import  threading
+import  time
+from    dataclasses         import dataclass
+from    typing              import Any, Awaitable, Callable
+
+from    lib                 import configstore
+
+@dataclass
+class Entry:
+    key:str
+    payload:dict
+    test:bool
+    queued:float
+    attempts:int
+    nextAttempt:float
+    error:str
+
+# replay(entry) -> True if the entry was delivered
+ReplayFunction = Callable[[Entry], Awaitable[bool]]
+
+class Outbox:
+    """
+    A SQLite-backed queue of undelivered relays, replayed with backoff.
+    """
+
+    def __init__(
+            self,
+            path:str,
+            baseDelay:float     = 1.0,
+            maxDelay:float      = 60.0,
+            maxAttempts:int     = 0,
+            maxAge:float        = 86400.0,
+            lease:float         = 30.0,
+            concurrency:int     = 8
+    ) -> None:
+        self.path:str                       = path
+        self.baseDelay:float                = baseDelay
+        self.maxDelay:float                 = maxDelay
+        self.maxAttempts:int                = maxAttempts
+        self.maxAge:float                   = maxAge
+        self.lease:float                    = lease
+        self.concurrency:int                = max(1, concurrency)
+        self.lock:threading.Lock            = threading.Lock()
+        configstore.file_secure(path)
+        self.db:sqlite3.Connection          = sqlite3.connect(
+            path,
+            timeout             = 10.0,
+            isolation_level     = None,
+            check_same_thread   = False
+        )
+        self.db.row_factory                 = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            '''CREATE TABLE IF NOT EXISTS outbox (
+                key             TEXT PRIMARY KEY,
+                payload         TEXT NOT NULL,
+                test            INTEGER,
+                queued          REAL,
+                attempts        INTEGER DEFAULT 0,
+                nextAttempt     REAL,
+                error           TEXT
+            )'''
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS outbox_due ON outbox (nextAttempt)')
+        # Keys this process has queued or seen queued, so that relays
+        # delivered by clients can clear them without a lookup each time
+        self.keys:set[str]                  = {row[0] for row in self.db.execute('SELECT key FROM outbox')}
+        self.wakeup:asyncio.Event | None    = None
+        self.task:asyncio.Task | None       = None
+        self.replayed:int                   = 0
+        self.abandoned:int                  = 0
+        self.depth:int                      = len(self.keys)
+
+    def depth_do(self) -> int:
+        with self.lock:
+            self.depth = self.db.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+            return self.depth
+
+    def __len__(self) -> int:
+        return self.depth_do()
+
+    @staticmethod
+    def entry_decode(row:sqlite3.Row) -> Entry:
+        return Entry(
+            key         = row['key'],
+            payload     = json.loads(row['payload']),
+            test        = bool(row['test']),
+            queued      = row['queued'],
+            attempts    = row['attempts'],
+            nextAttempt = row['nextAttempt'],
+            error       = row['error'] or ''
+        )
+
+    def backoff(self, attempts:int) -> float:
+        """
+        Seconds until the next attempt after <attempts> failures: half
+        the capped exponential delay, plus a random part of the other
+        half, so that entries queued together do not retry together.
+        """
+        delay:float = min(self.maxDelay, self.baseDelay * 2 ** min(attempts, 32))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def enqueue_do(self, key:str, payload:dict, test:bool, error:str) -> tuple[Entry, bool]:
+        now:float = time.time()
+        with self.lock:
+            cursor = self.db.execute(
+                '''INSERT OR IGNORE INTO outbox (key, payload, test, queued, attempts, nextAttempt, error)
+                   VALUES (?, ?, ?, ?, 0, ?, ?)''',
+                (key, json.dumps(payload), int(test), now, now + self.backoff(0), error)
+            )
+            row = self.db.execute('SELECT * FROM outbox WHERE key = ?', (key,)).fetchone()
+        self.depth_do()
+        return self.entry_decode(row), cursor.rowcount == 1
+
+    async def enqueue(self, key:str, payload:dict, test:bool, error:str) -> tuple[Entry, bool]:
+        """
+        Queue the relay <key>, unless it is queued already.
+
+        Returns:
+            tuple[Entry, bool]: the (new or existing) entry, and whether
+                it was queued by this call
+        """
+        entry, created = await asyncio.to_thread(self.enqueue_do, key, payload, test, error)
+        self.keys.add(key)
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return entry, created
+
+    def done_do(self, key:str) -> None:
+        with self.lock:
+            self.db.execute('DELETE FROM outbox WHERE key = ?', (key,))
+        self.depth_do()
+
+    async def done(self, key:str) -> None:
+        """
+        Remove the relay <key>: it has been delivered.
+        """
+        self.keys.discard(key)
+        await asyncio.to_thread(self.done_do, key)
+
+    def failed_do(self, entry:Entry, error:str) -> bool:
+        now:float       = time.time()
+        attempts:int    = entry.attempts + 1
+        if (self.maxAttempts and attempts >= self.maxAttempts) or now - entry.queued > self.maxAge:
+            self.done_do(entry.key)
+            self.abandoned += 1
+            return False
+        with self.lock:
+            self.db.execute(
+                'UPDATE outbox SET attempts = ?, nextAttempt = ?, error = ? WHERE key = ?',
+                (attempts, now + self.backoff(attempts), error, entry.key)
+            )
+        return True
+
+    async def failed(self, entry:Entry, error:str) -> bool:
+        """
+        Record a failed replay of <entry> and schedule the next one.
+
+        Returns:
+            bool: False if the entry was given up instead
+        """
+        kept:bool = await asyncio.to_thread(self.failed_do, entry, error)
+        if not kept:
+            self.keys.discard(entry.key)
+        return kept
+
+    def due_claim_do(self, limit:int) -> list[Entry]:
+        now:float               = time.time()
+        l_claimed:list[Entry]   = []
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT * FROM outbox WHERE nextAttempt <= ? ORDER BY nextAttempt LIMIT ?', (now, limit)
+            ).fetchall()
+            for row in rows:
+                cursor = self.db.execute(
+                    'UPDATE outbox SET nextAttempt = ? WHERE key = ? AND nextAttempt = ?',
+                    (now + self.lease, row['key'], row['nextAttempt'])
+                )
+                if cursor.rowcount == 1:
+                    l_claimed.append(self.entry_decode(row))
+        return l_claimed
+
+    async def due_claim(self, limit:int) -> list[Entry]:
+        """
+        Claim up to <limit> entries that are due, by pushing their next
+        attempt one lease into the future. An entry claimed by another
+        process is skipped.
+        """
+        l_claimed:list[Entry] = await asyncio.to_thread(self.due_claim_do, limit)
+        self.keys.update(entry.key for entry in l_claimed)
+        return l_claimed
+
+    def nextDue_do(self) -> float | None:
+        self.depth_do()
+        with self.lock:
+            return self.db.execute('SELECT MIN(nextAttempt) FROM outbox').fetchone()[0]
+
+    async def replay_do(self, entry:Entry, replay:ReplayFunction) -> None:
+        try:
+            delivered:bool  = await replay(entry)
+            error:str       = ''
+        except Exception as e:
+            delivered       = False
+            error           = str(e)
+        if delivered:
+            await self.done(entry.key)
+            self.replayed += 1
+        else:
+            await self.failed(entry, error or entry.error)
+
+    async def run(self, replay:ReplayFunction, poll:float) -> None:
+        """
+        The replay loop: replay due entries, at most `concurrency` at a
+        time, then sleep until the next is due (or one is queued). The
+        file is checked at least every <poll> seconds for entries queued
+        by other processes.
+        """
+        while True:
+            self.wakeup.clear()
+            l_due:list[Entry] = await self.due_claim(self.concurrency)
+            if l_due:
+                await asyncio.gather(*[self.replay_do(entry, replay) for entry in l_due])
+                continue
+            nextDue:float | None = await asyncio.to_thread(self.nextDue_do)
+            delay:float = poll if nextDue is None else min(poll, max(0.0, nextDue - time.time()))
+            try:
+                async with asyncio.timeout(delay):
+                    await self.wakeup.wait()
+            except TimeoutError:
+                pass
+
+    def start(self, replay:ReplayFunction, poll:float = 5.0) -> None:
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.task   = asyncio.create_task(self.run(replay, poll))
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+
+    def status(self) -> dict[str, Any]:
+        return {
+            'queued':       self.depth,
+            'replayed':     self.replayed,
+            'abandoned':    self.abandoned
+        }
@@ -1,15 +1,281 @@
 """
 This class contains useful methods to authenticate and re/generate auth tokens for `pflink`
+
+All traffic to `pflink` shares a single, process-wide pooled `httpx.AsyncClient`
+so that connections are kept alive across relays. The pool is opened in the
+app lifespan (see `pool_open()`) and closed on shutdown (see `pool_close()`).
+
+The auth token is held in an `AuthToken` which coalesces concurrent refreshes
+into a single request to `pflink` and renews the token in the background
+before it expires.
+
+Every request to a `pflink` URL passes through that URL's circuit breaker
+(see `lib/circuit.py`): while the circuit is open requests fail at once with
+a `PflinkCircuitOpenException`, and request timeouts follow the latency
+observed for the URL.
+
+Requests can be paced, per URL like the circuits (see `Pacer` and
+`PacerBoard`): their rate adapts to the latency and errors of that URL,
+increasing additively while it copes and decreasing multiplicatively
+when it does not, with excess requests waiting locally for their turn.
+Requests the circuit would refuse are refused before they are paced.
+
+A request that fails in transport (connection error, timeout) or is
+answered with a 5xx raises a `PflinkUnavailableException`: `pflink`
+could not take the request, so it may be repeated later. Every other
+failure (no free local connection, an open circuit, token problems)
+raises a plain `PflinkRequestException`.
+
+Requests made on behalf of work with a deadline (see `lib/deadline.py`)
+fail fast with a `DeadlineExceeded` once it has passed.
 """
 import httpx
+import asyncio
+import base64
+import contextvars
+import importlib.util
+import json
+import time
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+from lib import circuit, deadline
+
+class Pacer(object):
+    """
+    AIMD pacing of the requests to one `pflink` URL.
+
+    Requests are sent at most `rate` per second, in FIFO order. Each
+    answer within `latencyTarget` raises the rate a little (by `increase`
+    per second at full load); an error, a 429 or a slow answer multiplies
+    it by `decrease`, at most once per `cooldown` seconds.
+    """
+    def __init__(
+            self,
+            enabled: bool = False,
+            rate: float = 50.0,
+            minRate: float = 1.0,
+            maxRate: float = 1000.0,
+            increase: float = 1.0,
+            decrease: float = 0.5,
+            latencyTarget: float = 2.0,
+            cooldown: float = 1.0
+    ):
+        self.enabled: bool          = enabled
+        self.rate: float            = rate
+        self.minRate: float         = minRate
+        self.maxRate: float         = maxRate
+        self.increase: float        = increase
+        self.decrease: float        = decrease
+        self.latencyTarget: float   = latencyTarget
+        self.cooldown: float        = cooldown
+        self.lastSent: float        = 0.0
+        self.turn: asyncio.Lock     = asyncio.Lock()
+        self.lastDecrease: float    = 0.0
+        self.queued: int            = 0
+
+    def configure(self, **fields) -> None:
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.minRate    = max(0.01, self.minRate)
+        self.rate       = min(self.maxRate, max(self.minRate, self.rate))
+
+    async def acquire(self) -> None:
+        """
+        Wait for the next free slot.
+        """
+        if not self.enabled:
+            return
+        self.queued += 1
+        try:
+            async with self.turn:
+                wait: float = self.lastSent + 1.0 / self.rate - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.lastSent = time.monotonic()
+        finally:
+            self.queued -= 1
+
+    def success(self, latency: float) -> None:
+        if latency > self.latencyTarget:
+            self.failure()
+        else:
+            self.rate = min(self.maxRate, self.rate + self.increase / self.rate)
+
+    def failure(self) -> None:
+        now: float = time.monotonic()
+        if now - self.lastDecrease >= self.cooldown:
+            self.rate           = max(self.minRate, self.rate * self.decrease)
+            self.lastDecrease   = now
+
+class PacerBoard(object):
+    """
+    One Pacer per URL, created on first use, all sharing one config.
+    """
+    def __init__(self):
+        self.d_config: dict                 = {}
+        self.d_pacers: dict[str, Pacer]     = {}
+
+    def configure(self, **fields) -> None:
+        """
+        Replace the config of the board and of all existing pacers.
+        """
+        self.d_config.update(fields)
+        for pacer in self.d_pacers.values():
+            pacer.configure(**fields)
+
+    def get(self, url: str) -> Pacer:
+        pacer: Pacer | None = self.d_pacers.get(url)
+        if pacer is None:
+            pacer               = Pacer()
+            pacer.configure(**self.d_config)
+            self.d_pacers[url]  = pacer
+        return pacer
+
+httpClient: httpx.AsyncClient | None   = None
+circuits: circuit.CircuitBoard         = circuit.CircuitBoard()
+pacers: PacerBoard                     = PacerBoard()
+
+def pool_open(
+        maxConnections:int      = 100,
+        maxKeepalive:int        = 20,
+        keepaliveExpiry:float   = 30.0,
+        http2:bool              = False,
+        transport               = None
+) -> httpx.AsyncClient:
+    """
+    Create the process-wide pooled client used for all `pflink` traffic.
+
+    Args:
+        maxConnections (int): maximum number of concurrent connections
+        maxKeepalive (int): maximum number of idle connections kept alive
+        keepaliveExpiry (float): seconds an idle connection is kept alive
+        http2 (bool): speak HTTP/2 if the `h2` package is available
+        transport: an optional explicit httpx transport (e.g. for testing)
+
+    Returns:
+        httpx.AsyncClient: the pooled client
+    """
+    global httpClient
+    if http2 and importlib.util.find_spec('h2') is None:
+        logger.warning("pflink pool: HTTP/2 requested but 'h2' is not installed. Using HTTP/1.1.")
+        http2 = False
+    httpClient = httpx.AsyncClient(
+        limits      = httpx.Limits(
+                        max_connections             = maxConnections,
+                        max_keepalive_connections   = maxKeepalive,
+                        keepalive_expiry            = keepaliveExpiry
+                    ),
+        http2       = http2,
+        transport   = transport
+    )
+    return httpClient
+
+async def pool_close() -> None:
+    """
+    Close the pooled client (if any), releasing all kept-alive connections.
+    """
+    global httpClient
+    if httpClient is not None:
+        await httpClient.aclose()
+    httpClient = None
+
+def pool_get() -> httpx.AsyncClient:
+    """
+    Return the pooled client, opening one with default limits if the
+    app lifespan has not already done so.
+
+    Returns:
+        httpx.AsyncClient: the pooled client
+    """
+    if httpClient is None or httpClient.is_closed:
+        return pool_open()
+    return httpClient
+
+async def guarded_post(client: httpx.AsyncClient, url: str, **kwargs) -> httpx.Response:
+    """
+    POST to <url> through its circuit breaker, paced, with a timeout
+    adapted to the latency observed for <url>. Server errors (5xx) and
+    transport failures count against the circuit; waiting for a free
+    connection in the local pool does not. A request the circuit
+    refuses does not wait for its turn, and one whose deadline passes
+    while it waits is not sent.
+
+    Raises:
+        DeadlineExceeded: the deadline of the current work has passed
+        PflinkCircuitOpenException: the circuit is open; nothing was sent
+        PflinkRequestException: the request failed
+    """
+    deadline.check(f"POST to {url}")
+    breaker: circuit.CircuitBreaker = circuits.get(url)
+    if not breaker.allow():
+        raise PflinkCircuitOpenException(
+            f"Circuit to {url} is open after repeated failures; retry in {breaker.retryAfter():.1f}s"
+        )
+    pacer: Pacer = pacers.get(url)
+    try:
+        await pacer.acquire()
+        deadline.check(f"POST to {url}")
+    except BaseException:
+        breaker.release()
+        raise
+    timeout: float = breaker.timeout()
+    start: float = time.perf_counter()
+    try:
+        response: httpx.Response = await client.post(
+            url,
+            timeout=httpx.Timeout(timeout, pool=breaker.config.timeoutMax),
+            **kwargs
+        )
+    except httpx.PoolTimeout as e:
+        breaker.release()
+        raise PflinkRequestException(f"No free connection to {url}: {str(e)}")
+    except httpx.TimeoutException as e:
+        breaker.failure()
+        pacer.failure()
+        raise PflinkUnavailableException(f"Timed out after {timeout:.2f}s connecting to {url}: {str(e)}")
+    except Exception as e:
+        breaker.failure()
+        pacer.failure()
+        raise PflinkUnavailableException(f"Error occurred while connecting to {url}: {str(e)}")
+    except BaseException:
+        breaker.release()
+        raise
+    latency: float = time.perf_counter() - start
+    if response.status_code >= 500:
+        breaker.failure()
+        pacer.failure()
+    else:
+        breaker.success(latency)
+        if response.status_code == 429:
+            pacer.failure()
+        else:
+            pacer.success(latency)
+    return response
+
+async def health_probe(client: httpx.AsyncClient, url: str, timeout: float = 2.0) -> None:
+    """
+    GET a `pflink` health URL (not through the circuit breaker).
+
+    Raises:
+        PflinkRequestException: the URL did not answer with a success
+    """
+    try:
+        response: httpx.Response = await client.get(url, timeout=timeout)
+    except Exception as e:
+        raise PflinkRequestException(f"Health check of {url} failed: {str(e)}")
+    if response.status_code >= 400:
+        raise PflinkRequestException(f"Health check of {url} failed with status {response.status_code}")
 
 class Client(object):
     """
     A `pflink` client
     """
-    def __init__(self, url, auth_token):
+    def __init__(self, url, auth_token, client: httpx.AsyncClient | None = None):
         self.auth_token = None
         self.url = url
+        self.client = client if client else pool_get()
         self.set_auth_token(auth_token)
 
     def set_auth_token(self, auth_token):
@@ -17,45 +283,206 @@ class Client(object):
             raise PflinkRequestInvalidTokenException(f'Invalid auth token: {auth_token}')
         self.auth_token = str(auth_token)
 
-    async def post(self, data: dict):
+    async def post(self, data: bytes):
         """
+        POST an already serialized JSON body.
         """
-        headers = {'Authorization': 'Bearer ' + self.auth_token}
-        async with httpx.AsyncClient() as client:
-            try:
-                response: httpx.Response = await client.post(
-                    self.url,
-                    data=data,
-                    headers=headers
-                )
-            except Exception as e:
-                raise PflinkRequestException(f"Error occurred while connecting to {self.url}: {str(e)}")
-            if response.status_code == 403:
-                raise PflinkRequestInvalidTokenException(f'Invalid auth token: {self.auth_token}')
-            return response
+        headers = {'Authorization': 'Bearer ' + self.auth_token, 'Content-Type': 'application/json'}
+        response: httpx.Response = await guarded_post(
+            self.client,
+            self.url,
+            content=data,
+            headers=headers
+        )
+        if response.status_code == 403:
+            raise PflinkRequestInvalidTokenException(f'Invalid auth token: {self.auth_token}')
+        if response.status_code >= 500:
+            raise PflinkUnavailableException(f"{self.url} failed with status {response.status_code}")
+        return response
 
     @staticmethod
-    async def get_auth_token(pflink_auth_url: str, pflink_user: str, pflink_password: str):
+    async def get_auth_token(
+            pflink_auth_url: str,
+            pflink_user: str,
+            pflink_password: str,
+            client: httpx.AsyncClient | None = None
+    ):
         """
         Make a POST request to obtain an auth token.
         Args:
             pflink_auth_url: API endpoint of `pflink` to get new auth token
             pflink_user: Authorized pflink username
             pflink_password: Authorized pflink password
+            client: an optional client to use instead of the shared pool
 
         Returns: A new authentication token
         """
-        async with httpx.AsyncClient() as client:
+        client = client if client else pool_get()
+        try:
+            response: httpx.Response = await guarded_post(
+                client,
+                pflink_auth_url,
+                data={'username': pflink_user, 'password': pflink_password}
+            )
+        except PflinkUnavailableException as e:
+            # A token failure is never one of the workflow request itself
+            raise PflinkRequestException(f"Could not get a token from {pflink_auth_url}: {str(e)}")
+        try:
+            token = response.json().get('access_token')
+        except Exception:
+            token = None
+        if not token:
+            raise PflinkRequestException(
+                f"Could not create token from URL: {pflink_auth_url} (status {response.status_code})"
+            )
+        return token
+
+
+class AuthToken(object):
+    """
+    The current `pflink` auth token and its expiry.
+
+    Refreshes are "single-flight": however many callers ask for a refresh
+    at the same time, only one request is made to the `pflink` auth
+    endpoint and all callers await its result.
+    """
+    def __init__(self, token: str = '', margin: float = 60.0, retry: float = 5.0):
+        self.token: str                         = ''
+        self.expiry: float | None               = None
+        self.issued: float                      = 0.0
+        self.margin: float                      = margin
+        self.retry: float                       = retry
+        self.fetched: bool                      = False
+        self.refreshTask: asyncio.Task | None   = None
+        self.renewTask: asyncio.Task | None     = None
+        self.set(token)
+
+    @staticmethod
+    def claims_decode(token: str) -> tuple[float | None, float | None]:
+        """
+        Return the `exp` and `iat` claims (epoch seconds) of a JWT, each
+        None if the token is not a JWT or does not carry it. The
+        signature is not checked -- this is only used to schedule renewal.
+        """
+        try:
+            payload: str    = token.split('.')[1]
+            payload        += '=' * (-len(payload) % 4)
+            d_claims: dict  = json.loads(base64.urlsafe_b64decode(payload))
+        except Exception:
+            return None, None
+        l_claims: list[float | None] = []
+        for claim in ('exp', 'iat'):
+            try:
+                l_claims.append(float(d_claims[claim]))
+            except (KeyError, TypeError, ValueError):
+                l_claims.append(None)
+        return l_claims[0], l_claims[1]
+
+    def set(self, token: str) -> None:
+        self.token                  = str(token)
+        self.expiry, issued         = self.claims_decode(self.token)
+        self.issued                 = issued if issued is not None else time.time()
+
+    def margin_get(self) -> float:
+        """
+        The renewal margin, but at most half the lifetime of the token,
+        so that short-lived tokens are not renewed on every relay.
+        """
+        if self.expiry is None:
+            return self.margin
+        return max(0.0, min(self.margin, (self.expiry - self.issued) / 2))
+
+    def isExpiring(self) -> bool:
+        """
+        True if the token is known to expire within the renewal margin.
+        """
+        return self.expiry is not None and time.time() >= self.expiry - self.margin_get()
+
+    async def refresh_do(self, fetch: Callable[[], Awaitable[str]]) -> str:
+        self.set(await fetch())
+        self.fetched = True
+        return self.token
+
+    async def refresh(
+            self,
+            fetch: Callable[[], Awaitable[str]],
+            stale: str | None = None
+    ) -> str:
+        """
+        Refresh the token, coalescing concurrent callers onto one request.
+        The refresh itself runs without a deadline, as it is shared, but
+        each caller only waits for it until its own deadline.
+
+        Args:
+            fetch: coroutine function returning a new token from `pflink`
+            stale: the token the caller found to be invalid. If the current
+                   token differs, somebody else has already refreshed it.
+
+        Returns:
+            str: the (new) token
+
+        Raises:
+            DeadlineExceeded: the caller's deadline passed first
+        """
+        if stale is not None and stale != self.token:
+            return self.token
+        if self.refreshTask is None or self.refreshTask.done():
+            context: contextvars.Context = contextvars.copy_context()
+            context.run(deadline.current.set, None)
+            self.refreshTask = asyncio.get_running_loop().create_task(self.refresh_do(fetch), context=context)
+        remaining: float | None = deadline.remaining()
+        if remaining is None:
+            return await asyncio.shield(self.refreshTask)
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.refreshTask), max(0.0, remaining))
+        except asyncio.TimeoutError:
+            if self.refreshTask.done():
+                return self.refreshTask.result()
+            raise deadline.DeadlineExceeded("Deadline exceeded waiting for a pflink auth token") from None
+
+    async def token_get(self, fetch: Callable[[], Awaitable[str]]) -> str:
+        """
+        Return a token, refreshing first if the current one is about to
+        expire.
+        """
+        if self.isExpiring():
+            return await self.refresh(fetch)
+        return self.token
+
+    async def renew_run(self, fetch: Callable[[], Awaitable[str]]) -> None:
+        """
+        Renew the token shortly before it expires, until cancelled.
+
+        Args:
+            fetch: coroutine function that gets a new token from `pflink`
+        """
+        while True:
+            delay: float = self.retry
             try:
-                response: httpx.Response = await client.post(
-                    pflink_auth_url,
-                    data={'username': pflink_user, 'password': pflink_password}
-                )
-            except Exception as e:
-                raise PflinkRequestException(f"Error occurred while getting token from {pflink_auth_url}: {str(e)}")
-            if not response.json().get('access_token'):
-                raise Exception(f"Could not create token from URL: {pflink_auth_url}")
-            return response.json().get('access_token')
+                if not self.fetched or self.isExpiring():
+                    await self.refresh(fetch)
+                if self.expiry is not None:
+                    delay = max(self.expiry - self.margin_get() - time.time(), self.retry)
+                else:
+                    delay = max(self.margin, self.retry)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                delay = self.retry
+            await asyncio.sleep(delay)
+
+    def renew_start(self, fetch: Callable[[], Awaitable[str]]) -> None:
+        if self.renewTask is None or self.renewTask.done():
+            self.renewTask = asyncio.create_task(self.renew_run(fetch))
+
+    async def renew_stop(self) -> None:
+        if self.renewTask is not None:
+            self.renewTask.cancel()
+            try:
+                await self.renewTask
+            except asyncio.CancelledError:
+                pass
+        self.renewTask = None
 
 
 class PflinkRequestException(Exception):
@@ -64,4 +491,8 @@ class PflinkRequestException(Exception):
 class PflinkRequestInvalidTokenException(PflinkRequestException):
     pass
 
+class PflinkCircuitOpenException(PflinkRequestException):
+    pass
 
+class PflinkUnavailableException(PflinkRequestException):
+    pass
@@ -0,0 +1,200 @@
+"""
+This module provides per-client rate limiting with token buckets.
+
+Each bucket (one per client and quota) holds up to `burst` tokens and
+refills at `rate` tokens per second; a request spends a token, and is
+refused with a `RateLimited` (and a suggested `retryAfter`) if there is
+none left. A request that needs tokens from several buckets gets all
+of them or none (see take_all).
+
+Decisions are always made locally, from an in-memory bucket, so that
+they cost next to nothing on each request. With a shared SQLite file,
+every worker process periodically (every `syncInterval` seconds) adds
+the tokens it spent to the shared bucket and takes back the shared
+balance. A client spread over N workers may therefore overspend by at
+most about N * rate * syncInterval tokens, plus the balance of a bucket
+the worker had not used since its last sync.
+"""
+
+import  asyncio
+import  math
+import  sqlite3
+import  threading
+import  time
+from    collections         import OrderedDict
+from    dataclasses         import dataclass
+
+from    loguru              import logger
+
+from    lib                 import admission, configstore
+
+class RateLimited(admission.AdmissionRejected):
+    """
+    Raised when a client exceeds its quota. Handled like any other
+    refusal of admission, with a 429.
+    """
+
+    def __init__(self, message:str, retryAfter:int) -> None:
+        super().__init__(message, 'rate limit', 429, retryAfter)
+
+@dataclass(frozen = True)
+class Quota:
+    rate:float                          # tokens per second
+    burst:float                         # bucket size
+
+class Bucket:
+    __slots__ = ('quota', 'tokens', 'updated', 'used')
+
+    def __init__(self, quota:Quota, now:float) -> None:
+        self.quota:Quota        = quota
+        self.tokens:float       = quota.burst
+        self.updated:float      = now       # monotonic
+        self.used:float         = 0.0       # spent since the last sync
+
+class RateLimiter:
+    """
+    A bounded set of token buckets, optionally shared through SQLite.
+    """
+
+    def __init__(self, maxKeys:int = 10000, path:str = '', syncInterval:float = 0.1) -> None:
+        self.maxKeys:int                            = max(1, maxKeys)
+        self.syncInterval:float                     = syncInterval
+        self.d_buckets:OrderedDict[str, Bucket]     = OrderedDict()
+        self.db:sqlite3.Connection | None           = None
+        self.lock:threading.Lock                    = threading.Lock()
+        self.task:asyncio.Task | None               = None
+        self.limited:int                            = 0
+        if path:
+            configstore.file_secure(path)
+            self.db = sqlite3.connect(path, timeout = 10.0, isolation_level = None, check_same_thread = False)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+
+    def bucket_get(self, key:str, quota:Quota, now:float) -> Bucket:
+        """
+        The bucket <key>, refilled up to <now>; a full one if it is new
+        (or its quota changed).
+        """
+        bucket:Bucket | None    = self.d_buckets.get(key)
+        if bucket is None or bucket.quota != quota:
+            bucket              = Bucket(quota, now)
+            self.d_buckets[key] = bucket
+            if len(self.d_buckets) > self.maxKeys:
+                self.d_buckets.popitem(last = False)
+        else:
+            self.d_buckets.move_to_end(key)
+            bucket.tokens       = min(quota.burst, bucket.tokens + (now - bucket.updated) * quota.rate)
+            bucket.updated      = now
+        return bucket
+
+    def take_all(self, l_charges:list[tuple[str, Quota, float]]) -> list[float]:
+        """
+        Spend the tokens of every (key, quota, cost) charge, but only if
+        every bucket can pay: otherwise nothing is spent.
+
+        Returns:
+            list[float]: per charge, the seconds until its bucket can
+                         pay; all 0 if the tokens were spent
+        """
+        now:float               = time.monotonic()
+        l_buckets:list[Bucket]  = [self.bucket_get(key, quota, now) for key, quota, _ in l_charges]
+        l_waits:list[float]     = []
+        for bucket, (_, quota, cost) in zip(l_buckets, l_charges):
+            if bucket.tokens >= cost:
+                l_waits.append(0.0)
+            else:
+                l_waits.append(math.inf if quota.rate <= 0 else (cost - bucket.tokens) / quota.rate)
+        if any(l_waits):
+            self.limited += 1
+            return l_waits
+        for bucket, (_, _, cost) in zip(l_buckets, l_charges):
+            bucket.tokens      -= cost
+            bucket.used        += cost
+        return l_waits
+
+    def take(self, key:str, quota:Quota, cost:float = 1.0) -> float:
+        """
+        Spend <cost> tokens from the bucket <key>.
+
+        Returns:
+            float: 0 if the tokens were spent, else the seconds until
+                   they will be available
+        """
+        return self.take_all([(key, quota, cost)])[0]
+
+    def sync_do(self, l_spent:list[tuple[str, float, Quota]]) -> dict[str, float]:
+        """
+        Add the tokens spent here to the shared buckets, and return
+        their shared balances. Runs in a worker thread.
+        """
+        now:float                   = time.time()
+        d_balance:dict[str, float]  = {}
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                for key, used, quota in l_spent:
+                    row = self.db.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+                    tokens:float    = quota.burst if row is None else \
+                                      min(quota.burst, row[0] + (now - row[1]) * quota.rate)
+                    tokens          = max(-quota.burst, tokens - used)
+                    self.db.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                                    (key, tokens, now))
+                    d_balance[key]  = tokens
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+        return d_balance
+
+    async def sync(self) -> None:
+        """
+        Exchange the tokens spent since the last sync with the shared
+        buckets.
+        """
+        l_spent:list[tuple[str, float, Quota]] = []
+        for key, bucket in self.d_buckets.items():
+            if bucket.used:
+                l_spent.append((key, bucket.used, bucket.quota))
+                bucket.used = 0.0
+        if not l_spent:
+            return
+        try:
+            d_balance:dict[str, float] = await asyncio.to_thread(self.sync_do, l_spent)
+        except BaseException:
+            # Nothing was shared: keep the tokens for the next sync
+            for key, used, quota in l_spent:
+                bucket:Bucket | None = self.d_buckets.get(key)
+                if bucket is not None and bucket.quota == quota:
+                    bucket.used += used
+            raise
+        now:float = time.monotonic()
+        for key, tokens in d_balance.items():
+            bucket:Bucket | None = self.d_buckets.get(key)
+            if bucket is not None:
+                # Tokens spent while the sync was running still count
+                bucket.tokens   = tokens - bucket.used
+                bucket.updated  = now
+
+    async def sync_run(self) -> None:
+        while True:
+            await asyncio.sleep(self.syncInterval)
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"rate limiter: sync failed: {e}")
+
+    def start(self) -> None:
+        if self.db is not None and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.sync_run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
@@ -0,0 +1,86 @@
+"""
+This module provides "single-flight" call coalescing.
+
+Concurrent callers that ask for the same work (identified by a key) share
+one in-flight execution of that work and all receive its result. Once the
+work completes the key is forgotten, so later callers trigger a new
+execution.
+
+Callers may bring a deadline. The shared execution runs with the latest
+of its callers' deadlines (see `lib/deadline.py`), and is cancelled once
+every caller waiting for it has run out of time.
+"""
+
+import  asyncio
+import  contextvars
+import  time
+from    typing              import Any, Awaitable, Callable
+
+from    lib                 import deadline as deadlines
+
+class SingleFlight:
+    """
+    A registry of in-flight coroutines, keyed by a caller-defined string.
+    """
+
+    def __init__(self) -> None:
+        self.inflight: dict[str, asyncio.Future]    = {}
+        self.deadlines: dict[str, deadlines.Deadline] = {}
+        self.calls:int                              = 0
+        self.shared:int                             = 0
+
+    def forget(self, key:str, task:asyncio.Future) -> None:
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+            self.deadlines.pop(key, None)
+
+    async def do(
+            self,
+            key:str,
+            work:Callable[[], Awaitable[Any]],
+            deadline:float | None = None
+    ) -> Any:
+        """
+        Run <work> for <key>, or join an execution of it that is already
+        in flight.
+
+        The shared execution is shielded so that a caller that goes away
+        (e.g. a client disconnect) does not cancel the work for the other
+        callers.
+
+        Args:
+            key (str): identifies the work
+            work (Callable): coroutine function performing the work
+            deadline (float): the monotonic time by which this caller
+                              needs the result, if any
+
+        Returns:
+            Any: the result of the (possibly shared) execution
+
+        Raises:
+            deadline.DeadlineExceeded: the deadline passed first
+        """
+        self.calls += 1
+        task:asyncio.Future | None  = self.inflight.get(key)
+        if task is None:
+            shared:deadlines.Deadline   = deadlines.Deadline(deadline)
+            context:contextvars.Context = contextvars.copy_context()
+            context.run(deadlines.current.set, shared)
+            task                    = asyncio.get_running_loop().create_task(work(), context = context)
+            self.inflight[key]      = task
+            self.deadlines[key]     = shared
+            task.add_done_callback(lambda t: self.forget(key, t))
+        else:
+            self.shared += 1
+            shared                  = self.deadlines[key]
+            shared.extend(deadline)
+        if deadline is None:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            if task.done():
+                return task.result()
+            if shared.isExpired():
+                task.cancel()
+            raise deadlines.DeadlineExceeded("No answer within the request deadline") from None
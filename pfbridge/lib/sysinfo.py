@@ -0,0 +1,142 @@
+"""
+This module provides the system information reported by `/hello/`.
+
+Static facts about the host (platform, CPU count, hostname and address)
+are computed once. Dynamic ones (CPU and memory use, load) are sampled
+by a background task every `interval` seconds into a ring buffer, from
+which CPU trends over the last 1 and 5 minutes are kept up to date. A
+reader only ever picks up the latest precomputed snapshot, so answering
+`/hello/` costs the same however often it is called and never blocks on
+the host (e.g. on a DNS lookup).
+"""
+
+import  asyncio
+import  math
+import  multiprocessing
+import  os
+import  platform
+import  socket
+import  time
+from    collections         import deque
+from    typing              import Any
+
+import  psutil
+from    loguru              import logger
+
+# The windows (in seconds) over which CPU trends are reported
+trendWindows:dict[str, float] = {'cpu_percent_1m': 60.0, 'cpu_percent_5m': 300.0}
+
+def static_compute(resolve:bool = True) -> dict[str, Any]:
+    """
+    The facts about the host that do not change while we run. Unless
+    <resolve>, the address (which needs a DNS lookup) is left empty.
+    """
+    hostname:str    = socket.gethostname()
+    inet:str        = ''
+    if resolve:
+        try:
+            inet = socket.gethostbyname(hostname)
+        except OSError:
+            pass
+    return {
+        'system':       platform.system(),
+        'machine':      platform.machine(),
+        'uname':        list(platform.uname()),
+        'platform':     platform.platform(),
+        'version':      platform.version(),
+        'cpucount':     multiprocessing.cpu_count(),
+        'hostname':     hostname,
+        'inet':         inet
+    }
+
+class Sampler:
+    """
+    Background sampling of the host's dynamic state.
+    """
+
+    def __init__(self, interval:float = 5.0) -> None:
+        self.interval:float                     = interval
+        self.d_static:dict[str, Any] | None     = None
+        self.samples:deque[tuple[float, float]] = deque()
+        self.d_current:dict[str, Any] | None    = None
+        self.sampledAt:float                    = 0.0
+        self.task:asyncio.Task | None           = None
+
+    def configure(self, interval:float) -> None:
+        self.interval = interval
+
+    def static_get(self) -> dict[str, Any]:
+        if self.d_static is None:
+            self.d_static = static_compute()
+        return self.d_static
+
+    def sample_do(self, cpu:float | None = None) -> dict[str, Any]:
+        """
+        Take a sample, add it to the ring buffer, and publish a new
+        snapshot with the static facts, the sample and the trends. The
+        CPU use is that since the previous sample, unless <cpu> is given.
+        """
+        now:float           = time.monotonic()
+        if cpu is None:
+            cpu             = psutil.cpu_percent()
+        size:int            = math.ceil(max(trendWindows.values()) / max(self.interval, 0.001)) + 1
+        self.samples.append((now, cpu))
+        while len(self.samples) > size:
+            self.samples.popleft()
+        d_trends:dict[str, float] = {}
+        for name, window in trendWindows.items():
+            l_cpu:list[float] = [c for t, c in self.samples if now - t <= window]
+            d_trends[name]    = sum(l_cpu) / len(l_cpu)
+        self.d_current      = {
+            **self.static_get(),
+            'memory':       list(psutil.virtual_memory()),
+            'loadavg':      os.getloadavg(),
+            'cpu_percent':  cpu,
+            **d_trends
+        }
+        self.sampledAt      = now
+        return self.d_current
+
+    def current(self) -> dict[str, Any]:
+        """
+        The latest snapshot. Without the background task (or before its
+        first sample) a stale snapshot is refreshed on the spot.
+        """
+        if self.d_current is None or (
+                (self.task is None or self.task.done())
+                and time.monotonic() - self.sampledAt > self.interval):
+            return self.sample_do()
+        return self.d_current
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.sample_do()
+            except Exception as e:
+                logger.warning(f"sysinfo: sampling failed: {e}")
+
+    async def start(self) -> None:
+        """
+        Compute the static facts (off the event loop, as they may need
+        DNS) and start sampling.
+        """
+        if self.d_static is None:
+            self.d_static = await asyncio.to_thread(static_compute)
+        if self.d_current is None:
+            # A first reading needs a (short) interval to measure over
+            self.sample_do(await asyncio.to_thread(psutil.cpu_percent, 0.1))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+
+# The process-wide sampler
+sampler:Sampler = Sampler()
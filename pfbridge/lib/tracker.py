@@ -0,0 +1,264 @@
+"""
+This module provides a registry of tracked workflows and a background
+scheduler that keeps them up to date.
+
+Each `Tracked` workflow holds its latest response and state, and a
+broadcast topic on which every change is published. A scheduler task
+re-polls each workflow when it falls due. The poll itself, and the
+interval until the next poll, are supplied by the caller, so that the
+tracker knows nothing of `pflink`.
+
+A workflow stops being polled once its poll reports it as done. It is
+then kept (to answer queries) for `retain` seconds. A workflow that
+nobody has asked about for `idle` seconds, and that nobody is watching,
+is dropped.
+
+When what a poll would return changes (e.g. the configuration behind
+it), `invalidate()` marks every response held as stale and re-polls the
+workflows at once. A stale response is still published to watchers, but
+should not be served as current (see `isFresh()`).
+"""
+
+import  asyncio
+import  heapq
+import  itertools
+import  time
+from    dataclasses         import dataclass, field
+from    typing              import Any, Awaitable, Callable
+
+from    lib                 import broadcast
+
+@dataclass
+class Tracked:
+    key:str
+    context:Any                         # what the poll function needs
+    response:Any            = None
+    state:str               = ''
+    done:bool               = False
+    interval:float          = 0.0       # seconds between the last two polls
+    nextPoll:float          = 0.0       # monotonic time of the next poll
+    lastChange:float        = field(default_factory = time.monotonic)
+    lastSeen:float          = field(default_factory = time.monotonic)
+    polls:int               = 0
+    generation:int          = 0         # the tracker generation of the response
+    topic:broadcast.Topic   = field(default_factory = broadcast.Topic)
+
+# poll(tracked) -> (response, state, done), or None if there is no news
+PollFunction        = Callable[[Tracked], Awaitable[tuple[Any, str, bool] | None]]
+# interval(tracked, changed) -> seconds until the next poll
+IntervalFunction    = Callable[[Tracked, bool], float]
+
+class Tracker:
+    """
+    A registry of workflows, re-polled in the background.
+    """
+
+    def __init__(
+            self,
+            poll:PollFunction,
+            interval:IntervalFunction,
+            maxSize:int         = 10000,
+            idle:float          = 600.0,
+            retain:float        = 300.0,
+            concurrency:int     = 32
+    ) -> None:
+        self.poll:PollFunction                          = poll
+        self.interval:IntervalFunction                  = interval
+        self.maxSize:int                                = maxSize
+        self.idle:float                                 = idle
+        self.retain:float                               = retain
+        self.concurrency:int                            = max(1, concurrency)
+        self.d_tracked:dict[str, Tracked]               = {}
+        self.schedule:list[tuple[float, int, str]]      = []
+        self.sequence                                   = itertools.count()
+        self.wakeup:asyncio.Event | None                = None
+        self.task:asyncio.Task | None                   = None
+        self.l_polls:set[asyncio.Task]                  = set()
+        self.polled:int                                 = 0
+        self.generation:int                             = 0
+
+    def __len__(self) -> int:
+        return len(self.d_tracked)
+
+    def isRunning(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def get(self, key:str) -> Tracked | None:
+        """
+        The tracked workflow <key>, if any. This counts as interest in
+        the workflow and so keeps it from going idle.
+        """
+        if not self.isRunning():
+            return None
+        tracked:Tracked | None = self.d_tracked.get(key)
+        if tracked is not None:
+            tracked.lastSeen = time.monotonic()
+        return tracked
+
+    def isFresh(self, tracked:Tracked) -> bool:
+        """
+        Whether the response of <tracked> was obtained since the last
+        invalidate().
+        """
+        return tracked.generation == self.generation
+
+    def invalidate(self) -> None:
+        """
+        Mark every response held as stale, and re-poll every workflow
+        still in progress at once.
+        """
+        self.generation += 1
+        now:float = time.monotonic()
+        for tracked in self.d_tracked.values():
+            if not tracked.done:
+                self.schedule_push(tracked, now)
+
+    def track(
+            self,
+            key:str,
+            context:Any,
+            response:Any,
+            state:str,
+            done:bool,
+            generation:int | None = None
+    ) -> Tracked | None:
+        """
+        Start tracking the workflow <key> from its first <response>,
+        obtained in tracker <generation> (default the current one). A
+        workflow already tracked, but with a stale response, is updated
+        with <response> instead.
+
+        Returns:
+            Tracked | None: the tracked workflow, or None if the tracker
+                            is not running or is full
+        """
+        if not self.isRunning():
+            return None
+        generation = self.generation if generation is None else generation
+        tracked:Tracked | None = self.d_tracked.get(key)
+        if tracked is not None:
+            if tracked.generation < generation:
+                self.update(tracked, response, state, done, generation)
+            return tracked
+        if len(self.d_tracked) >= self.maxSize:
+            return None
+        tracked                 = Tracked(key = key, context = context)
+        self.d_tracked[key]     = tracked
+        self.update(tracked, response, state, done, generation)
+        return tracked
+
+    def update(
+            self,
+            tracked:Tracked,
+            response:Any,
+            state:str,
+            done:bool,
+            generation:int | None = None
+    ) -> None:
+        """
+        Record a new <response> for <tracked> (from tracker <generation>,
+        if given), publish it if it changed, and schedule the next poll
+        (or the eviction, once done).
+        """
+        now:float               = time.monotonic()
+        if generation is not None:
+            tracked.generation  = max(tracked.generation, generation)
+        changed:bool            = response != tracked.response
+        if changed:
+            tracked.lastChange  = now
+            tracked.response    = response
+            tracked.topic.publish(response)
+        tracked.state           = state
+        tracked.done            = done
+        if done:
+            tracked.topic.close()
+            self.schedule_push(tracked, now + self.retain)
+        else:
+            tracked.interval    = self.interval(tracked, changed)
+            self.schedule_push(tracked, now + tracked.interval)
+
+    def schedule_push(self, tracked:Tracked, due:float) -> None:
+        tracked.nextPoll = due
+        heapq.heappush(self.schedule, (due, next(self.sequence), tracked.key))
+        if self.wakeup is not None and self.schedule[0][2] == tracked.key:
+            self.wakeup.set()
+
+    def drop(self, tracked:Tracked) -> None:
+        tracked.topic.close()
+        if self.d_tracked.get(tracked.key) is tracked:
+            del self.d_tracked[tracked.key]
+
+    async def poll_do(self, tracked:Tracked, gate:asyncio.Semaphore) -> None:
+        generation:int = self.generation
+        try:
+            result:tuple[Any, str, bool] | None = await self.poll(tracked)
+        except Exception:
+            result = None
+        finally:
+            gate.release()
+        tracked.polls  += 1
+        self.polled    += 1
+        if self.d_tracked.get(tracked.key) is not tracked:
+            return
+        if result is None:
+            self.update(tracked, tracked.response, tracked.state, tracked.done)
+        else:
+            self.update(tracked, *result, generation)
+            if not self.isFresh(tracked) and not tracked.done:
+                # Invalidated while this poll was in flight: poll again
+                self.schedule_push(tracked, time.monotonic())
+
+    async def run(self) -> None:
+        """
+        The scheduler loop: poll each workflow as it falls due, with at
+        most `concurrency` polls in flight.
+        """
+        gate:asyncio.Semaphore  = asyncio.Semaphore(self.concurrency)
+        while True:
+            self.wakeup.clear()
+            if not self.schedule:
+                await self.wakeup.wait()
+                continue
+            due, _, key         = self.schedule[0]
+            delay:float         = due - time.monotonic()
+            if delay > 0:
+                # Not wait_for(), which may swallow a cancellation that
+                # arrives as the wakeup is set (Python < 3.12)
+                try:
+                    async with asyncio.timeout(delay):
+                        await self.wakeup.wait()
+                except TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.schedule)
+            tracked:Tracked | None = self.d_tracked.get(key)
+            if tracked is None or tracked.nextPoll != due:
+                continue
+            if tracked.done or (time.monotonic() - tracked.lastSeen > self.idle
+                                and not tracked.topic.subscribers):
+                self.drop(tracked)
+                continue
+            await gate.acquire()
+            task:asyncio.Task   = asyncio.create_task(self.poll_do(tracked, gate))
+            self.l_polls.add(task)
+            task.add_done_callback(self.l_polls.discard)
+
+    def start(self) -> None:
+        if not self.isRunning():
+            self.wakeup = asyncio.Event()
+            self.task   = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Stop polling, and end all subscriptions.
+        """
+        tasks:list[asyncio.Task] = list(self.l_polls)
+        if self.task is not None:
+            tasks.append(self.task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions = True)
+        for tracked in list(self.d_tracked.values()):
+            self.drop(tracked)
+        self.schedule.clear()
+        self.task = None
@@ -0,0 +1,61 @@
+"""
+This module provides a small, bounded LRU cache whose entries each carry
+their own time-to-live.
+"""
+
+import  time
+from    collections         import OrderedDict
+from    typing              import Any
+
+class TTLCache:
+    """
+    A bounded least-recently-used cache with per-entry expiry.
+
+    Entries that have expired are dropped on access; when the cache is
+    full the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize:int = 1024) -> None:
+        self.maxsize:int                                    = maxsize
+        self.d_entries:OrderedDict[str, tuple[float, Any]]  = OrderedDict()
+        self.hits:int                                       = 0
+        self.misses:int                                     = 0
+
+    def __len__(self) -> int:
+        return len(self.d_entries)
+
+    def get(self, key:str) -> Any | None:
+        """
+        Return the live value stored at <key> or None.
+        """
+        entry:tuple[float, Any] | None  = self.d_entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expiry, value = entry
+        if time.monotonic() >= expiry:
+            self.d_entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.d_entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key:str, value:Any, ttl:float) -> None:
+        """
+        Store <value> at <key> for <ttl> seconds. A non-positive <ttl>
+        removes any existing entry instead.
+        """
+        if ttl <= 0 or self.maxsize <= 0:
+            self.d_entries.pop(key, None)
+            return
+        self.d_entries[key] = (time.monotonic() + ttl, value)
+        self.d_entries.move_to_end(key)
+        while len(self.d_entries) > self.maxsize:
+            self.d_entries.popitem(last = False)
+
+    def pop(self, key:str) -> None:
+        self.d_entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.d_entries.clear()
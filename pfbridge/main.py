@@ -11,8 +11,13 @@ from    base.router             import helloRouter_create
 
 from    routes.relayRouter      import router   as relay_router
 from    routes.credentialRouter import router   as credential_router
+from    routes.metricsRouter    import router   as metrics_router
+from    routes.ledgerRouter     import router   as ledger_router
+from    controllers             import relayController
 from    os                      import path
 from    config                  import settings
+from    lib                     import pflinkclient, sysinfo
+from    contextlib              import asynccontextmanager
 import  pudb
 
 with open(path.join(path.dirname(path.abspath(__file__)), 'ABOUT')) as f:
@@ -40,6 +45,23 @@ tags_metadata:list = [
             sensitive data.
             """
     },
+    {
+        "name"          :   "Metrics",
+        "description"   :
+            """
+            Provide an API endpoint that exposes internal metrics (latencies,
+            failure counters and in-flight relays) in Prometheus text format.
+            """
+    },
+    {
+        "name"          :   "Ledger",
+        "description"   :
+            """
+            Provide API endpoints that page through the persistent record of
+            relayed workflows and their state changes, without contacting
+            `pflink`.
+            """
+    },
     {
         "name"          :   "pfbridge environmental detail",
         "description"   :
@@ -55,10 +77,80 @@ tags_metadata:list = [
 # and if so, check/lock the vault.
 settings.vaultCheckLock(settings.vault)
 
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    """
+    Set up the process-wide resources and background tasks, and tear
+    them down on shutdown.
+    """
+    if pflinkclient.httpClient is None:
+        # A pool may already have been opened by an embedding harness
+        # (see bench/bench.py)
+        pflinkclient.pool_open(
+            maxConnections  = settings.httpPool.poolMaxConnections,
+            maxKeepalive    = settings.httpPool.poolMaxKeepalive,
+            keepaliveExpiry = settings.httpPool.poolKeepaliveExpiry,
+            http2           = settings.httpPool.poolHTTP2
+        )
+    pflinkclient.circuits.configure(
+        failureThreshold    = settings.circuit.circuitFailureThreshold,
+        openSeconds         = settings.circuit.circuitOpenSeconds,
+        halfOpenProbes      = settings.circuit.circuitHalfOpenProbes,
+        window              = settings.circuit.timeoutWindow,
+        timeoutPercentile   = settings.circuit.timeoutPercentile,
+        timeoutFactor       = settings.circuit.timeoutFactor,
+        timeoutMin          = settings.circuit.timeoutMin,
+        timeoutMax          = settings.circuit.timeoutMax,
+        timeoutMinSamples   = settings.circuit.timeoutMinSamples
+    )
+    pflinkclient.pacers.configure(
+        enabled             = settings.pacing.paceEnabled,
+        rate                = settings.pacing.paceRate,
+        minRate             = settings.pacing.paceMinRate,
+        maxRate             = settings.pacing.paceMaxRate,
+        increase            = settings.pacing.paceIncrease,
+        decrease            = settings.pacing.paceDecrease,
+        latencyTarget       = settings.pacing.paceLatencyTarget,
+        cooldown            = settings.pacing.paceCooldown
+    )
+    # Sample the host state reported by /hello/
+    sysinfo.sampler.configure(settings.hello.helloSampleInterval)
+    await sysinfo.sampler.start()
+    # Renew the pflink auth token before it expires
+    relayController.pflinkToken.renew_start(relayController.pflinkAuthToken_fetch)
+    # Re-poll relayed workflows
+    relayController.workflowTracker.start()
+    # Check the health of each node of a pflink pool
+    relayController.pflinkHealth.start(relayController.pflinkNodes_probed)
+    # Share the rate limit buckets with other workers
+    relayController.ingressLimiter.start()
+    # Replay relays queued in the outbox
+    if relayController.relayOutbox is not None:
+        relayController.relayOutbox.start(relayController.outbox_replay, settings.outbox.outboxPollInterval)
+    # Pick up configuration changes made by other workers
+    if settings.store is not None:
+        settings.store.watch_start(settings.config_reload, settings.sharedConfig.configPollInterval)
+    yield
+    if settings.store is not None:
+        await settings.store.watch_stop()
+    if relayController.relayOutbox is not None:
+        await relayController.relayOutbox.stop()
+    await relayController.workflowTracker.stop()
+    await relayController.pflinkHealth.stop()
+    await relayController.ingressLimiter.stop()
+    await relayController.pflinkToken.renew_stop()
+    await pflinkclient.pool_close()
+    await sysinfo.sampler.stop()
+    # Flush the queued event logs and ledger records
+    relayController.eventLog.stop()
+    if relayController.workflowLedger is not None:
+        relayController.workflowLedger.stop()
+
 app = FastAPI(
     title           = 'pfbridge',
     version         = str_version,
-    openapi_tags    = tags_metadata
+    openapi_tags    = tags_metadata,
+    lifespan        = lifespan
 )
 
 app.add_middleware(
@@ -85,3 +177,9 @@ app.include_router( credential_router,
 
 app.include_router( hello_router,
                     prefix  = '/api/v1')
+
+app.include_router( metrics_router,
+                    prefix  = '/api/v1')
+
+app.include_router( ledger_router,
+                    prefix  = '/api/v1')
@@ -4,7 +4,7 @@ str_description = """
 
 """
 
-from    pydantic            import BaseModel, Field
+from    pydantic            import BaseModel, Field, PrivateAttr
 from    typing              import Optional, List, Dict, Any
 from    datetime            import datetime
 from    enum                import Enum
@@ -95,9 +95,90 @@ class pflinkError(BaseModel):
 
 class pflinkURLs(BaseModel):
     productionURL:str               = settings.pflink.prodURL
+    productionURLs:list[str]        = settings.pflink.prodURLs
     testingURL:str                  = settings.pflink.testURL
     authURL:str                     = settings.pflinkAuth.pflink_auth_url
 
+class pflinkNode(BaseModel):
+    """
+    The health of one production pflink URL. A node is `routable` if it
+    passes its health checks and its circuit is not open.
+    """
+    url:str                         = ""
+    healthy:bool                    = True
+    routable:bool                   = True
+    circuit:str                     = "closed"
+    failures:int                    = 0
+    successes:int                   = 0
+    lastCheck:float                 = 0.0
+    latency:float                   = 0.0
+    lastError:str                   = ""
+
+class circuitStatus(BaseModel):
+    """
+    The circuit breaker state of one pflink URL. The `timeout` is the
+    request timeout currently in use, adapted to the observed latency.
+    """
+    url:str                         = ""
+    state:str                       = "closed"
+    failures:int                    = 0
+    rejected:int                    = 0
+    retryAfter:float                = 0.0
+    timeout:float                   = 0.0
+    samples:int                     = 0
+    latencyP50:float                = 0.0
+    latencyP99:float                = 0.0
+
+class ledgerWorkflow(BaseModel):
+    """
+    A workflow as recorded in the ledger. `relays` counts client calls
+    and `polls` background polls; `key` identifies the workflow in
+    ledger event queries.
+    """
+    id:int                          = 0
+    key:str                         = ""
+    StudyInstanceUID:str            = ""
+    SeriesInstanceUID:str           = ""
+    AccessionNumber:str             = ""
+    analyzeFunction:str             = ""
+    test:bool                       = False
+    firstSeen:float                 = 0.0
+    lastSeen:float                  = 0.0
+    relays:int                      = 0
+    polls:int                       = 0
+    pflinkState:str                 = ""
+    State:str                       = ""
+    Status:bool                     = False
+    ProgressPerc:int                = 0
+    ErrorWorkflow:str               = ""
+    response:Optional[dict]         = None
+
+class ledgerEvent(BaseModel):
+    """
+    A change of state of a workflow, as recorded in the ledger.
+    """
+    id:int                          = 0
+    key:str                         = ""
+    timestamp:float                 = 0.0
+    pflinkState:str                 = ""
+    State:str                       = ""
+    Status:bool                     = False
+    ProgressPerc:int                = 0
+    ErrorWorkflow:str               = ""
+    error:str                       = ""
+
+class ledgerWorkflowPage(BaseModel):
+    """
+    One page of ledger workflows, newest first. Pass `before` to get
+    the next page; it is null on the last page.
+    """
+    items:list[ledgerWorkflow]      = []
+    before:Optional[int]            = None
+
+class ledgerEventPage(BaseModel):
+    items:list[ledgerEvent]         = []
+    before:Optional[int]            = None
+
 class serviceURLs(BaseModel):
     urlCUBE:str                     = settings.serviceURLs.urlCUBE
     urlOrthanc:str                  = settings.serviceURLs.urlOrthanc
@@ -127,6 +208,21 @@ class clientResponseSchema(BaseModel):
     ErrorWorkflow:str               = ''
     ModelViolation:Any              = None
     ErrorComms:pflinkError          = pflinkError()
+    # The pflink workflow_state behind this response (not sent to the
+    # client), e.g. for state-dependent caching and tracking
+    _pflinkState:str                = PrivateAttr('UNKNOWN')
+    # Whether a comms failure was pflink being unreachable or failing
+    # (transport error or 5xx), so that the request may be replayed
+    _unavailable:bool               = PrivateAttr(False)
+
+class clientBatchItem(BaseModel):
+    """
+    One result of a streamed batch relay. Results are streamed in the
+    order they complete, so the `index` locates the corresponding
+    payload in the POSTed batch.
+    """
+    index:int                       = 0
+    response:clientResponseSchema   = clientResponseSchema()
 
 class analyzeFunctionList(BaseModel):
     """
@@ -40,12 +40,10 @@ def vaultKey_set(key:str) -> credentialModel.vaultStatus:
     * `credentialModel.vaultStatus`: a status response.
     """
     vaultStatus     = credentialModel.vaultStatus()
-    if settings.vault.locked:
+    if settings.vault.locked or not settings.vault_lock(key):
         vaultStatus.locked          = True
         vaultStatus.description     = "The vault is already locked and you cannot set a new key. Restart the server to reset."
     else:
-        settings.vault.vaultKey     = key
-        settings.vault.locked       = True
         vaultStatus.locked          = True
         vaultStatus.description     = "The vault is now locked. Use the vaultKey to access priviledged data."
     return vaultStatus
@@ -85,7 +83,7 @@ def credentialAccess_check(vaultKey:str) \
     if not settings.vault.locked:
         d_status.status     = False
         d_status.message    = "The vault has not been locked and no key set. No access is possible."
-    elif vaultKey != settings.vault.vaultKey:
+    elif not settings.vault_check(vaultKey):
         d_status.status     = False
         d_status.message    = "Incorrect vaultKey! No access is possible."
     else:
@@ -148,8 +146,9 @@ def CUBElogin_get(
     d_status = credentialAccess_check(vaultKey)
     if not d_status.status: return d_status
 
-    d_credentials.username  = settings.credentialsCUBE.usernameCUBE
-    d_credentials.password  = settings.credentialsCUBE.passwordCUBE
+    snap:settings.Snapshot  = settings.snapshot_get()
+    d_credentials.username  = snap.credentialsCUBE.usernameCUBE
+    d_credentials.password  = snap.credentialsCUBE.passwordCUBE
     return d_credentials
 
 @router.post(
@@ -207,7 +206,8 @@ def orthanclogin_get(
     d_status = credentialAccess_check(vaultKey)
     if not d_status.status: return d_status
 
-    d_credentials.username  = settings.credentialsOrthanc.usernameOrthanc
-    d_credentials.password  = settings.credentialsOrthanc.passwordOrthanc
+    snap:settings.Snapshot  = settings.snapshot_get()
+    d_credentials.username  = snap.credentialsOrthanc.usernameOrthanc
+    d_credentials.password  = snap.credentialsOrthanc.passwordOrthanc
     return d_credentials
 
@@ -0,0 +1,85 @@
+str_description = """
+    This route module exposes the workflow ledger: a persistent record
+    of every workflow relayed through `pfbridge`, and of each change in
+    its state. Queries are answered from the ledger alone, without
+    contacting `pflink`.
+"""
+
+from    fastapi             import  APIRouter, Query, HTTPException
+from    typing              import  Optional
+
+from    models              import  relayModel
+from    controllers         import  relayController
+
+router          = APIRouter()
+router.tags     = ['Ledger']
+
+def ledger_missing() -> HTTPException:
+    return HTTPException(
+        status_code = 404,
+        detail      = 'The workflow ledger is not enabled (set LEDGERPATH)'
+    )
+
+@router.get(
+    '/ledger/workflows/',
+    response_model  = relayModel.ledgerWorkflowPage,
+    summary         = '''
+    GET the recorded workflows, optionally filtered by DICOM tags or analysis.
+    '''
+)
+def ledgerWorkflows_get(
+        StudyInstanceUID    : str           = '',
+        SeriesInstanceUID   : str           = '',
+        AccessionNumber     : str           = '',
+        analyzeFunction     : str           = '',
+        limit               : int           = Query(50, ge = 1, le = 1000),
+        before              : Optional[int] = None
+) -> relayModel.ledgerWorkflowPage:
+    """
+    Description
+    -----------
+
+    Return the workflows recorded in the ledger that match all of the
+    given fields, most recently started first. Each workflow carries its
+    latest mapped response and state, and counts of client relays and
+    background polls.
+
+    Results are paged: pass the `before` value of a page to get the
+    next one. `before` is null on the last page.
+    """
+    page:relayModel.ledgerWorkflowPage | None = relayController.ledgerWorkflows_get(
+        {
+            'StudyInstanceUID':     StudyInstanceUID,
+            'SeriesInstanceUID':    SeriesInstanceUID,
+            'AccessionNumber':      AccessionNumber,
+            'analyzeFunction':      analyzeFunction
+        },
+        limit, before
+    )
+    if page is None:
+        raise ledger_missing()
+    return page
+
+@router.get(
+    '/ledger/workflows/{key}/events/',
+    response_model  = relayModel.ledgerEventPage,
+    summary         = '''
+    GET the recorded state changes of one workflow.
+    '''
+)
+def ledgerEvents_get(
+        key                 : str,
+        limit               : int           = Query(50, ge = 1, le = 1000),
+        before              : Optional[int] = None
+) -> relayModel.ledgerEventPage:
+    """
+    Description
+    -----------
+
+    Return the state changes of the workflow `key` (as reported in the
+    workflow listing), newest first and paged as above.
+    """
+    page:relayModel.ledgerEventPage | None = relayController.ledgerEvents_get(key, limit, before)
+    if page is None:
+        raise ledger_missing()
+    return page
@@ -0,0 +1,40 @@
+str_description = """
+    This route module exposes the internal metrics of `pfbridge` in the
+    Prometheus text exposition format.
+"""
+
+from    fastapi             import  APIRouter
+from    fastapi.responses   import  PlainTextResponse
+
+from    lib                 import  metrics
+
+router          = APIRouter()
+router.tags     = ['Metrics']
+
+@router.get(
+    '/metrics',
+    response_class  = PlainTextResponse,
+    summary         = '''
+    GET the service metrics in Prometheus text format.
+    '''
+)
+async def metrics_get() -> PlainTextResponse:
+    """
+    Description
+    -----------
+
+    Return the metrics of this `pfbridge` process in the Prometheus text
+    exposition format, suitable for scraping. These include latency
+    histograms of each relay stage (payload mapping, the `pflink` round
+    trip, response mapping and auth-token refresh), counters of comms
+    failures, model violations and 403 token retries, and a gauge of the
+    relays in flight. Relay metrics are labelled by `analyzeFunction`
+    and by `target` (`test` or `prod`).
+
+    Note that metrics are per process: if `pfbridge` is run with several
+    workers, each worker reports its own.
+    """
+    return PlainTextResponse(
+        metrics.registry.render(),
+        media_type  = 'text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -11,6 +11,7 @@ str_description = """
 
 
 from    fastapi             import  APIRouter, Query, HTTPException, BackgroundTasks, Request
+from    fastapi.responses   import  StreamingResponse
 from    typing              import  List, Dict, Any, Union
 
 from    models              import  relayModel, credentialModel
@@ -18,6 +19,7 @@ from    controllers         import  relayController
 from    routes              import  credentialRouter
 
 from    config              import  settings
+from    lib                 import  admission, deadline
 from    pftag               import  pftag
 import  pudb
 
@@ -39,7 +41,8 @@ def testURL_update(URL:str) -> relayModel.pflinkURLs:
     Update the internal *testing* URL endpoint of the `pflink` controller.
     Note that any updates PUT here will *NOT* persist across restarts
     of `pfbridge` -- on restart these will revert to startup/environement
-    settings.
+    settings. With a shared configuration store (`CONFIGSTOREPATH`) the
+    update is seen by all workers.
 
     Args:
     -----
@@ -49,11 +52,12 @@ def testURL_update(URL:str) -> relayModel.pflinkURLs:
     --------
     * `relayModel.pflinkURLs`: the updated set of pflinks
     """
-    settings.pflink.testURL         = URL
+    snap:settings.Snapshot          = settings.config_set('pflink', testURL = URL)
     update:relayModel.pflinkURLs    = relayModel.pflinkURLs()
-    update.productionURL            = settings.pflink.prodURL
-    update.testingURL               = settings.pflink.testURL
-    update.authURL                  = settings.pflinkAuth.pflink_auth_url
+    update.productionURL            = snap.pflink.prodURL
+    update.productionURLs           = snap.pflink.prodURLs
+    update.testingURL               = snap.pflink.testURL
+    update.authURL                  = snap.pflinkAuth.pflink_auth_url
     return update
 
 @router.put(
@@ -71,7 +75,8 @@ def prodURL_update(URL:str) -> relayModel.pflinkURLs:
     Update the internal *production* URL endpoint of the `pflink` controller.
     Note that any updates PUT here will *NOT* persist across restarts
     of `pfbridge` -- on restart these will revert to startup/environement
-    settings.
+    settings. With a shared configuration store (`CONFIGSTOREPATH`) the
+    update is seen by all workers.
 
     Args:
     -----
@@ -81,11 +86,48 @@ def prodURL_update(URL:str) -> relayModel.pflinkURLs:
     --------
     * `relayModel.pflinkURLs`: the updated set of pflinks
     """
-    settings.pflink.prodURL         = URL
+    snap:settings.Snapshot          = settings.config_set('pflink', prodURL = URL)
     update:relayModel.pflinkURLs    = relayModel.pflinkURLs()
-    update.productionURL            = settings.pflink.prodURL
-    update.testingURL               = settings.pflink.testURL
-    update.authURL                  = settings.pflinkAuth.pflink_auth_url
+    update.productionURL            = snap.pflink.prodURL
+    update.productionURLs           = snap.pflink.prodURLs
+    update.testingURL               = snap.pflink.testURL
+    update.authURL                  = snap.pflinkAuth.pflink_auth_url
+    return update
+
+@router.put(
+    '/pflink/prodURLs/',
+    response_model  = relayModel.pflinkURLs,
+    summary         = '''
+    PUT a new pool of pflink production URL endpoints.
+    '''
+)
+def prodURLs_update(URLs:list[str]) -> relayModel.pflinkURLs:
+    """
+    Description
+    -----------
+
+    Update the pool of *production* URL endpoints of `pflink`. Production
+    relays are spread over the pool by a consistent hash of their
+    `StudyInstanceUID` and `SeriesInstanceUID`, so that all polls of one
+    workflow reach the same `pflink`. Nodes that fail their health checks
+    are skipped; only their workflows move. An empty pool reverts to the
+    single `productionURL`. As above, updates do *NOT* persist across
+    restarts.
+
+    Args:
+    -----
+    * `URLs` (list[str]): the pool of URLs.
+
+    Returns:
+    --------
+    * `relayModel.pflinkURLs`: the updated set of pflinks
+    """
+    snap:settings.Snapshot          = settings.config_set('pflink', prodURLs = URLs)
+    update:relayModel.pflinkURLs    = relayModel.pflinkURLs()
+    update.productionURL            = snap.pflink.prodURL
+    update.productionURLs           = snap.pflink.prodURLs
+    update.testingURL               = snap.pflink.testURL
+    update.authURL                  = snap.pflinkAuth.pflink_auth_url
     return update
 
 @router.put(
@@ -103,7 +145,8 @@ def authURL_update(URL:str) -> relayModel.pflinkURLs:
     Update the internal *auth token* URL endpoint of the `pflink` controller.
     Note that any updates PUT here will *NOT* persist across restarts
     of `pfbridge` -- on restart these will revert to startup/environement
-    settings.
+    settings. With a shared configuration store (`CONFIGSTOREPATH`) the
+    update is seen by all workers.
 
     Args:
     -----
@@ -113,11 +156,12 @@ def authURL_update(URL:str) -> relayModel.pflinkURLs:
     --------
     * `relayModel.pflinkURLs`: the updated set of pflinks
     """
-    settings.pflinkAuth.pflink_auth_url         = URL
+    snap:settings.Snapshot                      = settings.config_set('pflinkAuth', pflink_auth_url = URL)
     update:relayModel.pflinkURLs                = relayModel.pflinkURLs()
-    update.productionURL                        = settings.pflink.prodURL
-    update.testingURL                           = settings.pflink.testURL
-    update.authURL                              = settings.pflinkAuth.pflink_auth_url
+    update.productionURL                        = snap.pflink.prodURL
+    update.productionURLs                       = snap.pflink.prodURLs
+    update.testingURL                           = snap.pflink.testURL
+    update.authURL                              = snap.pflinkAuth.pflink_auth_url
     return update
 
 
@@ -136,7 +180,8 @@ def ignoreDuplicate_update(flag:bool):
     Update the internal flag that controls the "ignore duplicate" of `pflink`
     Note that any updates PUT here will *NOT* persist across restarts
     of `pfbridge` -- on restart these will revert to startup/environement
-    settings.
+    settings. With a shared configuration store (`CONFIGSTOREPATH`) the
+    update is seen by all workers.
 
     Args:
     -----
@@ -146,7 +191,7 @@ def ignoreDuplicate_update(flag:bool):
     --------
     * A confirmation response reflecting the update made by the PUT request.
     """
-    settings.pflink.ignore_duplicate = flag
+    settings.config_set('pflink', ignore_duplicate = flag)
     return {"Ignore duplicate flag set to": flag}
 
 @router.get(
@@ -171,12 +216,61 @@ def urls_retFromModel() -> relayModel.pflinkURLs:
     -------
     * `relayModel.pflinkURLs`: The model URLs
     """
+    snap:settings.Snapshot          = settings.snapshot_get()
     current:relayModel.pflinkURLs   = relayModel.pflinkURLs()
-    current.productionURL           = settings.pflink.prodURL
-    current.testingURL              = settings.pflink.testURL
-    current.authURL                 = settings.pflinkAuth.pflink_auth_url
+    current.productionURL           = snap.pflink.prodURL
+    current.productionURLs          = snap.pflink.prodURLs
+    current.testingURL              = snap.pflink.testURL
+    current.authURL                 = snap.pflinkAuth.pflink_auth_url
     return current
 
+@router.get(
+    '/pflink/circuits/',
+    response_model  = list[relayModel.circuitStatus],
+    summary         = '''
+    GET the circuit breaker state of the pflink URLs.
+    '''
+)
+def circuits_get() -> list[relayModel.circuitStatus]:
+    """
+    Description
+    -----------
+
+    Return the circuit breaker state of each `pflink` URL that has been
+    used. After repeated failures a circuit "opens" and relays to that
+    URL fail at once with a "Comms failure" until `retryAfter` seconds
+    have passed, when a trial relay is let through. The `timeout` is the
+    request timeout currently in use, adapted to the observed latency.
+
+    Returns
+    -------
+    * `list[relayModel.circuitStatus]`: one entry per URL
+    """
+    return relayController.circuits_status()
+
+@router.get(
+    '/pflink/nodes/',
+    response_model  = list[relayModel.pflinkNode],
+    summary         = '''
+    GET the health of the pflink production pool.
+    '''
+)
+def nodes_get() -> list[relayModel.pflinkNode]:
+    """
+    Description
+    -----------
+
+    Return the health of each URL in the `pflink` production pool, as
+    seen by its periodic health checks and its circuit breaker. Relays
+    are only routed to `routable` nodes (unless none is). Health checks
+    only run when the pool has more than one node.
+
+    Returns
+    -------
+    * `list[relayModel.pflinkNode]`: one entry per URL
+    """
+    return relayController.pflinkNodes_status()
+
 @router.get(
     '/service/URLs/',
     response_model  = relayModel.serviceURLs,
@@ -199,9 +293,10 @@ def serviceUrls_retFromModel() -> relayModel.serviceURLs:
     -------
     * `relayModel.serviceURLs`: The model URLs
     """
+    snap:settings.Snapshot          = settings.snapshot_get()
     current:relayModel.serviceURLs  = relayModel.serviceURLs()
-    current.urlCUBE                 = settings.serviceURLs.urlCUBE
-    current.urlOrthanc              = settings.serviceURLs.urlOrthanc
+    current.urlCUBE                 = snap.serviceURLs.urlCUBE
+    current.urlOrthanc              = snap.serviceURLs.urlOrthanc
     return current
 
 @router.put(
@@ -220,7 +315,8 @@ def urlCUBE_update(URL:str) -> relayModel.serviceURLs:
 
     Note that any updates PUT here will *NOT* persist across restarts
     of `pfbridge` -- on restart these will revert to startup/environement
-    settings.
+    settings. With a shared configuration store (`CONFIGSTOREPATH`) the
+    update is seen by all workers.
 
     Args:
     -----
@@ -230,9 +326,10 @@ def urlCUBE_update(URL:str) -> relayModel.serviceURLs:
     --------
     * `relayModel.serviceURLs`: the updated set of service URLs
     """
-    settings.serviceURLs.urlCUBE    = URL
+    snap:settings.Snapshot          = settings.config_set('serviceURLs', urlCUBE = URL)
     update:relayModel.serviceURLs   = relayModel.serviceURLs()
-    update.urlCUBE                  = URL
+    update.urlCUBE                  = snap.serviceURLs.urlCUBE
+    update.urlOrthanc               = snap.serviceURLs.urlOrthanc
     return update
 
 @router.put(
@@ -251,7 +348,8 @@ def urlOrthanc_update(URL:str) -> relayModel.serviceURLs:
 
     Note that any updates PUT here will *NOT* persist across restarts
     of `pfbridge` -- on restart these will revert to startup/environement
-    settings.
+    settings. With a shared configuration store (`CONFIGSTOREPATH`) the
+    update is seen by all workers.
 
     Args:
     -----
@@ -261,9 +359,10 @@ def urlOrthanc_update(URL:str) -> relayModel.serviceURLs:
     --------
     * `relayModel.serviceURLs`: the updated set of service URLs
     """
-    settings.serviceURLs.urlOrthanc = URL
+    snap:settings.Snapshot          = settings.config_set('serviceURLs', urlOrthanc = URL)
     update:relayModel.serviceURLs   = relayModel.serviceURLs()
-    update.urlOrthanc               = URL
+    update.urlCUBE                  = snap.serviceURLs.urlCUBE
+    update.urlOrthanc               = snap.serviceURLs.urlOrthanc
     return update
 
 
@@ -275,7 +374,7 @@ def urlOrthanc_update(URL:str) -> relayModel.serviceURLs:
     '''
 )
 async def retrieve_analyze_methods() -> list[str]:
-    return list(settings.analyses.analyses.keys())
+    return list(settings.snapshot_get().analyses.keys())
 
 
 @router.put(
@@ -297,7 +396,8 @@ def analysis_update(
     Simply update `analysis` settings class values -- key/value updates
     are specified in query parameters. Note that any changes to the base
     settings values are only valid in this running instance of `pfbridge`!
-    Replicas will not be updated, nor will any changes persist post
+    Unless a shared configuration store (`CONFIGSTOREPATH`) is used,
+    other workers will not be updated. Changes never persist post
     restart!
 
     Valid keys are:
@@ -312,20 +412,20 @@ def analysis_update(
     -------
     * `settings.Analysis`: The current Analysis settings
     """
-    if not settings.analyses.analyses.get(analysis_name):
-        settings.analyses.analyses[analysis_name] = settings.DylldAnalysis()
+    d_update:dict = {}
     match key:
         case 'analysisPipelineName':
-            settings.analyses.analyses[analysis_name].pipelineName  = value
+            d_update['pipelineName']    = value
         case 'analysisPluginName':
-            settings.analyses.analyses[analysis_name].pluginName    = value
+            d_update['pluginName']      = value
         case 'analysisPluginArgs':
-            settings.analyses.analyses[analysis_name].pluginArgs    = value
+            d_update['pluginArgs']      = value
         case 'analysisPluginVersion':
-            settings.analyses.analyses[analysis_name].pluginVersion = value
+            d_update['pluginVersion']   = value
         case 'analysisFeedName':
-            settings.analyses.analyses[analysis_name].feedName      = value
-    return settings.analyses.analyses[analysis_name]
+            d_update['feedName']        = value
+    snap:settings.Snapshot = settings.analysis_set(analysis_name, **d_update)
+    return snap.analyses[analysis_name]
 
 @router.get(
     '/analysis/',
@@ -347,15 +447,16 @@ def analysisValues_get(vaultKey:str = "", analysis_name:str = "") -> settings.Dy
     -------
     * `settings.Analysis`: The current Analysis settings
     """
-    if settings.analyses.analyses.get(analysis_name):
-        values:settings.DylldAnalysis   = settings.analyses.analyses[analysis_name]
+    snap:settings.Snapshot              = settings.snapshot_get()
+    if snap.analyses.get(analysis_name):
+        values:settings.DylldAnalysis   = snap.analyses[analysis_name]
     else:
         values:settings.DylldAnalysis   = settings.analysis
     if vaultKey:
         d_vaultAccess:credentialModel.credentialsStatus = credentialModel.credentialsStatus()
         d_vaultAccess = credentialRouter.credentialAccess_check(vaultKey)
-        if d_vaultAccess.status:
-            decoded = settings.analysis_decode(analysis_name)
+        if d_vaultAccess.status and snap.analyses.get(analysis_name):
+            decoded = settings.analysis_decode(analysis_name, snap)
             values = decoded
     return values
 
@@ -420,12 +521,205 @@ async def workflow_do(
 
     A response on the status of the workflow is immediately returned.
 
+    If too many relays are already in flight to `pflink`, the call is
+    refused with a 429 (wait queue full) or 503 (queued for too long)
+    and a `Retry-After` header. A caller (identified by its `X-API-Key`,
+    or else its host) that exceeds its rate limit for the
+    `analyzeFunction` is also refused with a 429.
+
+    Callers may send their own timeout, in seconds, in an
+    `X-Request-Timeout` header. If no answer is ready by then the call
+    fails fast with a 504, and work on it is cancelled.
+
     """
     # pudb.set_trace()
-    d_ret:relayModel.clientResponseSchema = await relayController.relayAndEchoBack(
-            relayPayload, request, test
-    )
+    requestDeadline:float | None = requestDeadline_get(request)
+    try:
+        relayController.ingress_check(request, [relayPayload])
+        d_ret:relayModel.clientResponseSchema = await relayController.relayAndEchoBack(
+                relayPayload, request, test, requestDeadline
+        )
+    except admission.AdmissionRejected as e:
+        admissionRejected_raise(e)
+    except deadline.DeadlineExceeded as e:
+        raise HTTPException(status_code = 504, detail = str(e))
     return d_ret
 
+def requestDeadline_get(request:Request) -> float | None:
+    """
+    The deadline of a request, from its timeout header (if any).
+    """
+    header:str = settings.requestDeadline.deadlineHeader
+    try:
+        return deadline.timeout_parse(
+            request.headers.get(header),
+            settings.requestDeadline.deadlineMargin,
+            settings.requestDeadline.deadlineDefault
+        )
+    except ValueError as e:
+        raise HTTPException(status_code = 400, detail = "Invalid %s header: %s" % (header, e))
+
+def admissionRejected_raise(e:admission.AdmissionRejected) -> None:
+    raise HTTPException(
+        status_code = e.status,
+        detail      = str(e),
+        headers     = {'Retry-After': str(e.retryAfter)}
+    )
+
+def ingress_check(request:Request, payloads:list[relayModel.clientPayload]) -> None:
+    try:
+        relayController.ingress_check(request, payloads)
+    except admission.AdmissionRejected as e:
+        admissionRejected_raise(e)
 
+def batchSize_check(payloads:list[relayModel.clientPayload]) -> None:
+    if len(payloads) > settings.batch.batchMaxItems:
+        raise HTTPException(
+            status_code = 413,
+            detail      = "Batch of %d exceeds the maximum of %d payloads" %
+                          (len(payloads), settings.batch.batchMaxItems)
+        )
 
+@router.post(
+    '/analyze/batch/',
+    response_model  = list[relayModel.clientResponseSchema],
+    summary         = '''
+    POST a list of image and analysis directives that are relayed
+    concurrently to a remote service.
+    '''
+)
+async def workflowBatch_do(
+    relayPayloads   : list[relayModel.clientPayload],
+    request         : Request,
+    test:bool       = False
+) -> list[relayModel.clientResponseSchema]:
+    """
+    Description
+    -----------
+
+    Batch version of `/analyze/`. Each `clientPayload` in the POSTed
+    list is relayed to `pflink`, with at most `batchConcurrency` relays
+    in flight at any time. The per-payload responses are returned in
+    the same order as the POSTed payloads. Payloads refused admission
+    (see `/analyze/`) are returned with a `State` of "Rejected". Each
+    payload counts against the caller's rate limit; a batch that exceeds
+    it is refused as a whole with a 429.
+
+    Send a `?test=true` boolean query parameter to use the `pflink`
+    test API.
+    """
+    batchSize_check(relayPayloads)
+    ingress_check(request, relayPayloads)
+    l_ret:list[relayModel.clientResponseSchema] = await relayController.relayBatch(
+            relayPayloads, request, test
+    )
+    return l_ret
+
+@router.post(
+    '/analyze/batch/stream/',
+    response_class  = StreamingResponse,
+    summary         = '''
+    POST a list of image and analysis directives and stream back the
+    responses (as NDJSON) as each completes.
+    '''
+)
+async def workflowBatch_stream(
+    relayPayloads   : list[relayModel.clientPayload],
+    request         : Request,
+    test:bool       = False
+) -> StreamingResponse:
+    """
+    Description
+    -----------
+
+    Streaming version of `/analyze/batch/`. The response is a stream of
+    newline delimited JSON objects, one per payload, emitted in the order
+    in which the relays complete:
+
+    ```
+    {"index": 3, "response": {"Status": true, "State": "...", ...}}
+    ```
+
+    where `index` is the position of the payload in the POSTed list.
+    """
+    batchSize_check(relayPayloads)
+    ingress_check(request, relayPayloads)
+
+    async def ndjson():
+        async for item in relayController.relayBatch_iter(relayPayloads, request, test):
+            yield item.json() + '\n'
+
+    return StreamingResponse(ndjson(), media_type = 'application/x-ndjson')
+
+@router.post(
+    '/analyze/watch/',
+    response_class  = StreamingResponse,
+    summary         = '''
+    POST an image and analysis directive and receive a stream (as
+    Server-Sent Events) of the workflow's progress.
+    '''
+)
+async def workflow_watch(
+    relayPayload    : relayModel.clientPayload,
+    request         : Request,
+    test:bool       = False
+) -> StreamingResponse:
+    """
+    Description
+    -----------
+
+    Subscribe to the progress of the workflow identified by the
+    `imageMeta` and `analyzeFunction` of the POSTed `clientPayload`
+    (the same payload as for `/analyze/`). If the workflow does not
+    exist yet, the first poll starts it.
+
+    The response is a `text/event-stream`. The current status is sent
+    first, then one `status` event each time it changes:
+
+    ```
+    event: status
+    data: {"Status": true, "State": "Analysis running in ChRIS", ...}
+    ```
+
+    and a final `end` event once the workflow is completed, deleted or
+    has failed. Comment lines are sent as keep-alives while nothing
+    changes.
+
+    Watched workflows are followed by the background tracker, so
+    `pfbridge` polls `pflink` no more often for a workflow however many
+    clients are watching it.
+
+    Send a `?test=true` boolean query parameter to use the `pflink`
+    test API.
+    """
+    if relayController.watchStreams_count() >= settings.watch.watchMaxStreams:
+        raise HTTPException(
+            status_code = 503,
+            detail      = "Too many open progress streams",
+            headers     = {'Retry-After': str(int(settings.watch.watchHeartbeat))}
+        )
+
+    try:
+        relayController.ingress_check(request, [relayPayload])
+        watch = await relayController.relayWatch_open(relayPayload, request, test)
+    except admission.AdmissionRejected as e:
+        admissionRejected_raise(e)
+    if watch is None:
+        raise HTTPException(
+            status_code = 503,
+            detail      = "This workflow cannot be watched at present (pflink could not be reached, or too many workflows are tracked)"
+        )
+
+    async def events():
+        async for update in relayController.relayWatch_iter(*watch):
+            if update is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield 'event: status\ndata: %s\n\n' % update.json()
+        yield 'event: end\ndata: {}\n\n'
+
+    return StreamingResponse(
+        events(),
+        media_type  = 'text/event-stream',
+        headers     = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1,6 @@
+import  os
+import  sys
+
+# The application modules import each other from the top level
+# (`from lib import ...`), as they do when run from pfbridge/.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pfbridge'))
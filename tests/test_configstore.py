@@ -0,0 +1,101 @@
+import  asyncio
+import  json
+import  os
+import  stat
+import  threading
+
+import  pytest
+
+from    models              import relayModel      # imports config.settings first
+from    config              import settings
+from    controllers         import credentialController
+from    lib                 import configstore
+from    models              import credentialModel
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    # Share the configuration through a fresh store, and put the settings
+    # module back as it was afterwards.
+    for name in ('store', 'storeVersion', 'vaultDigest', 'snapshot', 'pflink', 'pflinkAuth',
+                 'credentialsCUBE', 'credentialsOrthanc', 'serviceURLs', 'analyses'):
+        monkeypatch.setattr(settings, name, getattr(settings, name))
+    monkeypatch.setattr(settings, 'vault', settings.Vault(locked = False, vaultKey = ''))
+    path:str = str(tmp_path / 'state' / 'config.db')
+    store = settings.configStore_open(path, 'boot-1')
+    yield store
+    store.close()
+
+def documents(store:configstore.ConfigStore) -> dict:
+    return store.load()[1]
+
+def test_store_file_is_private(shared):
+    assert stat.S_IMODE(os.stat(shared.path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(os.path.dirname(shared.path)).st_mode) == 0o700
+
+def test_seed_once_per_boot(tmp_path):
+    store = configstore.ConfigStore(str(tmp_path / 'config.db'))
+    assert store.seed({'pflink': {'prodURL': 'a'}}, 'boot-1')
+    store.update('pflink', lambda current: {**current, 'prodURL': 'b'})
+    assert not store.seed({'pflink': {'prodURL': 'a'}}, 'boot-1')
+    assert store.load()[1]['pflink']['prodURL'] == 'b'
+    assert store.seed({'pflink': {'prodURL': 'a'}}, 'boot-2')
+    assert store.load()[1]['pflink']['prodURL'] == 'a'
+    store.close()
+
+def test_secrets_are_not_stored(shared):
+    password:str = settings.snapshot.pflinkAuth.pflink_password
+    snap = settings.config_set('pflinkAuth', pflink_auth_url = 'http://auth.local/')
+    assert snap.pflinkAuth.pflink_auth_url == 'http://auth.local/'
+    assert snap.pflinkAuth.pflink_password == password
+    d_documents:dict = documents(shared)
+    assert d_documents['pflinkAuth']['pflink_auth_url'] == 'http://auth.local/'
+    assert 'credentialsCUBE' not in d_documents and 'credentialsOrthanc' not in d_documents
+    assert password not in json.dumps(d_documents)
+
+def test_secrets_cannot_be_set_when_shared(shared):
+    with pytest.raises(ValueError):
+        settings.config_set('pflinkAuth', pflink_password = 'hunter2')
+    with pytest.raises(ValueError):
+        settings.config_set('credentialsCUBE', usernameCUBE = 'radiology', passwordCUBE = 's3cret')
+    status = credentialController.CUBElogin_set(
+        credentialModel.credentials(username = 'radiology', password = 's3cret'), None)
+    assert not status.status
+    assert settings.snapshot.credentialsCUBE.passwordCUBE != 's3cret'
+
+def test_shared_change_keeps_environment_secrets(shared):
+    password:str = settings.snapshot.pflinkAuth.pflink_password
+    shared.update('pflinkAuth', lambda current: {**current, 'pflink_auth_url': 'http://other/'})
+    snap = settings.config_reload()
+    assert snap.pflinkAuth.pflink_auth_url == 'http://other/'
+    assert snap.pflinkAuth.pflink_password == password
+
+def test_vault_key_is_stored_as_a_hash(shared):
+    assert settings.vault_lock('opensesame')
+    assert not settings.vault_lock('another')
+    assert 'opensesame' not in json.dumps(documents(shared))
+    assert settings.vault_check('opensesame')
+    assert not settings.vault_check('wrong')
+    # A worker that did not set the key checks it against the hash
+    settings.vault.vaultKey = ''
+    assert not settings.vault_check('wrong')
+    assert settings.vault_check('opensesame')
+
+def test_watch_reloads_off_the_event_loop(tmp_path):
+    path:str = str(tmp_path / 'config.db')
+    store = configstore.ConfigStore(path)
+    other = configstore.ConfigStore(path)
+    l_threads:list[int] = []
+
+    async def go():
+        store.watch_start(lambda: l_threads.append(threading.get_ident()), interval = 0.01)
+        other.update('pflink', lambda current: {'prodURL': 'b'})
+        for _ in range(100):
+            if l_threads:
+                break
+            await asyncio.sleep(0.01)
+        await store.watch_stop()
+        return threading.get_ident()
+    loop:int = asyncio.run(go())
+    assert l_threads and loop not in l_threads
+    store.close()
+    other.close()
@@ -0,0 +1,44 @@
+import  time
+
+import  pytest
+
+from    lib                 import deadline
+
+def test_extend_takes_the_later_deadline():
+    shared = deadline.Deadline(10.0)
+    shared.extend(5.0)
+    assert shared.at == 10.0
+    shared.extend(20.0)
+    assert shared.at == 20.0
+    shared.extend(None)                     # a caller without a deadline
+    assert shared.at is None
+    shared.extend(30.0)
+    assert shared.at is None
+
+def test_remaining_and_expiry():
+    assert deadline.Deadline().remaining() is None
+    assert not deadline.Deadline().isExpired()
+    assert deadline.Deadline(time.monotonic() + 10).remaining() == pytest.approx(10, abs = 0.1)
+    assert deadline.Deadline(time.monotonic() - 1).isExpired()
+
+def test_check_uses_the_current_deadline():
+    deadline.check()                        # no deadline: unbounded
+    assert deadline.remaining() is None
+    token = deadline.current.set(deadline.Deadline(time.monotonic() - 1))
+    try:
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.check('POST')
+        assert deadline.remaining() < 0
+    finally:
+        deadline.current.reset(token)
+
+def test_timeout_parse():
+    now:float = time.monotonic()
+    assert deadline.timeout_parse(None) is None
+    assert deadline.timeout_parse('') is None
+    assert deadline.timeout_parse(None, default = 5) == pytest.approx(now + 5, abs = 0.1)
+    assert deadline.timeout_parse('2', margin = 0.5) == pytest.approx(now + 1.5, abs = 0.1)
+    assert deadline.timeout_parse('0.1', margin = 0.5) == pytest.approx(now, abs = 0.1)
+    for value in ('0', '-1', 'soon'):
+        with pytest.raises(ValueError):
+            deadline.timeout_parse(value)
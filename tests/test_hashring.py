@@ -0,0 +1,66 @@
+import  asyncio
+from    collections         import Counter
+
+from    lib                 import hashring, health
+
+nodes:list[str] = ['http://pflink-%d/api/v1/workflow' % i for i in range(4)]
+keys:list[str]  = ['study-%d|series' % i for i in range(2000)]
+
+def test_keys_are_spread_over_all_nodes():
+    ring = hashring.HashRing(nodes)
+    load = Counter(ring.node_get(key) for key in keys)
+    assert set(load) == set(nodes)
+    assert min(load.values()) > len(keys) / len(nodes) / 2
+
+def test_same_key_same_node():
+    assert [hashring.HashRing(nodes).node_get(key) for key in keys[:50]] == \
+           [hashring.HashRing(list(reversed(nodes))).node_get(key) for key in keys[:50]]
+
+def test_adding_a_node_only_moves_keys_to_it():
+    before  = hashring.HashRing(nodes)
+    after   = hashring.HashRing(nodes + ['http://pflink-new/api/v1/workflow'])
+    for key in keys:
+        if before.node_get(key) != after.node_get(key):
+            assert after.node_get(key) == 'http://pflink-new/api/v1/workflow'
+
+def test_unhealthy_node_hands_its_keys_over_only():
+    ring    = hashring.HashRing(nodes)
+    down    = nodes[0]
+    moved   = Counter()
+    for key in keys:
+        owner:str = ring.node_get(key)
+        node:str  = ring.node_get(key, lambda url: url != down)
+        if owner != down:
+            assert node == owner
+        else:
+            moved[node] += 1
+    assert set(moved) == set(nodes[1:])           # spread over the rest
+
+def test_no_healthy_node_falls_back_to_owner():
+    ring = hashring.HashRing(nodes)
+    assert ring.node_get(keys[0], lambda url: False) == ring.node_get(keys[0])
+    assert hashring.HashRing([]).node_get(keys[0]) is None
+
+def test_nodes_iter_yields_each_node_once():
+    ring = hashring.HashRing(nodes + nodes[:1])
+    assert sorted(ring.nodes_iter(keys[0])) == sorted(nodes)
+
+def test_health_falls_and_rises():
+    async def go():
+        l_up:list[bool] = [False, False, True, True]
+
+        async def probe(url:str) -> None:
+            if not l_up.pop(0):
+                raise RuntimeError('down')
+
+        checker = health.HealthChecker(probe, fall = 2, rise = 2)
+        assert checker.isHealthy(nodes[0])         # not probed yet
+        await checker.check(nodes[0])
+        assert checker.isHealthy(nodes[0])
+        await checker.check(nodes[0])
+        assert not checker.isHealthy(nodes[0])
+        await checker.check(nodes[0])
+        assert not checker.isHealthy(nodes[0])
+        await checker.check(nodes[0])
+        assert checker.isHealthy(nodes[0])
+    asyncio.run(go())
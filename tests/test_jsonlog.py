@@ -0,0 +1,35 @@
+import  io
+import  json
+import  threading
+
+from    lib                 import jsonlog
+
+def test_records_written_by_stage_verbosity():
+    stream:io.StringIO      = io.StringIO()
+    log:jsonlog.JSONLog     = jsonlog.JSONLog(stages = {'off': 0, 'summary': 1, 'full': 2}, stream = stream)
+    record:dict             = {'a': 1, 'nested': {'b': 2}}
+    for stage in ('off', 'summary', 'full'):
+        log.emit(stage, record)
+    log.stop()
+    l_lines:list[dict]      = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(line['stage'], line['record']) for line in l_lines] == [('summary', {'a': 1}), ('full', record)]
+
+def test_concurrent_emits_start_one_writer():
+    log:jsonlog.JSONLog     = jsonlog.JSONLog(stream = io.StringIO())
+    barrier                 = threading.Barrier(16)
+    before:set[str]         = {thread.name for thread in threading.enumerate()}
+
+    def emit() -> None:
+        barrier.wait()
+        log.emit('stage', {'a': 1})
+
+    l_threads = [threading.Thread(target = emit) for _ in range(16)]
+    for thread in l_threads:
+        thread.start()
+    for thread in l_threads:
+        thread.join()
+    writers = [thread for thread in threading.enumerate() if thread.name == 'jsonlog']
+    log.stop()
+    assert 'jsonlog' not in before
+    assert len(writers) == 1
+    assert len(log.stream.getvalue().splitlines()) == 16
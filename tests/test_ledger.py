@@ -0,0 +1,65 @@
+import  os
+import  stat
+
+import  pytest
+
+from    lib                 import ledger, metrics
+
+def meta(series:str) -> dict[str, str]:
+    return {'StudyInstanceUID': 'study', 'SeriesInstanceUID': series,
+            'AccessionNumber': 'acc', 'analyzeFunction': 'dylld'}
+
+def response(state:str, perc:int = 0) -> dict:
+    return {'Status': True, 'State': state, 'ProgressPerc': perc, 'ErrorWorkflow': ''}
+
+@pytest.fixture
+def book(tmp_path):
+    workflows = ledger.Ledger(str(tmp_path / 'ledger.db'))
+    yield workflows
+    workflows.stop()
+
+def test_records_workflows_and_state_changes(book):
+    book.record('k1', meta('s1'), False, 'started', response('Started'))
+    book.record('k1', meta('s1'), False, 'started', response('Started'), isPoll = True)
+    book.record('k1', meta('s1'), False, 'completed', response('Done', 100), isPoll = True)
+    book.record('k2', meta('s2'), True, 'started', response('Started'))
+    book.stop()
+    l_workflows, after = book.workflows_query({'SeriesInstanceUID': 's1'})
+    assert after is None
+    assert len(l_workflows) == 1
+    assert l_workflows[0]['relays'] == 1 and l_workflows[0]['polls'] == 2
+    assert l_workflows[0]['State'] == 'Done'
+    assert l_workflows[0]['response']['ProgressPerc'] == 100
+    l_events, _ = book.events_query('k1')
+    assert [event['State'] for event in l_events] == ['Done', 'Started']
+
+def test_pages_newest_first(book):
+    for i in range(5):
+        book.record('k%d' % i, meta('s%d' % i), False, 'started', response('Started'))
+    book.stop()
+    l_first, after = book.workflows_query({'StudyInstanceUID': 'study'}, limit = 3)
+    assert [item['key'] for item in l_first] == ['k4', 'k3', 'k2']
+    l_rest, after = book.workflows_query({'StudyInstanceUID': 'study'}, limit = 3, before = after)
+    assert [item['key'] for item in l_rest] == ['k1', 'k0']
+    assert after is None
+
+def test_purges_workflows_not_seen_for_max_age(book):
+    book.record('old', meta('s1'), False, 'started', response('Started'))
+    book.stop()
+    book.maxAge = -1.0                      # everything is too old
+    book.purge(book.connect())
+    assert book.workflows_query({})[0] == []
+    assert book.events_query('old')[0] == []
+
+def test_full_queue_drops_and_counts(tmp_path):
+    book = ledger.Ledger(str(tmp_path / 'ledger.db'), queueSize = 1)
+    book.thread = object()                  # no writer: the queue stays full
+    book.record('k1', meta('s1'), False, 'started', response('Started'))
+    book.record('k2', meta('s2'), False, 'started', response('Started'))
+    assert book.dropped == 1
+    counter = metrics.Registry().counter('dropped_total', 'Dropped', ('reason',))
+    counter.function_set(lambda: book.dropped, 'queue_full')
+    assert 'dropped_total{reason="queue_full"} 1' in counter.render()
+
+def test_ledger_file_is_private(book):
+    assert stat.S_IMODE(os.stat(book.path).st_mode) == 0o600
@@ -0,0 +1,43 @@
+import  httpx
+import  pytest
+
+from    lib                 import map
+
+def pflinkResponse(**fields) -> httpx.Response:
+    d_body:dict = {'status': True, 'workflow_state': 'analyzing study',
+                   'workflow_progress_perc': 50, 'error': '', **fields}
+    return httpx.Response(200, json = d_body)
+
+def test_default_map_describes_states():
+    boundary:map.Map = map.Map()
+    toClient = boundary.fromPflink_transform(pflinkResponse())
+    assert (toClient.Status, toClient.State, toClient.ProgressPerc) == (True, 'Analysis running in ChRIS', 50)
+    assert boundary.workflowState_get(toClient) == 'analyzing study'
+
+def test_failed_workflow_keeps_its_pflink_state():
+    boundary:map.Map = map.Map()
+    toClient = boundary.fromPflink_transform(pflinkResponse(status = False, error = 'boom'))
+    assert toClient.State == boundary.failedState
+    assert boundary.workflowState_get(toClient) == 'analyzing study'
+    assert boundary.workflowState_get(toClient.copy(deep = True)) == 'analyzing study'
+    assert '_pflinkState' not in toClient.dict()
+
+def test_model_violation():
+    toClient = map.Map().fromPflink_transform(httpx.Response(200, json = {'workflow_state': 'completed'}))
+    assert toClient.ModelViolation == {'workflow_state': 'completed'}
+
+def test_spec_overrides_states_and_projections():
+    boundary:map.Map = map.Map(spec = {'states': {'completed': 'Done!'}, 'projections': {'Status': 'status'}})
+    toClient = boundary.fromPflink_transform(pflinkResponse(workflow_state = 'completed'))
+    assert toClient.State == 'Done!'
+    assert toClient.ProgressPerc == 0
+
+@pytest.mark.parametrize('spec', [
+    {'projections': {'Statsu': 'status'}},
+    {'projections': {'Status': 'stauts'}},
+    {'projections': {'ErrorComms': 'error'}},
+    {'states': {'completed': 'Initializing workflow'}}
+])
+def test_invalid_specs_rejected_when_compiled(spec):
+    with pytest.raises(ValueError, match = "analysis 'x'"):
+        map.maps_compile({'x': spec})
@@ -0,0 +1,29 @@
+import  pytest
+
+from    lib                 import metrics
+
+def test_metric_is_abstract():
+    with pytest.raises(TypeError):
+        metrics.Metric('name', 'help')
+
+def test_render_exposition_format():
+    registry:metrics.Registry   = metrics.Registry()
+    counter                     = registry.counter('relays_total', 'Relays', ('target',))
+    gauge                       = registry.gauge('inflight', 'In flight')
+    histogram                   = registry.histogram('latency_seconds', 'Latency', buckets = (0.1, 1.0))
+    counter.inc('prod')
+    counter.inc('prod', amount = 2)
+    gauge.function_set(lambda: 7)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    l_lines:list[str]           = registry.render().splitlines()
+    assert '# TYPE relays_total counter' in l_lines
+    assert 'relays_total{target="prod"} 3.0' in l_lines
+    assert 'inflight 7' in l_lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in l_lines
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in l_lines
+    assert 'latency_seconds_count 2' in l_lines
+
+def test_registry_returns_existing_metric():
+    registry:metrics.Registry   = metrics.Registry()
+    assert registry.counter('a', 'A') is registry.counter('a', 'A')
@@ -0,0 +1,72 @@
+import  asyncio
+import  os
+import  stat
+
+import  pytest
+
+from    lib                 import outbox
+
+@pytest.fixture
+def box(tmp_path):
+    return outbox.Outbox(str(tmp_path / 'outbox.db'), baseDelay = 0.01, maxDelay = 0.04, lease = 30.0)
+
+def test_relay_is_queued_once(box):
+    async def go():
+        first, created  = await box.enqueue('k1', {'analyzeFunction': 'dylld'}, False, 'refused')
+        assert created
+        again, created  = await box.enqueue('k1', {'analyzeFunction': 'dylld'}, False, 'refused again')
+        assert not created
+        assert again.queued == first.queued
+        assert again.error == 'refused'
+        assert box.depth == 1 and len(box) == 1
+        await box.done('k1')
+        assert box.depth == 0
+        assert 'k1' not in box.keys
+    asyncio.run(go())
+
+def test_claimed_entries_are_leased(box, tmp_path):
+    async def go():
+        await box.enqueue('k1', {}, False, 'refused')
+        await asyncio.sleep(0.02)
+        other = outbox.Outbox(box.path)         # another worker on the same file
+        assert [entry.key for entry in await box.due_claim(10)] == ['k1']
+        assert await other.due_claim(10) == []
+    asyncio.run(go())
+
+def test_failed_replays_back_off_then_give_up(tmp_path):
+    async def go():
+        box = outbox.Outbox(str(tmp_path / 'outbox.db'), baseDelay = 1.0, maxDelay = 4.0, maxAttempts = 2)
+        entry, _ = await box.enqueue('k1', {}, False, 'refused')
+        assert await box.failed(entry, 'refused')
+        entry.attempts = 1
+        assert not await box.failed(entry, 'refused')
+        assert box.depth == 0 and box.abandoned == 1
+    asyncio.run(go())
+
+def test_backoff_is_capped_and_jittered(box):
+    for attempts in range(10):
+        delay:float = box.backoff(attempts)
+        cap:float   = min(box.maxDelay, box.baseDelay * 2 ** attempts)
+        assert cap / 2 <= delay <= cap
+
+def test_replays_until_delivered(box):
+    async def go():
+        l_attempts:list[str] = []
+
+        async def replay(entry:outbox.Entry) -> bool:
+            l_attempts.append(entry.key)
+            return len(l_attempts) >= 3
+
+        box.start(replay, poll = 0.01)
+        await box.enqueue('k1', {}, False, 'refused')
+        for _ in range(200):
+            if box.replayed:
+                break
+            await asyncio.sleep(0.01)
+        await box.stop()
+        assert l_attempts == ['k1'] * 3
+        assert box.replayed == 1 and box.depth == 0
+    asyncio.run(go())
+
+def test_outbox_file_is_private(box):
+    assert stat.S_IMODE(os.stat(box.path).st_mode) == 0o600
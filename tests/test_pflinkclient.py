@@ -0,0 +1,146 @@
+import  asyncio
+import  base64
+import  json
+import  time
+
+import  httpx
+import  pytest
+
+from    lib                 import deadline, pflinkclient
+
+def jwt_make(**claims) -> str:
+    payload:str = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip('=')
+    return 'header.%s.signature' % payload
+
+def test_token_renewed_within_margin():
+    now:float = time.time()
+    token = pflinkclient.AuthToken(jwt_make(iat = now, exp = now + 3600), margin = 60.0)
+    assert not token.isExpiring()
+    token = pflinkclient.AuthToken(jwt_make(iat = now - 3590, exp = now + 10), margin = 60.0)
+    assert token.isExpiring()
+
+def test_short_lived_token_margin_is_half_its_lifetime():
+    now:float = time.time()
+    token = pflinkclient.AuthToken(jwt_make(iat = now, exp = now + 2), margin = 60.0)
+    assert token.margin_get() == pytest.approx(1.0)
+    assert not token.isExpiring()
+
+def test_token_without_iat_counts_from_receipt():
+    token = pflinkclient.AuthToken(jwt_make(exp = time.time() + 10), margin = 60.0)
+    assert token.margin_get() == pytest.approx(5.0, abs = 0.1)
+    assert not token.isExpiring()
+
+def test_opaque_token_never_expiring():
+    token = pflinkclient.AuthToken('opaque', margin = 60.0)
+    assert token.expiry is None
+    assert not token.isExpiring()
+
+def test_refreshes_are_coalesced():
+    async def go():
+        token:pflinkclient.AuthToken    = pflinkclient.AuthToken('old')
+        l_fetches:list[int]             = []
+
+        async def fetch() -> str:
+            l_fetches.append(1)
+            await asyncio.sleep(0.01)
+            return 'new'
+
+        l_tokens = await asyncio.gather(*[token.refresh(fetch, stale = 'old') for _ in range(10)])
+        assert l_tokens == ['new'] * 10
+        assert len(l_fetches) == 1
+        # A caller holding a token that was already replaced does not refresh
+        assert await token.refresh(fetch, stale = 'old') == 'new'
+        assert len(l_fetches) == 1
+    asyncio.run(go())
+
+def test_missing_access_token_is_a_request_exception():
+    async def go():
+        transport = httpx.MockTransport(lambda request: httpx.Response(401, text = 'Unauthorized'))
+        async with httpx.AsyncClient(transport = transport) as client:
+            with pytest.raises(pflinkclient.PflinkRequestException):
+                await pflinkclient.Client.get_auth_token('http://pflink/auth-token', 'u', 'p', client = client)
+    asyncio.run(go())
+
+def post_with(handler) -> None:
+    async def go():
+        async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+            await pflinkclient.Client('http://pflink/workflow', 'token', client).post(b'{}')
+    asyncio.run(go())
+
+def test_server_error_means_unavailable():
+    with pytest.raises(pflinkclient.PflinkUnavailableException):
+        post_with(lambda request: httpx.Response(502, text = 'Bad Gateway'))
+
+def test_transport_error_means_unavailable():
+    def refuse(request):
+        raise httpx.ConnectError('refused', request = request)
+    with pytest.raises(pflinkclient.PflinkUnavailableException):
+        post_with(refuse)
+
+def test_rejected_token_is_not_unavailable():
+    with pytest.raises(pflinkclient.PflinkRequestInvalidTokenException) as e:
+        post_with(lambda request: httpx.Response(403))
+    assert not isinstance(e.value, pflinkclient.PflinkUnavailableException)
+
+def test_unreachable_auth_endpoint_is_not_unavailable():
+    def refuse(request):
+        raise httpx.ConnectError('refused', request = request)
+
+    async def go():
+        async with httpx.AsyncClient(transport = httpx.MockTransport(refuse)) as client:
+            await pflinkclient.Client.get_auth_token('http://pflink/token', 'u', 'p', client = client)
+    with pytest.raises(pflinkclient.PflinkRequestException) as e:
+        asyncio.run(go())
+    assert not isinstance(e.value, pflinkclient.PflinkUnavailableException)
+
+@pytest.fixture
+def paced(monkeypatch):
+    monkeypatch.setattr(pflinkclient, 'pacers', pflinkclient.PacerBoard())
+    monkeypatch.setattr(pflinkclient, 'circuits', pflinkclient.circuit.CircuitBoard())
+    pflinkclient.pacers.configure(enabled = True, rate = 1.0, maxRate = 1.0)
+
+def ok(request) -> httpx.Response:
+    return httpx.Response(200, json = {})
+
+def test_urls_are_paced_separately(paced):
+    async def go():
+        async with httpx.AsyncClient(transport = httpx.MockTransport(ok)) as client:
+            start:float = time.monotonic()
+            await pflinkclient.guarded_post(client, 'http://pflink-1/workflow')
+            await pflinkclient.guarded_post(client, 'http://pflink-2/workflow')
+            assert time.monotonic() - start < 0.5
+            assert set(pflinkclient.pacers.d_pacers) == {'http://pflink-1/workflow', 'http://pflink-2/workflow'}
+    asyncio.run(go())
+
+def test_open_circuit_refuses_without_pacing(paced):
+    async def go():
+        url:str = 'http://pflink-1/workflow'
+        breaker = pflinkclient.circuits.get(url)
+        for _ in range(breaker.config.failureThreshold):
+            breaker.failure()
+        async with httpx.AsyncClient(transport = httpx.MockTransport(ok)) as client:
+            with pytest.raises(pflinkclient.PflinkCircuitOpenException):
+                await pflinkclient.guarded_post(client, url)
+        assert url not in pflinkclient.pacers.d_pacers
+    asyncio.run(go())
+
+def test_deadline_passed_while_paced_is_not_sent(paced):
+    async def go():
+        url:str             = 'http://pflink-1/workflow'
+        l_sent:list[int]    = []
+
+        def count(request) -> httpx.Response:
+            l_sent.append(1)
+            return httpx.Response(200, json = {})
+
+        async with httpx.AsyncClient(transport = httpx.MockTransport(count)) as client:
+            await pflinkclient.guarded_post(client, url)
+            token = deadline.current.set(deadline.Deadline(time.monotonic() + 0.2))
+            try:
+                with pytest.raises(deadline.DeadlineExceeded):
+                    await pflinkclient.guarded_post(client, url)   # its turn is 1s away
+            finally:
+                deadline.current.reset(token)
+        assert l_sent == [1]
+        assert pflinkclient.circuits.get(url).state == 'closed'
+    asyncio.run(go())
@@ -0,0 +1,66 @@
+import  asyncio
+import  sqlite3
+
+import  pytest
+
+from    lib                 import ratelimit
+
+quota:ratelimit.Quota = ratelimit.Quota(rate = 10.0, burst = 2.0)
+
+def test_burst_then_refill():
+    limiter = ratelimit.RateLimiter()
+    assert limiter.take('a', quota) == 0
+    assert limiter.take('a', quota) == 0
+    assert 0 < limiter.take('a', quota) <= 0.1      # one token, at 10/s
+    assert limiter.limited == 1
+    limiter.d_buckets['a'].updated -= 0.2           # 0.2s later
+    assert limiter.take('a', quota) == 0
+    assert limiter.take('b', quota) == 0            # buckets are per key
+
+def test_take_all_charges_all_buckets_or_none():
+    limiter = ratelimit.RateLimiter()
+    tight   = ratelimit.Quota(rate = 1.0, burst = 1.0)
+    assert limiter.take_all([('a|x', quota, 1), ('a|y', tight, 1)]) == [0, 0]
+    l_waits = limiter.take_all([('a|x', quota, 1), ('a|y', tight, 1)])
+    assert l_waits[0] == 0 and l_waits[1] > 0
+    # The refused request did not spend the token it could have had
+    assert limiter.d_buckets['a|x'].tokens >= 1
+
+def test_least_recently_used_bucket_is_evicted():
+    limiter = ratelimit.RateLimiter(maxKeys = 2)
+    limiter.take('a', quota)
+    limiter.take('b', quota)
+    limiter.take('a', quota)
+    limiter.take('c', quota)
+    assert list(limiter.d_buckets) == ['a', 'c']
+
+def test_workers_share_buckets(tmp_path):
+    async def go():
+        path:str    = str(tmp_path / 'ratelimit.db')
+        one         = ratelimit.RateLimiter(path = path)
+        two         = ratelimit.RateLimiter(path = path)
+        slow        = ratelimit.Quota(rate = 0.001, burst = 4.0)
+        assert one.take('k', slow, 3) == 0
+        await one.sync()
+        assert two.take('k', slow) == 0             # a new bucket, full here
+        await two.sync()                            # learns the shared balance
+        assert two.take('k', slow) > 0
+    asyncio.run(go())
+
+def test_failed_sync_keeps_the_spent_tokens(tmp_path, monkeypatch):
+    limiter = ratelimit.RateLimiter(path = str(tmp_path / 'ratelimit.db'))
+    limiter.take('a', quota)
+
+    def locked(l_spent):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(limiter, 'sync_do', locked)
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(limiter.sync())
+    assert limiter.d_buckets['a'].used == 1
+    monkeypatch.undo()
+    limiter.take('a', quota)
+    asyncio.run(limiter.sync())
+    assert limiter.d_buckets['a'].used == 0
+    row = limiter.db.execute('SELECT tokens FROM buckets WHERE key = ?', ('a',)).fetchone()
+    assert row[0] < 0.1                     # both tokens were charged
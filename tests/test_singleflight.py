@@ -0,0 +1,104 @@
+import  asyncio
+import  time
+
+import  pytest
+
+from    lib                 import deadline, singleflight
+
+def test_concurrent_callers_share_one_execution():
+    async def go():
+        flight:singleflight.SingleFlight    = singleflight.SingleFlight()
+        l_runs:list[int]                    = []
+
+        async def work() -> str:
+            l_runs.append(1)
+            await asyncio.sleep(0.01)
+            return 'result'
+
+        l_results = await asyncio.gather(*[flight.do('key', work) for _ in range(10)])
+        assert l_results == ['result'] * 10
+        assert len(l_runs) == 1
+        assert flight.shared == 9
+        assert not flight.inflight
+        # Once done the key is forgotten
+        assert await flight.do('key', work) == 'result'
+        assert len(l_runs) == 2
+    asyncio.run(go())
+
+def test_different_keys_run_separately():
+    async def go():
+        flight:singleflight.SingleFlight    = singleflight.SingleFlight()
+
+        async def work(value:str) -> str:
+            await asyncio.sleep(0.01)
+            return value
+
+        assert await asyncio.gather(flight.do('a', lambda: work('a')), flight.do('b', lambda: work('b'))) == ['a', 'b']
+    asyncio.run(go())
+
+def test_errors_reach_every_caller():
+    async def go():
+        flight:singleflight.SingleFlight    = singleflight.SingleFlight()
+
+        async def work() -> str:
+            await asyncio.sleep(0.01)
+            raise ValueError('boom')
+
+        l_results = await asyncio.gather(*[flight.do('key', work) for _ in range(3)], return_exceptions = True)
+        assert all(isinstance(result, ValueError) for result in l_results)
+        assert not flight.inflight
+    asyncio.run(go())
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def go():
+        flight:singleflight.SingleFlight    = singleflight.SingleFlight()
+
+        async def work() -> str:
+            await asyncio.sleep(0.02)
+            return 'result'
+
+        first   = asyncio.create_task(flight.do('key', work))
+        second  = asyncio.create_task(flight.do('key', work))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == 'result'
+    asyncio.run(go())
+
+def test_work_cancelled_once_all_deadlines_pass():
+    async def go():
+        flight:singleflight.SingleFlight    = singleflight.SingleFlight()
+        l_cancelled:list[int]               = []
+
+        async def work() -> str:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                l_cancelled.append(1)
+                raise
+            return 'result'
+
+        with pytest.raises(deadline.DeadlineExceeded):
+            await flight.do('key', work, time.monotonic() + 0.01)
+        await asyncio.sleep(0)
+        assert l_cancelled == [1]
+    asyncio.run(go())
+
+def test_later_deadline_keeps_the_work_alive():
+    async def go():
+        flight:singleflight.SingleFlight    = singleflight.SingleFlight()
+        l_remaining:list[float | None]      = []
+
+        async def work() -> str:
+            await asyncio.sleep(0.05)
+            l_remaining.append(deadline.remaining())
+            return 'result'
+
+        now:float       = time.monotonic()
+        short           = asyncio.create_task(flight.do('key', work, now + 0.01))
+        long            = asyncio.create_task(flight.do('key', work, now + 1.0))
+        with pytest.raises(deadline.DeadlineExceeded):
+            await short
+        assert await long == 'result'
+        # The shared work ran with the latest of its callers' deadlines
+        assert l_remaining[0] is not None and l_remaining[0] > 0.5
+    asyncio.run(go())
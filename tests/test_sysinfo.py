@@ -0,0 +1,29 @@
+import  asyncio
+import  socket
+
+from    lib                 import sysinfo
+
+def test_router_does_not_resolve_the_address(monkeypatch):
+    def lookup(hostname:str) -> str:
+        raise AssertionError('DNS lookup at router construction')
+
+    monkeypatch.setattr(socket, 'gethostbyname', lookup)
+    from    base            import router
+    router.helloRouter_create(name = 'pfbridge', about = 'test', version = '0')
+
+def test_start_resolves_off_the_event_loop(monkeypatch):
+    l_lookups:list[str] = []
+
+    def lookup(hostname:str) -> str:
+        l_lookups.append(hostname)
+        return '10.0.0.1'
+
+    monkeypatch.setattr(socket, 'gethostbyname', lookup)
+    async def go():
+        sampler:sysinfo.Sampler = sysinfo.Sampler(interval = 60.0)
+        await sampler.start()
+        await sampler.stop()
+        return sampler.current()
+    d_current:dict = asyncio.run(go())
+    assert d_current['inet'] == '10.0.0.1' and len(l_lookups) == 1
+    assert 'cpu_percent_1m' in d_current
@@ -0,0 +1,77 @@
+import  asyncio
+
+from    lib                 import broadcast, tracker
+
+def tracker_make(l_results:list, interval:float = 0.01) -> tracker.Tracker:
+    async def poll(tracked:tracker.Tracked):
+        return l_results.pop(0) if l_results else None
+    return tracker.Tracker(poll = poll, interval = lambda tracked, changed: interval, retain = 0.05)
+
+def test_polls_until_done_and_publishes_changes():
+    async def go():
+        workflows = tracker_make([('b', 'b', False), ('b', 'b', False), ('c', 'c', True)])
+        workflows.start()
+        tracked = workflows.track('key', None, 'a', 'a', False)
+        subscription = tracked.topic.subscribe()
+        l_updates:list = []
+        while True:
+            update = await subscription.get(1.0)
+            if update is broadcast.closed:
+                break
+            l_updates.append(update)
+        assert l_updates == ['a', 'b', 'c']
+        assert workflows.get('key').done
+        await asyncio.sleep(0.1)
+        assert workflows.get('key') is None           # dropped after retain
+        await workflows.stop()
+    asyncio.run(go())
+
+def test_poll_without_news_keeps_the_response():
+    async def go():
+        workflows = tracker_make([None, None])
+        workflows.start()
+        tracked = workflows.track('key', None, 'a', 'a', False)
+        await asyncio.sleep(0.05)
+        assert tracked.polls >= 2
+        assert tracked.response == 'a'
+        await workflows.stop()
+    asyncio.run(go())
+
+def test_invalidate_marks_stale_until_repolled():
+    async def go():
+        workflows = tracker_make([('b', 'b', False)], interval = 60.0)
+        workflows.start()
+        tracked = workflows.track('key', None, 'a', 'a', False)
+        assert workflows.isFresh(tracked)
+        workflows.invalidate()
+        assert not workflows.isFresh(tracked)
+        await asyncio.sleep(0.01)                   # re-polled at once
+        assert workflows.isFresh(tracked)
+        assert tracked.response == 'b'
+        await workflows.stop()
+    asyncio.run(go())
+
+def test_track_refreshes_a_stale_entry():
+    async def go():
+        workflows = tracker_make([], interval = 60.0)
+        workflows.start()
+        tracked = workflows.track('key', None, 'a', 'a', False)
+        workflows.invalidate()
+        # A response obtained before the invalidation does not refresh it
+        workflows.track('key', None, 'old', 'old', False, generation = workflows.generation - 1)
+        assert tracked.response == 'a' and not workflows.isFresh(tracked)
+        assert workflows.track('key', None, 'b', 'b', False) is tracked
+        assert tracked.response == 'b' and workflows.isFresh(tracked)
+        await workflows.stop()
+    asyncio.run(go())
+
+def test_stop_with_polls_completing():
+    async def go():
+        workflows = tracker_make([('b', 'b', False)] * 1000, interval = 0.0)
+        workflows.start()
+        for i in range(50):
+            workflows.track(str(i), None, 'a', 'a', False)
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(workflows.stop(), 1.0)
+        assert len(workflows) == 0
+    asyncio.run(go())